@@ -1,11 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, session, Response, stream_with_context, after_this_request, make_response
 import data_manager
 import config
+import metrics
+import type_inference
+import import_scheduler
+import upload_sessions
 import pandas as pd
 import os
+import gzip
+import json
+import shutil
 import uuid
-import threading
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header
 from flask_session import Session
 from flask_cors import CORS
 
@@ -16,16 +23,44 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+STREAM_BLOCK_SIZE = 64 * 1024
+# Part of the ETag of rendered config pages, so a deploy with new templates is not answered with 304
+TEMPLATES_VERSION = str(int(max(
+    (os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(app.template_folder) for f in files),
+    default=0)))
 
 CORS(app, supports_credentials=True)
 
+def _not_modified(etag):
+    """304 response when the client already holds this config version (If-None-Match), else None."""
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def _with_etag(response, etag):
+    """Tags a config response so clients revalidate with If-None-Match instead of refetching."""
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/config')
 def config_page():
     # Default to stocks if not provided
     current_table = request.args.get('table', 'stocks')
+    # Pending flash messages are part of the page, so it is only tagged without them
+    etag = data_manager.config_etag(current_table)
+    etag = f"{etag}-{TEMPLATES_VERSION}" if etag and not session.get('_flashes') else None
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
     tables = data_manager.get_import_tables()
     configs = data_manager.get_column_configs(table_name=current_table)
-    return render_template('config.html', configs=configs, current_table=current_table, tables=tables)
+    response = make_response(render_template('config.html', configs=configs, current_table=current_table, tables=tables))
+    return _with_etag(response, etag)
 
 @app.route('/config/update', methods=['POST'])
 def update_config():
@@ -68,7 +103,12 @@ def delete_alias(alias_id):
 @app.route('/master-config')
 def master_config():
     tables = data_manager.get_import_tables()
-    return render_template('master_config.html', tables=tables)
+    indexes = {t['table_name']: data_manager.get_table_indexes(t['table_name']) for t in tables}
+    schema_jobs = data_manager.get_schema_jobs()
+    summaries = [dict(s, rebuild=data_manager.get_summary_rebuild(s['summary_name']))
+                 for s in data_manager.get_summary_tables()]
+    return render_template('master_config.html', tables=tables, indexes=indexes, schema_jobs=schema_jobs,
+                           summaries=summaries)
 
 @app.route('/config/add-table', methods=['POST'])
 def add_table():
@@ -85,6 +125,11 @@ def add_table():
     # But names are just a list. 
     # Better approach: The frontend should send col_unique[] as a list of "true"/"false" strings, managed by JS.
     col_uniques = request.form.getlist('col_unique[]')
+    col_indexes = request.form.getlist('col_index[]')
+    col_sql_types = request.form.getlist('col_sql_type[]')
+    # Filled by "Propose from sample file"; hand-added rows stay mandatory without aliases
+    col_mandatories = request.form.getlist('col_mandatory[]')
+    col_aliases = request.form.getlist('col_aliases[]')
     
     initial_columns = []
     for i, (name, dtype) in enumerate(zip(col_names, col_types)):
@@ -92,10 +137,20 @@ def add_table():
             is_unique = False
             if i < len(col_uniques):
                is_unique = (col_uniques[i] == 'true')
+            is_indexed = i < len(col_indexes) and col_indexes[i] == 'true'
+            sql_type = col_sql_types[i].strip() if i < len(col_sql_types) else ''
+            is_mandatory = i >= len(col_mandatories) or col_mandatories[i] != 'false'
+            aliases = [a for a in col_aliases[i].split(',') if a.strip()] if i < len(col_aliases) else []
             
-            initial_columns.append({'name': name.strip(), 'type': dtype, 'is_unique': is_unique})
+            initial_columns.append({'name': name.strip(), 'type': dtype, 'is_unique': is_unique, 'is_indexed': is_indexed,
+                                    'sql_type': sql_type or None, 'is_mandatory': is_mandatory, 'aliases': aliases})
+
+    # Composite indexes: one per line, columns separated by commas (e.g. "distid, date")
+    indexes = [line for line in request.form.get('indexes', '').splitlines() if line.strip()]
+    partition_column = request.form.get('partition_column', '').strip() or None
             
-    if data_manager.create_new_import_table(table_name, display_name, initial_columns, allowed_filename):
+    if data_manager.create_new_import_table(table_name, display_name, initial_columns, allowed_filename, indexes=indexes,
+                                            partition_column=partition_column):
         flash(f"Table '{display_name}' created successfully.", "success")
     else:
         flash("Failed to create table. Name might be duplicate.", "error")
@@ -119,14 +174,75 @@ def add_column():
     column_name = request.form.get('column_name')
     data_type = request.form.get('data_type')
     is_unique = request.form.get('is_unique') == 'on'
+    is_indexed = request.form.get('is_indexed') == 'on'
+    sql_type = request.form.get('sql_type', '').strip() or None
     
-    if data_manager.add_column_to_table(table_name, column_name, data_type, is_unique=is_unique):
-        flash(f"Column '{column_name}' added to {table_name}.", "success")
-    else:
-        flash("Failed to add column.", "error")
+    # Runs in the background: large tables may need a rebuild. Progress is listed under Schema Changes.
+    columns = [{'name': column_name, 'type': data_type, 'is_unique': is_unique, 'is_indexed': is_indexed,
+                'sql_type': sql_type}]
+    job_id = data_manager.start_add_columns_job(table_name, columns)
+    flash(f"Adding column '{column_name}' to {table_name} (job {job_id}).", "success")
         
     return redirect(url_for('master_config'))
 
+@app.route('/config/add-index', methods=['POST'])
+def add_index():
+    table_name = request.form.get('table_name')
+    columns = request.form.get('columns', '')
+    index_name = request.form.get('index_name', '').strip() or None
+
+    if data_manager.add_table_index(table_name, columns, index_name=index_name):
+        flash(f"Index on ({columns}) added to {table_name}.", "success")
+    else:
+        flash("Failed to add index.", "error")
+    return redirect(url_for('master_config'))
+
+@app.route('/config/drop-index', methods=['POST'])
+def drop_index():
+    table_name = request.form.get('table_name')
+    index_name = request.form.get('index_name')
+
+    if data_manager.drop_table_index(table_name, index_name):
+        flash(f"Index '{index_name}' dropped from {table_name}.", "success")
+    else:
+        flash("Failed to drop index.", "error")
+    return redirect(url_for('master_config'))
+
+@app.route('/config/add-summary', methods=['POST'])
+def add_summary():
+    source_table = request.form.get('source_table')
+    group_columns = request.form.get('group_columns', '')
+    sum_columns = request.form.get('sum_columns', '')
+    summary_name = request.form.get('summary_name', '').strip() or None
+
+    success, result = data_manager.add_summary_table(source_table, group_columns, sum_columns, summary_name)
+    if success:
+        data_manager.start_summary_rebuild(result)
+        flash(f"Summary table '{result}' created, filling it from {source_table} in the background.", "success")
+    else:
+        flash(f"Failed to create summary table: {result}", "error")
+    return redirect(url_for('master_config'))
+
+@app.route('/config/rebuild-summary', methods=['POST'])
+def rebuild_summary():
+    summary_name = request.form.get('summary_name')
+
+    if data_manager.start_summary_rebuild(summary_name):
+        flash(f"Rebuilding summary table '{summary_name}' in the background.", "success")
+    else:
+        flash(f"Summary table '{summary_name}' is already being rebuilt.", "error")
+    return redirect(url_for('master_config'))
+
+@app.route('/config/drop-summary', methods=['POST'])
+def drop_summary():
+    summary_name = request.form.get('summary_name')
+
+    if data_manager.delete_summary_table(summary_name):
+        flash(f"Summary table '{summary_name}' dropped.", "success")
+    else:
+        flash("Failed to drop summary table.", "error")
+    return redirect(url_for('master_config'))
+
 @app.route('/')
 def index():
     conn = data_manager.get_connection()
@@ -146,8 +262,36 @@ def index():
     import_tables = data_manager.get_import_tables()
     return render_template('index.html', data=data, tables=import_tables)
 
+def _admit_upload():
+    """
+    Admission control for an upload, checked before its body is read.
+    Returns None (admitted, released when the request ends) or (status, reason).
+    """
+    nbytes = request.content_length or 0
+    rejected = import_scheduler.admit(nbytes, app.config['UPLOAD_FOLDER'])
+    if rejected:
+        return rejected
+
+    @after_this_request
+    def _release(response):
+        import_scheduler.release(nbytes)
+        return response
+    return None
+
+def _backpressure_response(rejected):
+    """429/503 JSON response with a Retry-After hint for a refused upload."""
+    status_code, error = rejected
+    response = jsonify({"success": False, "error": error, "retry_after": config.IMPORT_RETRY_AFTER_SECONDS})
+    response.headers['Retry-After'] = str(config.IMPORT_RETRY_AFTER_SECONDS)
+    return response, status_code
+
 @app.route('/import', methods=['POST'])
 def import_file():
+    rejected = _admit_upload()
+    if rejected:
+        flash(f"⏳ {rejected[1]}")
+        return redirect(url_for('index'))
+
     files = request.files.getlist('files')
     if not files or all(f.filename == '' for f in files):
         flash('No files selected')
@@ -155,9 +299,11 @@ def import_file():
 
     table_name = request.form.get('table_name', 'auto')
     dist_id = request.form.get('dist_id', None) 
+    force = request.form.get('force') in ('1', 'true', 'on')
     all_file_paths = []
     temp_dirs = []
     warnings = []
+    file_hashes = {}
 
     try:
         # ========== Step 1: Simpan file & extract ZIP (sama seperti API) ==========
@@ -167,7 +313,7 @@ def import_file():
 
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            file_hash = data_manager.save_upload(file, filepath)
 
             _, ext = os.path.splitext(filename)
 
@@ -176,7 +322,7 @@ def import_file():
                 os.makedirs(temp_dir, exist_ok=True)
                 temp_dirs.append(temp_dir)
 
-                extracted = data_manager.extract_zip(filepath, temp_dir)
+                extracted = data_manager.extract_zip(filepath, temp_dir, file_hashes)
                 if extracted:
                     all_file_paths.extend(extracted)
                 else:
@@ -190,6 +336,7 @@ def import_file():
                     pass
             elif ext.lower() in ['.csv', '.txt']:
                 all_file_paths.append(filepath)
+                file_hashes[os.path.realpath(filepath)] = file_hash
             else:
                 msg = f"{filename}: Unsupported file type '{ext}'. Skipped."
                 warnings.append(msg)
@@ -211,10 +358,26 @@ def import_file():
         # Generate single batch_id for entire upload
         batch_id = str(uuid.uuid4())
         
+        # Identical re-uploads of already imported files are skipped unless forced
+        target_tables = {}
+        if not force:
+            fresh, duplicates = data_manager.skip_duplicate_uploads(batch_id, all_file_paths, file_hashes, table_name, dist_id)
+            all_file_paths = [fp for fp, _ in fresh]
+            target_tables = dict(fresh)
+            for d in duplicates:
+                flash(f"⏭️ {d['filename']}: duplicate of batch {d['duplicate_of']}, skipped.")
+            if not all_file_paths:
+                for td in temp_dirs:
+                    shutil.rmtree(td, ignore_errors=True)
+                flash('All files were already imported. Nothing to process.')
+                return redirect(url_for('index'))
+
         # Create a job row for EACH file
         for fp in all_file_paths:
             fname = os.path.basename(fp)
-            data_manager.create_import_job(batch_id, fname, table_name, dist_id)
+            data_manager.create_import_job(batch_id, fname, dist_id, file_size=os.path.getsize(fp),
+                                           file_hash=file_hashes.get(os.path.realpath(fp)),
+                                           table_name=target_tables.get(fp))
 
         for fp in all_file_paths:
             fname = os.path.basename(fp)
@@ -259,12 +422,8 @@ def import_file():
         # (Total rows are updated per-file during async or already set if we want)
         
         # ========== Step 4: Jalankan proses async ==========
-        thread = threading.Thread(
-            target=data_manager.process_import_async,
-            args=(valid_files, table_name, batch_id, temp_dirs),
-            daemon=True
-        )
-        thread.start()
+        import_scheduler.submit_batch(valid_files, table_name, batch_id, temp_dirs,
+                                      dist_id=dist_id, user_id=session.get("user_id"))
 
         flash(f"📦 Import job created with ID: {batch_id}.")
         flash(f"📊 Total rows to process: {total_rows} from {len(valid_files)} file(s).")
@@ -297,9 +456,11 @@ def export_file(format_type):
         filename = f"export.{format_type}"
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     
-    # Export currently hardcoded to stocks table in data_manager.export_data
-    # For now, leaving as is unless user asked for sales export (they didn't).
-    if data_manager.export_data(filepath, format_type):
+    # Defaults to config.TABLE_NAME; ?table=&from=&to= exports a date range of a partitioned table
+    table_name = request.args.get('table') or None
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    if data_manager.export_data(filepath, format_type, table_name=table_name, date_from=date_from, date_to=date_to):
         return send_file(filepath, as_attachment=True)
     else:
         flash('Failed to export data.')
@@ -308,67 +469,15 @@ def export_file(format_type):
 
 # ==================== REST API ENDPOINTS ====================
 
-@app.route('/api/import', methods=['POST'])
-def api_import_file():
-    """API: Upload files, quick validate, then process async. Returns batch_id."""
-    files = request.files.getlist('files')
-    
-    # Determine mode: 'quick', 'full', or both (if missing/invalid)
-    mode = request.form.get('mode')
-    if not mode:
-        j = request.get_json(silent=True) or {}
-        mode = j.get('mode')
-    if mode not in ['quick', 'full']:
-        mode = 'both'  # special marker for both
-
-    if not files or all(f.filename == '' for f in files):
-        return jsonify({"success": False, "error": "No files provided.", "mode": mode}), 200
-
-    user_id = session.get("user_id")
-
-    table_name = request.form.get('table_name', 'auto')
-    dist_id = request.form.get('dist_id', None)
-    all_file_paths = []
-    temp_dirs = []
-    warnings = []
+def _import_saved_files(all_file_paths, temp_dirs, file_hashes, warnings, mode, table_name, dist_id, user_id,
+                        profile=False, force=False, priority='normal', batch_id=None, atomic=False):
+    """
+    Validation and import of uploaded files already on disk (POST /api/import
+    and finalized chunked uploads). `file_hashes` maps real paths to SHA-256.
+    Returns the (response, status) of the import API.
+    """
     filenames = []
-
     try:
-        # Step 1: Save files and extract ZIPs
-        for file in files:
-            if file.filename == '':
-                continue
-
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            _, ext = os.path.splitext(filename)
-
-            if ext.lower() == '.zip':
-                temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'_zip_{os.path.splitext(filename)[0]}')
-                os.makedirs(temp_dir, exist_ok=True)
-                temp_dirs.append(temp_dir)
-
-                extracted = data_manager.extract_zip(filepath, temp_dir)
-                if extracted:
-                    all_file_paths.extend(extracted)
-                else:
-                    warnings.append(f"{filename}: Invalid ZIP or no data files found inside.")
-
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-            elif ext.lower() in ['.csv', '.txt']:
-                all_file_paths.append(filepath)
-            else:
-                warnings.append(f"{filename}: Unsupported file type '{ext}'. Skipped.")
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-
         if not all_file_paths:
             return jsonify({"success": False, "error": "No valid data files to process.", "warnings": warnings, "mode": mode}), 200
 
@@ -378,7 +487,28 @@ def api_import_file():
         total_rows = 0
 
         # Generate single batch_id for entire upload
-        batch_id = str(uuid.uuid4())
+        batch_id = batch_id or str(uuid.uuid4())
+
+        # Identical re-uploads of already imported files are skipped unless forced
+        duplicates = []
+        target_tables = {}
+        if mode in ('full', 'both') and not force:
+            fresh, duplicates = data_manager.skip_duplicate_uploads(batch_id, all_file_paths, file_hashes, table_name,
+                                                                    dist_id, user_id)
+            all_file_paths = [fp for fp, _ in fresh]
+            target_tables = dict(fresh)
+            if not all_file_paths:
+                for td in temp_dirs:
+                    shutil.rmtree(td, ignore_errors=True)
+                return jsonify({
+                    "success": True,
+                    "mode": mode,
+                    "batch_id": batch_id,
+                    "message": "All files were already imported. Nothing to process (send force=1 to reprocess).",
+                    "files": [],
+                    "duplicates": duplicates,
+                    "warnings": warnings
+                }), 200
 
         # ========== MODE HANDLING ==========
         if mode == 'quick':
@@ -439,16 +569,51 @@ def api_import_file():
                 "files": validation_results,
                 "warnings": warnings
             }), 200
+        elif mode == 'dryrun':
+            # Validate every row of every file, nothing is written to the target tables
+            for fp in all_file_paths:
+                result = data_manager.dry_run_validate_file(fp, table_name, batch_id, dist_id)
+                if result.pop('report', None):
+                    result['report_url'] = url_for('api_get_dryrun_report', batch_id=batch_id,
+                                                   filename=result['filename'])
+                validation_results.append(result)
+
+            for fp in all_file_paths:
+                try:
+                    os.remove(fp)
+                except:
+                    pass
+            for td in temp_dirs:
+                try:
+                    import shutil
+                    shutil.rmtree(td, ignore_errors=True)
+                except:
+                    pass
+            return jsonify({
+                "success": all(v['valid'] for v in validation_results),
+                "mode": "dryrun",
+                "batch_id": batch_id,
+                "message": "Dry run validation completed. No data was written.",
+                "total_rows": sum(v.get('rows', 0) for v in validation_results),
+                "error_rows": sum(v.get('error_rows', 0) for v in validation_results),
+                "files": validation_results,
+                "warnings": warnings
+            }), 200
         elif mode == 'full':
             # Create a job row for EACH file
             for fp in all_file_paths:
                 file_size = os.path.getsize(fp)
                 fname = os.path.basename(fp)
-                data_manager.create_import_job(batch_id, fname, dist_id, file_size=file_size, user_id=user_id)
+                data_manager.create_import_job(batch_id, fname, dist_id, file_size=file_size, user_id=user_id,
+                                               file_hash=file_hashes.get(os.path.realpath(fp)),
+                                               table_name=target_tables.get(fp))
 
+            validation_timers = {}
             for fp in all_file_paths:
                 fname = os.path.basename(fp)
-                is_valid, error_msg, row_count = data_manager.quick_validate_file(fp, table_name, dist_id)
+                validation_timers[fname] = metrics.StageTimer()
+                is_valid, error_msg, row_count = data_manager.quick_validate_file(fp, table_name, dist_id,
+                                                                                  timer=validation_timers[fname])
                 if is_valid:
                     valid_files.append(fp)
                     total_rows += row_count
@@ -459,6 +624,13 @@ def api_import_file():
                     data_manager.update_job_status(batch_id, filename=fname, status='2',
                         error_count=1, error_details=[f"Quick validation failed: {error_msg}"])
 
+            # Atomic batch: one invalid file rejects the whole batch before anything is imported
+            if atomic and valid_files and len(valid_files) < len(all_file_paths):
+                for fp in valid_files:
+                    data_manager.update_job_status(batch_id, filename=os.path.basename(fp), status='2',
+                        message="Batch atomik dibatalkan: file lain dalam batch gagal validasi.")
+                valid_files = []
+
             # Check if all files failed validation
             if not valid_files:
                 # Cleanup only
@@ -481,12 +653,9 @@ def api_import_file():
                     "warnings": warnings,
                     "mode": mode
                 }), 200
-            thread = threading.Thread(
-                target=data_manager.process_import_async,
-                args=(valid_files, table_name, batch_id, temp_dirs),
-                daemon=True
-            )
-            thread.start()
+            import_scheduler.submit_batch(valid_files, table_name, batch_id, temp_dirs,
+                                          validation_timers=validation_timers, profile=profile,
+                                          dist_id=dist_id, user_id=user_id, priority=priority, atomic=atomic)
             filenames = [os.path.basename(fp) for fp in valid_files]
 
             data_manager._check_missing_table_files(all_file_paths, batch_id, dist_id)
@@ -499,6 +668,7 @@ def api_import_file():
                     "total_rows": total_rows,
                     "files": filenames,
                     "validation": validation_results,
+                    "duplicates": duplicates,
                     "warnings": warnings,
                     "message": "Import job started. Use GET /api/jobs/<batch_id> to check progress."
                 }
@@ -508,12 +678,17 @@ def api_import_file():
             for fp in all_file_paths:
                 file_size = os.path.getsize(fp)
                 fname = os.path.basename(fp)
-                data_manager.create_import_job(batch_id, fname, dist_id, file_size=file_size, user_id=user_id)
+                data_manager.create_import_job(batch_id, fname, dist_id, file_size=file_size, user_id=user_id,
+                                               file_hash=file_hashes.get(os.path.realpath(fp)),
+                                               table_name=target_tables.get(fp))
 
             # Quick validate each file
+            validation_timers = {}
             for fp in all_file_paths:
                 fname = os.path.basename(fp)
-                is_valid, error_msg, row_count = data_manager.quick_validate_file(fp, table_name, dist_id)
+                validation_timers[fname] = metrics.StageTimer()
+                is_valid, error_msg, row_count = data_manager.quick_validate_file(fp, table_name, dist_id,
+                                                                                  timer=validation_timers[fname])
                 if is_valid:
                     valid_files.append(fp)
                     total_rows += row_count
@@ -524,6 +699,13 @@ def api_import_file():
                     # data_manager.update_job_status(batch_id, filename=fname, status='6',
                     #     error_count=1, error_details=[f"Quick validation failed: {error_msg}"])
 
+            # Atomic batch: one invalid file rejects the whole batch before anything is imported
+            if atomic and valid_files and len(valid_files) < len(all_file_paths):
+                for fp in valid_files:
+                    data_manager.update_job_status(batch_id, filename=os.path.basename(fp), status='2',
+                        message="Batch atomik dibatalkan: file lain dalam batch gagal validasi.")
+                valid_files = []
+
             # Check if all files failed validation
             if not valid_files:
                 # Cleanup only
@@ -550,12 +732,9 @@ def api_import_file():
 
             # Start async import thread
             data_manager.update_job_status(batch_id, total_rows=total_rows)
-            thread = threading.Thread(
-                target=data_manager.process_import_async,
-                args=(valid_files, table_name, batch_id, temp_dirs),
-                daemon=True
-            )
-            thread.start()
+            import_scheduler.submit_batch(valid_files, table_name, batch_id, temp_dirs,
+                                          validation_timers=validation_timers, profile=profile,
+                                          dist_id=dist_id, user_id=user_id, priority=priority, atomic=atomic)
             filenames = [os.path.basename(fp) for fp in valid_files]
 
             data_manager._check_missing_table_files(all_file_paths, batch_id, dist_id)
@@ -565,6 +744,7 @@ def api_import_file():
                 "batch_id": batch_id,
                 "message": "Quick validation completed. Import job started.",
                 "files": validation_results,
+                "duplicates": duplicates,
                 "warnings": warnings,
                 "data": {
                     "status": "pending",
@@ -588,6 +768,224 @@ def api_import_file():
                 pass
         return jsonify({"success": False, "error": f"Server error: {str(e)}", "mode": mode}), 500
 
+@app.route('/api/import', methods=['POST'])
+def api_import_file():
+    """API: Upload files, quick validate, then process async. Returns batch_id."""
+    # Before request.files/form: reading either pulls the whole upload onto disk
+    rejected = _admit_upload()
+    if rejected:
+        return _backpressure_response(rejected)
+
+    files = request.files.getlist('files')
+    
+    # Determine mode: 'quick', 'full', 'dryrun', or both (if missing/invalid)
+    mode = request.form.get('mode')
+    if not mode:
+        j = request.get_json(silent=True) or {}
+        mode = j.get('mode')
+    if mode not in ['quick', 'full', 'dryrun']:
+        mode = 'both'  # special marker for both
+
+    if not files or all(f.filename == '' for f in files):
+        return jsonify({"success": False, "error": "No files provided.", "mode": mode}), 200
+
+    user_id = session.get("user_id")
+
+    table_name = request.form.get('table_name', 'auto')
+    dist_id = request.form.get('dist_id', None)
+    profile = request.form.get('profile') in ('1', 'true', 'on')
+    force = request.form.get('force') in ('1', 'true', 'on')
+    atomic = request.form.get('atomic') in ('1', 'true', 'on')
+    priority = import_scheduler.normalize_priority(request.form.get('priority'))
+    if priority is None:
+        return jsonify({"success": False, "mode": mode,
+                        "error": f"priority must be one of: {', '.join(import_scheduler.PRIORITIES)}."}), 400
+    all_file_paths = []
+    temp_dirs = []
+    warnings = []
+    file_hashes = {}
+
+    try:
+        # Step 1: Save files and extract ZIPs
+        for file in files:
+            if file.filename == '':
+                continue
+
+            filename = secure_filename(file.filename)
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            file_hash = data_manager.save_upload(file, filepath)
+
+            _, ext = os.path.splitext(filename)
+
+            if ext.lower() == '.zip':
+                temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'_zip_{os.path.splitext(filename)[0]}')
+                os.makedirs(temp_dir, exist_ok=True)
+                temp_dirs.append(temp_dir)
+
+                extracted = data_manager.extract_zip(filepath, temp_dir, file_hashes)
+                if extracted:
+                    all_file_paths.extend(extracted)
+                else:
+                    warnings.append(f"{filename}: Invalid ZIP or no data files found inside.")
+
+                try:
+                    os.remove(filepath)
+                except:
+                    pass
+            elif ext.lower() in ['.csv', '.txt']:
+                all_file_paths.append(filepath)
+                file_hashes[os.path.realpath(filepath)] = file_hash
+            else:
+                warnings.append(f"{filename}: Unsupported file type '{ext}'. Skipped.")
+                try:
+                    os.remove(filepath)
+                except:
+                    pass
+
+        return _import_saved_files(all_file_paths, temp_dirs, file_hashes, warnings, mode, table_name, dist_id,
+                                   user_id, profile=profile, force=force, priority=priority, atomic=atomic)
+
+    except Exception as e:
+        for fp in all_file_paths:
+            try:
+                os.remove(fp)
+            except:
+                pass
+        for td in temp_dirs:
+            try:
+                import shutil
+                shutil.rmtree(td, ignore_errors=True)
+            except:
+                pass
+        return jsonify({"success": False, "error": f"Server error: {str(e)}", "mode": mode}), 500
+
+
+@app.route('/api/import/queue', methods=['GET'])
+def api_get_import_queue():
+    """API: Files waiting per distributor/priority and files importing right now."""
+    return jsonify({"success": True, "data": import_scheduler.queue_stats()})
+
+
+@app.route('/api/uploads', methods=['POST'])
+def api_create_upload():
+    """API: Start a chunked upload (filename, size, optional sha256 checksum and the /api/import fields)."""
+    data = request.get_json(silent=True) or request.form
+    mode = data.get('mode')
+    if mode not in ['quick', 'full', 'dryrun']:
+        mode = 'both'
+    priority = import_scheduler.normalize_priority(data.get('priority'))
+    if priority is None:
+        return jsonify({"success": False,
+                        "error": f"priority must be one of: {', '.join(import_scheduler.PRIORITIES)}."}), 400
+
+    # Capacity check for the whole file; bytes are only reserved per chunk as they arrive
+    nbytes = int(data.get('size')) if str(data.get('size')).isdigit() else 0
+    rejected = import_scheduler.admit(nbytes, app.config['UPLOAD_FOLDER'])
+    if rejected:
+        return _backpressure_response(rejected)
+    import_scheduler.release(nbytes)
+
+    options = {
+        "mode": mode,
+        "table_name": data.get('table_name') or 'auto',
+        "dist_id": data.get('dist_id') or None,
+        "priority": priority,
+        "profile": str(data.get('profile')).lower() in ('1', 'true', 'on'),
+        "force": str(data.get('force')).lower() in ('1', 'true', 'on'),
+        "atomic": str(data.get('atomic')).lower() in ('1', 'true', 'on'),
+    }
+    success, result = upload_sessions.create_upload(app.config['UPLOAD_FOLDER'], data.get('filename'),
+                                                    data.get('size'), checksum=data.get('checksum'),
+                                                    options=options, user_id=session.get("user_id"))
+    if not success:
+        return jsonify({"success": False, "error": result}), 400
+    return jsonify({"success": True, "data": result}), 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def api_get_upload(upload_id):
+    """API: Progress of a chunked upload, including the byte ranges still missing (to resume)."""
+    upload = upload_sessions.get_upload(app.config['UPLOAD_FOLDER'], upload_id)
+    if not upload:
+        return jsonify({"success": False, "error": "Upload not found."}), 404
+    return jsonify({"success": True, "data": upload})
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def api_put_upload_chunk(upload_id):
+    """API: Write one chunk; the body is raw bytes, placed by 'Content-Range: bytes <start>-<end>/<size>'."""
+    content_range = request.headers.get('Content-Range')
+    parsed = parse_content_range_header(content_range) if content_range else None
+    if not parsed or parsed.units != 'bytes' or parsed.start is None:
+        return jsonify({"success": False, "error": "Content-Range: bytes <start>-<end>/<size> header required."}), 400
+
+    rejected = _admit_upload()
+    if rejected:
+        return _backpressure_response(rejected)
+
+    success, result = upload_sessions.write_chunk(app.config['UPLOAD_FOLDER'], upload_id, parsed.start, parsed.stop,
+                                                  parsed.length, request.stream)
+    if success is None:
+        return jsonify({"success": False, "error": result}), 404
+    if not success:
+        return jsonify({"success": False, "error": result,
+                        "data": upload_sessions.get_upload(app.config['UPLOAD_FOLDER'], upload_id)}), 400
+    return jsonify({"success": True, "data": result})
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def api_finalize_upload(upload_id):
+    """API: Verify a complete chunked upload (SHA-256) and hand it to the import pipeline like POST /api/import."""
+    data = request.get_json(silent=True) or request.form
+    success, result = upload_sessions.finalize_upload(app.config['UPLOAD_FOLDER'], upload_id,
+                                                      checksum=data.get('checksum'))
+    if success is None:
+        return jsonify({"success": False, "error": result}), 404
+    if not success:
+        return jsonify({"success": False, "error": result,
+                        "data": upload_sessions.get_upload(app.config['UPLOAD_FOLDER'], upload_id)}), 409
+
+    filepath, workspace, manifest = result['path'], result['workspace'], result['manifest']
+    options = manifest['options']
+    warnings = []
+    file_hashes = {}
+    if filepath.lower().endswith('.zip'):
+        all_file_paths = data_manager.extract_zip(filepath, os.path.join(workspace, 'extracted'), file_hashes)
+        if not all_file_paths:
+            warnings.append(f"{manifest['filename']}: Invalid ZIP or no data files found inside.")
+        try:
+            os.remove(filepath)
+        except:
+            pass
+    else:
+        all_file_paths = [filepath]
+        file_hashes[os.path.realpath(filepath)] = result['file_hash']
+
+    if not all_file_paths:
+        shutil.rmtree(workspace, ignore_errors=True)
+        return jsonify({"success": False, "error": "No valid data files to process.", "warnings": warnings,
+                        "mode": options.get('mode')}), 200
+    return _import_saved_files(all_file_paths, [workspace], file_hashes, warnings, options.get('mode', 'both'),
+                               options.get('table_name', 'auto'), options.get('dist_id'),
+                               manifest.get('user_id') or session.get("user_id"),
+                               profile=options.get('profile', False), force=options.get('force', False),
+                               priority=options.get('priority', 'normal'), batch_id=upload_id,
+                               atomic=options.get('atomic', False))
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def api_abort_upload(upload_id):
+    """API: Abort an unfinished chunked upload and delete what was received."""
+    if not upload_sessions.abort_upload(app.config['UPLOAD_FOLDER'], upload_id):
+        return jsonify({"success": False, "error": "Upload not found."}), 404
+    return jsonify({"success": True, "message": "Upload aborted."})
+
+
+@app.route('/api/import/limits', methods=['GET'])
+def api_get_import_limits():
+    """API: Admission limits for uploads and the current load against them."""
+    return jsonify({"success": True, "data": import_scheduler.admission_stats(app.config['UPLOAD_FOLDER'])})
+
 
 @app.route('/api/jobs', methods=['GET'])
 def api_get_jobs():
@@ -614,11 +1012,64 @@ def api_get_job_details(batch_id):
     return jsonify({"success": True, "data": details}), 200
 
 
+@app.route('/api/jobs/<batch_id>/files/<filename>/dryrun-report', methods=['GET'])
+def api_get_dryrun_report(batch_id, filename):
+    """API: Download the error report (CSV) of a dry run validation."""
+    report_path = data_manager.get_report_path(batch_id, filename, 'dryrun.csv')
+    if not os.path.exists(report_path):
+        return jsonify({"success": False, "error": "Report not found."}), 404
+    return send_file(os.path.abspath(report_path), as_attachment=True, mimetype='text/csv')
+
+
+@app.route('/api/jobs/<batch_id>/files/<filename>/rejected', methods=['GET'])
+def api_get_rejected_rows(batch_id, filename):
+    """API: Stream the rejected rows of an imported file (gzip CSV, or plain CSV with ?decompress=1)."""
+    path = data_manager.get_report_path(batch_id, filename, 'rejected.csv.gz')
+    if not os.path.exists(path):
+        return jsonify({"success": False, "error": "No rejected rows for this file."}), 404
+
+    decompress = request.args.get('decompress') in ('1', 'true')
+
+    def generate():
+        opener = gzip.open if decompress else open
+        with opener(path, 'rb') as f:
+            while True:
+                block = f.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    download_name = os.path.basename(path)
+    if decompress:
+        download_name = download_name[:-len('.gz')]
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if decompress else 'application/gzip',
+        headers={"Content-Disposition": f"attachment; filename={download_name}"}
+    )
+
+
+@app.route('/api/jobs/<batch_id>/profile', methods=['GET'])
+def api_get_job_profile(batch_id):
+    """API: Download the cProfile artifact of a profiled batch (?format=text for a cumulative-time summary)."""
+    profile_path = data_manager.get_profile_path(batch_id)
+    if not os.path.exists(profile_path):
+        return jsonify({"success": False, "error": "No profile for this batch."}), 404
+    if request.args.get('format') == 'text':
+        return Response(data_manager.get_profile_summary(batch_id), mimetype='text/plain')
+    return send_file(os.path.abspath(profile_path), as_attachment=True,
+                     download_name=f"{batch_id}.prof", mimetype='application/octet-stream')
+
+
 @app.route('/api/tables', methods=['GET'])
 def api_get_tables():
-    """API: List all import tables."""
+    """API: List all import tables (ETag / If-None-Match aware)."""
+    etag = data_manager.config_etag()
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
     tables = data_manager.get_import_tables()
-    return jsonify({"success": True, "data": tables}), 200
+    return _with_etag(jsonify({"success": True, "data": tables}), etag), 200
 
 
 @app.route('/api/tables', methods=['POST'])
@@ -632,42 +1083,349 @@ def api_create_table():
     display_name = data.get('display_name')
     allowed_filename = data.get('allowed_filename', '')
     allowed_filename = data.get('allowed_filename', '')
-    columns = data.get('columns', [])  # [{"name": "col", "type": "str", "is_unique": false}]
+    # [{"name": "col", "type": "str", "is_unique": false, "is_indexed": false, "sql_type": "VARCHAR(32)",
+    #   "is_mandatory": true, "aliases": ["kode barang"]}]
+    columns = data.get('columns', [])
+    indexes = data.get('indexes', [])  # [["distid", "date"], ...]
+    partition_column = data.get('partition_column')  # date/datetime column or "ImportDate"
 
     if not table_name or not display_name:
         return jsonify({"success": False, "error": "table_name and display_name are required."}), 400
 
-    if data_manager.create_new_import_table(table_name, display_name, columns, allowed_filename):
+    if data_manager.create_new_import_table(table_name, display_name, columns, allowed_filename, indexes=indexes,
+                                            partition_column=partition_column):
         return jsonify({"success": True, "data": {"message": f"Table '{display_name}' created."}}), 201
     else:
         return jsonify({"success": False, "error": "Failed to create table. Name might be duplicate."}), 400
 
 
+@app.route('/api/tables/infer-types', methods=['POST'])
+def api_infer_types():
+    """
+    API: Propose column types from a sample CSV/TXT file (multipart field
+    'file'). Nothing is created; the columns can be reviewed and sent to
+    POST /api/tables.
+    """
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({"success": False, "error": "No file provided."}), 400
+
+    filename = secure_filename(file.filename)
+    if os.path.splitext(filename)[1].lower() not in ('.csv', '.txt'):
+        return jsonify({"success": False, "error": "Only CSV/TXT files can be sampled."}), 400
+
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"_infer_{uuid.uuid4().hex}_{filename}")
+    file.save(filepath)
+    try:
+        sample = type_inference.read_sample(filepath, request.form.get('rows', type=int))
+        columns = type_inference.infer_column_types(sample)
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to read sample: {e}"}), 400
+    finally:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+    return jsonify({"success": True, "data": {"rows_sampled": len(sample), "columns": columns}}), 200
+
+
+@app.route('/api/tables/from-sample', methods=['POST'])
+def api_table_from_sample():
+    """
+    API: Profile a sample file (multipart field 'file': CSV/TXT, or a ZIP with
+    one file per table) in one streaming pass and return ready-to-submit
+    POST /api/tables bodies: types, nullability, a unique key candidate and
+    aliases reused from existing tables. Optional 'rows' caps the rows read.
+    """
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({"success": False, "error": "No file provided."}), 400
+
+    filename = secure_filename(file.filename)
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ('.csv', '.txt', '.zip'):
+        return jsonify({"success": False, "error": "Only CSV/TXT/ZIP files can be profiled."}), 400
+
+    work_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"_sample_{uuid.uuid4().hex}")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        filepath = os.path.join(work_dir, filename)
+        file.save(filepath)
+        if ext == '.zip':
+            sample_files = data_manager.extract_zip(filepath, os.path.join(work_dir, 'extracted'))
+            if not sample_files:
+                return jsonify({"success": False, "error": "Invalid ZIP or no data files found inside."}), 400
+        else:
+            sample_files = [filepath]
+
+        known_columns = data_manager.get_known_columns()
+        rows = request.form.get('rows', type=int)
+        tables = []
+        for sample_file in sorted(sample_files):
+            try:
+                tables.append(type_inference.propose_table(sample_file, rows=rows, known_columns=known_columns))
+            except Exception as e:
+                return jsonify({"success": False, "error": f"{os.path.basename(sample_file)}: failed to read sample: {e}"}), 400
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return jsonify({"success": True, "data": {"tables": tables}}), 200
+
+
 @app.route('/api/tables/<table_name>/columns', methods=['GET'])
 def api_get_columns(table_name):
-    """API: Get column configs + aliases for a table."""
+    """API: Get column configs + aliases for a table (ETag / If-None-Match aware)."""
+    etag = data_manager.config_etag(table_name)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
     configs = data_manager.get_column_configs(table_name=table_name)
-    return jsonify({"success": True, "data": configs}), 200
+    return _with_etag(jsonify({"success": True, "data": configs}), etag), 200
+
+
+ROWS_QUERY_PARAMS = ('after', 'limit', 'columns', 'order', 'format')
+
+
+@app.route('/api/tables/<table_name>/rows', methods=['GET'])
+def api_get_rows(table_name):
+    """
+    API: Browse the rows of an import table with keyset pagination on id.
+    Query: after (last id of the previous page), limit, columns (comma-separated),
+    order=asc|desc, format=json|ndjson, and filters as <column>[__op]=<value>
+    (op: eq, ne, gt, gte, lt, lte, in, prefix, isnull). Rows are streamed
+    straight from the cursor; JSON ends with next_after for the following page.
+    """
+    args = request.args
+    limit = args.get('limit', config.ROWS_PAGE_DEFAULT, type=int)
+    after = args.get('after', type=int)
+    order = args.get('order', 'asc')
+    output = args.get('format', 'json')
+    if not 1 <= limit <= config.ROWS_PAGE_MAX:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {config.ROWS_PAGE_MAX}."}), 400
+    if 'after' in args and after is None:
+        return jsonify({"success": False, "error": "after must be an integer id."}), 400
+    if order not in ('asc', 'desc') or output not in ('json', 'ndjson'):
+        return jsonify({"success": False, "error": "order must be asc|desc and format json|ndjson."}), 400
+
+    columns = [c.strip() for c in args.get('columns', '').split(',') if c.strip()]
+    filters = {key: args.get(key) for key in args if key not in ROWS_QUERY_PARAMS}
+    if table_name not in {t['table_name'] for t in data_manager.get_import_tables()}:
+        return jsonify({"success": False, "error": f"Table '{table_name}' not found."}), 404
+    ok, query = data_manager.prepare_rows_query(table_name, columns=columns, filters=filters, after=after,
+                                                limit=limit, descending=order == 'desc')
+    if not ok:
+        return jsonify({"success": False, "error": query}), 400
+
+    # Open the cursor before the headers go out so a dead database is still a clean 503
+    rows = data_manager.iter_rows(query)
+    try:
+        first = next(rows, None)
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to read rows: {e}"}), 503
+
+    names = query['columns']
+
+    def dumps(value):
+        return json.dumps(value, default=data_manager.json_value, ensure_ascii=False)
+
+    def all_rows():
+        if first is not None:
+            yield first
+            yield from rows
+
+    def generate_ndjson():
+        for row in all_rows():
+            yield dumps(dict(zip(names, row))) + '\n'
+
+    def generate_json():
+        yield '{"success": true, "data": {"columns": ' + dumps(names) + ', "rows": ['
+        count, last_id = 0, None
+        for row in all_rows():
+            yield (',' if count else '') + dumps(list(row))
+            count += 1
+            last_id = row[0]
+        next_after = last_id if count == limit else None
+        yield '], "count": ' + str(count) + ', "next_after": ' + dumps(next_after) + '}}'
+
+    if output == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
 
 
 @app.route('/api/tables/<table_name>/columns', methods=['POST'])
 def api_add_column(table_name):
-    """API: Add a column to an existing table. Expects JSON body."""
+    """
+    API: Add one or more columns to an existing table as one ALTER TABLE,
+    run as a background job. Expects JSON body with either a single column
+    (column_name, data_type, is_unique, is_indexed, sql_type) or
+    "columns": [{"name", "type", "is_unique", "is_indexed", "sql_type"}, ...].
+    Returns 202 with a job_id to poll on /api/schema-jobs/<job_id>.
+    """
     data = request.get_json()
     if not data:
         return jsonify({"success": False, "error": "JSON body required."}), 400
 
-    column_name = data.get('column_name')
-    data_type = data.get('data_type', 'str')
-    is_unique = data.get('is_unique', False)
+    columns = data.get('columns')
+    if columns is None:
+        columns = [{
+            'name': data.get('column_name'),
+            'type': data.get('data_type', 'str'),
+            'is_unique': data.get('is_unique', False),
+            'is_indexed': data.get('is_indexed', False),
+            'sql_type': data.get('sql_type'),
+        }]
+
+    if not isinstance(columns, list) or not columns:
+        return jsonify({"success": False, "error": "columns must be a non-empty list."}), 400
+    for col in columns:
+        if not isinstance(col, dict) or not isinstance(col.get('name'), str) or not col['name'].strip():
+            return jsonify({"success": False, "error": "Every column needs a name (column_name)."}), 400
+        if not isinstance(col.get('type', 'str'), str) or not isinstance(col.get('sql_type') or '', str):
+            return jsonify({"success": False, "error": f"{col['name']}: type and sql_type must be strings."}), 400
+
+    job_id = data_manager.start_add_columns_job(table_name, columns)
+    return jsonify({"success": True, "data": {
+        "message": f"Adding {len(columns)} column(s) to {table_name}.",
+        "job_id": job_id,
+        "status_url": url_for('api_get_schema_job', job_id=job_id),
+    }}), 202
+
+
+@app.route('/api/tables/<table_name>/partitions', methods=['GET'])
+def api_get_partitions(table_name):
+    """API: Monthly partitions of a partitioned table with approximate row counts."""
+    return jsonify({"success": True, "data": data_manager.get_partitions(table_name)}), 200
+
+
+@app.route('/api/tables/<table_name>/partitions', methods=['POST'])
+def api_maintain_partitions(table_name):
+    """API: Pre-create future monthly partitions (same as maintain_partitions.py --table)."""
+    created = data_manager.maintain_partitions(table_name=table_name)
+    if table_name not in created:
+        return jsonify({"success": False, "error": f"{table_name} is not a partitioned table."}), 400
+    return jsonify({"success": True, "data": {"created": created[table_name]}}), 200
+
+
+@app.route('/api/schema-jobs', methods=['GET'])
+def api_get_schema_jobs():
+    """API: Recent schema change jobs."""
+    return jsonify({"success": True, "data": data_manager.get_schema_jobs()}), 200
+
+
+@app.route('/api/schema-jobs/<job_id>', methods=['GET'])
+def api_get_schema_job(job_id):
+    """API: Status, ALTER algorithm used and progress of a schema change job."""
+    job = data_manager.get_schema_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found."}), 404
+    return jsonify({"success": True, "data": job}), 200
+
+
+@app.route('/api/tables/<table_name>/indexes', methods=['GET'])
+def api_get_indexes(table_name):
+    """API: List indexes of a table with cardinality and usage statistics."""
+    indexes = data_manager.get_table_indexes(table_name)
+    return jsonify({"success": True, "data": indexes}), 200
+
+
+@app.route('/api/tables/<table_name>/indexes', methods=['POST'])
+def api_add_index(table_name):
+    """API: Create a secondary/composite index online. Expects JSON body."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "JSON body required."}), 400
+
+    columns = data.get('columns')  # ["distid", "date"]
+    index_name = data.get('index_name')
+    if not columns:
+        return jsonify({"success": False, "error": "columns is required."}), 400
+
+    if data_manager.add_table_index(table_name, columns, index_name=index_name):
+        return jsonify({"success": True, "data": {"message": f"Index added to {table_name}."}}), 201
+    else:
+        return jsonify({"success": False, "error": "Failed to add index."}), 400
+
+
+@app.route('/api/tables/<table_name>/indexes/<index_name>', methods=['DELETE'])
+def api_drop_index(table_name, index_name):
+    """API: Drop a secondary index online."""
+    if data_manager.drop_table_index(table_name, index_name):
+        return jsonify({"success": True, "data": {"message": f"Index '{index_name}' dropped."}}), 200
+    else:
+        return jsonify({"success": False, "error": "Failed to drop index."}), 400
 
-    if not column_name:
-        return jsonify({"success": False, "error": "column_name is required."}), 400
 
-    if data_manager.add_column_to_table(table_name, column_name, data_type, is_unique=is_unique):
-        return jsonify({"success": True, "data": {"message": f"Column '{column_name}' added to {table_name}."}}), 201
+def _find_summary(summary_name):
+    return next((s for s in data_manager.get_summary_tables() if s['summary_name'] == summary_name), None)
+
+
+@app.route('/api/summaries', methods=['GET'])
+def api_get_summaries():
+    """API: List summary tables (optionally ?table=<source table>) with the state of their last rebuild."""
+    summaries = data_manager.get_summary_tables(source_table=request.args.get('table'))
+    data = [dict(s, rebuild=data_manager.get_summary_rebuild(s['summary_name'])) for s in summaries]
+    return jsonify({"success": True, "data": data}), 200
+
+
+@app.route('/api/summaries', methods=['POST'])
+def api_create_summary():
+    """
+    API: Declare a summary table over an import table and fill it in the
+    background. Expects JSON body {"source_table", "group_columns": [...],
+    "sum_columns": [...], "summary_name" (optional)}.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "JSON body required."}), 400
+    if not data.get('source_table') or not data.get('group_columns'):
+        return jsonify({"success": False, "error": "source_table and group_columns are required."}), 400
+
+    success, result = data_manager.add_summary_table(data['source_table'], data['group_columns'],
+                                                     data.get('sum_columns'), data.get('summary_name'))
+    if not success:
+        return jsonify({"success": False, "error": result}), 400
+    data_manager.start_summary_rebuild(result)
+    return jsonify({"success": True, "data": {"summary_name": result,
+                                              "message": "Summary table created, initial rebuild running."}}), 202
+
+
+@app.route('/api/summaries/<summary_name>/rebuild', methods=['POST'])
+def api_rebuild_summary(summary_name):
+    """API: Recompute a summary table from its import table in the background (poll GET /api/summaries)."""
+    if not _find_summary(summary_name):
+        return jsonify({"success": False, "error": "Summary table not found."}), 404
+    if not data_manager.start_summary_rebuild(summary_name):
+        return jsonify({"success": False, "error": "A rebuild of this summary table is already running."}), 409
+    return jsonify({"success": True, "data": {"message": f"Rebuilding '{summary_name}'."}}), 202
+
+
+@app.route('/api/summaries/<summary_name>/rows', methods=['GET'])
+def api_get_summary_rows(summary_name):
+    """
+    API: Rows of a summary table (one per group), filtered with the same
+    <column>[__op]=<value> syntax as GET /api/tables/<name>/rows.
+    """
+    if not _find_summary(summary_name):
+        return jsonify({"success": False, "error": "Summary table not found."}), 404
+    limit = request.args.get('limit', config.ROWS_PAGE_MAX, type=int)
+    if not 1 <= limit <= config.ROWS_PAGE_MAX:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {config.ROWS_PAGE_MAX}."}), 400
+    filters = {key: request.args.get(key) for key in request.args if key != 'limit'}
+    success, result = data_manager.get_summary_rows(summary_name, filters=filters, limit=limit)
+    if not success:
+        return jsonify({"success": False, "error": result}), 400
+    body = json.dumps({"success": True, "data": result}, default=data_manager.json_value, ensure_ascii=False)
+    return Response(body, mimetype='application/json'), 200
+
+
+@app.route('/api/summaries/<summary_name>', methods=['DELETE'])
+def api_drop_summary(summary_name):
+    """API: Drop a summary table and its definition."""
+    if data_manager.delete_summary_table(summary_name):
+        return jsonify({"success": True, "data": {"message": f"Summary table '{summary_name}' dropped."}}), 200
     else:
-        return jsonify({"success": False, "error": "Failed to add column."}), 400
+        return jsonify({"success": False, "error": "Failed to drop summary table."}), 400
 
 
 @app.route('/api/tables/<int:table_id>/filename', methods=['PUT'])
@@ -685,6 +1443,40 @@ def api_update_filename(table_id):
         return jsonify({"success": False, "error": "Failed to update allowed filename."}), 400
 
 
+@app.route('/api/tables/<int:table_id>/profile', methods=['PUT'])
+def api_update_table_profiling(table_id):
+    """API: Enable/disable profiling of every import into a table. Expects JSON body."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "JSON body required."}), 400
+
+    enabled = bool(data.get('enabled', False))
+    if data_manager.set_table_profiling(table_id, enabled):
+        return jsonify({"success": True, "data": {"message": f"Profiling {'enabled' if enabled else 'disabled'}."}}), 200
+    else:
+        return jsonify({"success": False, "error": "Failed to update profiling flag."}), 400
+
+
+@app.route('/api/tables/<int:table_id>/retention', methods=['PUT'])
+def api_update_table_retention(table_id):
+    """API: Set how many months of rows a table keeps (0 = forever). Expects JSON body."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "JSON body required."}), 400
+
+    try:
+        months = int(data.get('months', 0))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "months must be an integer."}), 400
+    if months < 0:
+        return jsonify({"success": False, "error": "months must be >= 0."}), 400
+
+    if data_manager.set_table_retention(table_id, months):
+        return jsonify({"success": True, "data": {"message": f"Retention set to {months or 'unlimited'} months."}}), 200
+    else:
+        return jsonify({"success": False, "error": "Failed to update retention policy."}), 400
+
+
 @app.route('/api/columns/<int:column_id>', methods=['PUT'])
 def api_update_column(column_id):
     """API: Update column config (is_mandatory, data_type). Expects JSON body."""
@@ -727,6 +1519,12 @@ def api_delete_alias(alias_id):
     else:
         return jsonify({"success": False, "error": "Failed to delete alias."}), 400
     
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: per-stage durations, rows/sec per table, queue wait, DB latency."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/batch')
 def batch_page():
     jobs = data_manager.get_all_jobs(limit=100)
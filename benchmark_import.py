@@ -0,0 +1,263 @@
+"""
+Benchmark suite for the import pipeline.
+
+Generates stock files of several sizes, duplicate ratios and date formats with
+generate_big_stock_test.py, runs quick_validate_file, dry_run_validate_file,
+import_file_process and export_data against the MySQL configured in .env and
+appends one JSON record per stage to a JSON Lines file, so runs can be compared
+across commits.
+
+Every stage runs in a fresh child process so the reported peak RSS belongs to
+that stage only.
+
+The import stages TRUNCATE the target table first and then write into it, so
+they only run with --allow-truncate. Point .env at a scratch database.
+
+Usage:
+    python benchmark_import.py --sizes 10000,100000 --table stocks --allow-truncate
+    python benchmark_import.py --offline            # file-level stages only, no MySQL needed
+    python benchmark_import.py --compare <old_commit> <new_commit>
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from generate_big_stock_test import generate_big_stock_csv
+
+DATE_FORMATS = {
+    'iso': '%Y-%m-%d',
+    'dmy': '%d/%m/%Y',
+    'mdy': '%m/%d/%Y',
+}
+
+DB_STAGES = ('import', 'reimport', 'export')
+WRITE_STAGES = ('import', 'reimport')
+DEFAULT_STAGES = ('quick', 'dryrun', 'import', 'reimport', 'export')
+
+# Column config used by --offline, mirrors the stocks seed in db_setup.py
+OFFLINE_CONFIGS = {
+    'sku': {'is_mandatory': True, 'is_unique': True, 'data_type': 'str', 'aliases': ['sku', 'kode barang', 'item code']},
+    'warehouse_code': {'is_mandatory': True, 'is_unique': False, 'data_type': 'str', 'aliases': ['warehouse_code', 'kode gudang', 'warehouse', 'gudang']},
+    'stock_pcs': {'is_mandatory': True, 'is_unique': False, 'data_type': 'int', 'aliases': ['stock_pcs', 'stock pcs', 'pcs', 'stok pcs']},
+    'stock_box': {'is_mandatory': False, 'is_unique': False, 'data_type': 'int', 'aliases': ['stock_box', 'stock box', 'box', 'stok box']},
+    'stock_cs': {'is_mandatory': False, 'is_unique': False, 'data_type': 'int', 'aliases': ['stock_cs', 'stock cs', 'cs', 'stok cs']},
+    'date': {'is_mandatory': False, 'is_unique': False, 'data_type': 'date', 'aliases': ['date', 'tanggal']},
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _run_stage(stage, filepath, table_name, batch_id, export_path, offline):
+    """Runs one stage in the child process. Returns (ok, rows, details, seconds, peak_rss_mb)."""
+    import data_manager
+    if offline:
+        data_manager.get_column_configs = lambda table_name='stocks': OFFLINE_CONFIGS
+
+    start = time.perf_counter()
+    rows = 0
+    details = {}
+    if stage == 'quick':
+        ok, error, rows = data_manager.quick_validate_file(filepath, table_name)
+        details['error'] = error
+    elif stage == 'dryrun':
+        result = data_manager.dry_run_validate_file(filepath, table_name, batch_id)
+        ok, rows = result.get('valid', False), result.get('rows', 0)
+        details = {k: result.get(k) for k in ('error', 'error_rows', 'valid_rows')}
+    elif stage in ('import', 'reimport'):
+        ok, result = data_manager.import_file_process(filepath, table_name, batch_id=batch_id)
+        if ok:
+            rows = result['success_count'] + result.get('unchanged', 0) + result['error_rows']
+            details = {k: v for k, v in result.items() if k not in ('errors', 'rejected_file')}
+        else:
+            details['error'] = result[0] if result else None
+    elif stage == 'export':
+        ok = data_manager.export_data(export_path, 'csv', table_name=table_name)
+        if ok:
+            with open(export_path, 'rb') as f:
+                rows = max(sum(1 for _ in f) - 1, 0)
+    else:
+        raise ValueError(f"Unknown stage '{stage}'")
+    elapsed = time.perf_counter() - start
+    return ok, rows, details, elapsed, _peak_rss_mb()
+
+
+def _truncate_table(table_name):
+    import data_manager
+    connection = data_manager.get_connection()
+    if not connection:
+        raise RuntimeError("Database connection failed.")
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"TRUNCATE TABLE {table_name}")
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def _file_stem(table_name, offline):
+    """Uses the first allowed_filename of the table so the filename check passes."""
+    if not offline:
+        import data_manager
+        for table in data_manager.get_import_tables():
+            if table['table_name'] == table_name and table.get('allowed_filename'):
+                return table['allowed_filename'].split(',')[0].strip()
+    return table_name
+
+
+def run_benchmarks(sizes, duplicate_ratios, date_formats, stages, table_name, output, workdir,
+                   offline=False, keep_files=False):
+    commit = _git_commit()
+    stem = _file_stem(table_name, offline)
+    ctx = multiprocessing.get_context('spawn')
+    os.makedirs(workdir, exist_ok=True)
+
+    with open(output, 'a', encoding='utf-8') as out:
+        for size in sizes:
+            for dup in duplicate_ratios:
+                for fmt_name in date_formats:
+                    case_dir = os.path.join(workdir, f"{size}_{dup}_{fmt_name}")
+                    os.makedirs(case_dir, exist_ok=True)
+                    filepath = os.path.join(case_dir, f"{stem}.csv")
+                    export_path = os.path.join(case_dir, "export.csv")
+                    generate_big_stock_csv(filepath, row_count=size, duplicate_ratio=dup,
+                                           date_format=DATE_FORMATS.get(fmt_name, fmt_name))
+                    file_bytes = os.path.getsize(filepath)
+                    batch_id = f"bench-{uuid.uuid4()}"
+
+                    if not offline and 'import' in stages:
+                        _truncate_table(table_name)
+
+                    for stage in stages:
+                        with ctx.Pool(1) as pool:
+                            ok, rows, details, elapsed, peak_rss = pool.apply(
+                                _run_stage, (stage, filepath, table_name, batch_id, export_path, offline))
+                        record = {
+                            "commit": commit,
+                            "timestamp": datetime.now().isoformat(timespec='seconds'),
+                            "table_name": table_name,
+                            "stage": stage,
+                            "csv_engine": os.getenv('CSV_ENGINE', 'auto'),
+                            "size": size,
+                            "duplicate_ratio": dup,
+                            "date_format": fmt_name,
+                            "file_bytes": file_bytes,
+                            "ok": bool(ok),
+                            "rows": rows,
+                            "seconds": round(elapsed, 4),
+                            "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+                            "peak_rss_mb": peak_rss,
+                            "details": details,
+                        }
+                        out.write(json.dumps(record, default=str) + "\n")
+                        out.flush()
+                        print(f"{stage:<9} size={size:<9} dup={dup:<5} fmt={fmt_name:<4} "
+                              f"{record['seconds']:>9.3f}s {record['rows_per_sec'] or 0:>12.0f} rows/s "
+                              f"{peak_rss:>8.1f} MB {'ok' if ok else 'FAILED'}")
+                        stage_seconds = (details.get('metrics') or {}).get('stages')
+                        if stage_seconds:
+                            # Per-stage split (prefetch / bulk_insert / bulk_update / upsert ...)
+                            print("          " + " ".join(f"{name}={sec:.3f}s" for name, sec in stage_seconds.items()))
+
+                    if not keep_files:
+                        for path in (filepath, export_path):
+                            try:
+                                os.remove(path)
+                            except OSError:
+                                pass
+
+
+def compare(output, old_commit, new_commit):
+    """Prints rows/sec of two commits side by side (latest record per case wins)."""
+    latest = {}
+    with open(output, encoding='utf-8') as f:
+        for line in f:
+            r = json.loads(line)
+            if r.get('commit') in (old_commit, new_commit):
+                key = (r['stage'], r['size'], r['duplicate_ratio'], r['date_format'])
+                latest[(r['commit'], key)] = r
+
+    keys = sorted({key for _, key in latest}, key=lambda k: (k[1], k[0], k[2], k[3]))
+    print(f"{'stage':<9} {'size':>9} {'dup':>5} {'fmt':<4} {old_commit:>12} {new_commit:>12} {'ratio':>7}")
+    for key in keys:
+        old, new = latest.get((old_commit, key)), latest.get((new_commit, key))
+        old_rps = old and old['rows_per_sec']
+        new_rps = new and new['rows_per_sec']
+        ratio = f"{new_rps / old_rps:.2f}x" if old_rps and new_rps else '-'
+        print(f"{key[0]:<9} {key[1]:>9} {key[2]:>5} {key[3]:<4} {old_rps or '-':>12} {new_rps or '-':>12} {ratio:>7}")
+
+
+def _csv_list(value, cast=str):
+    return [cast(v.strip()) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import pipeline.")
+    parser.add_argument('--sizes', default='10000,100000,1000000,5000000', help="Comma-separated row counts.")
+    parser.add_argument('--duplicate-ratios', default='0,0.3', help="Comma-separated duplicate sku ratios.")
+    parser.add_argument('--date-formats', default='iso,dmy', help=f"Comma-separated: {', '.join(DATE_FORMATS)} or strftime formats.")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES), help="Comma-separated stages to run.")
+    parser.add_argument('--table', default='stocks', help="Target import table.")
+    parser.add_argument('--output', default='bench_results.jsonl', help="JSON Lines file results are appended to.")
+    parser.add_argument('--workdir', default='bench_data', help="Directory for generated files.")
+    parser.add_argument('--offline', action='store_true', help="No MySQL: default stocks config, file-level stages only.")
+    parser.add_argument('--allow-truncate', action='store_true',
+                        help="Allow the import stages, which TRUNCATE --table on the database from .env.")
+    parser.add_argument('--keep-files', action='store_true', help="Keep generated files after each case.")
+    parser.add_argument('--csv-engine', choices=('auto', 'pyarrow', 'pandas'), default=None,
+                        help="CSV parser for the child processes (default: CSV_ENGINE from .env).")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD_COMMIT', 'NEW_COMMIT'), help="Compare two commits in --output.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.output, *args.compare)
+        return
+
+    if args.csv_engine:
+        # Spawned stage processes read config (and CSV_ENGINE) afresh
+        os.environ['CSV_ENGINE'] = args.csv_engine
+
+    stages = _csv_list(args.stages)
+    if args.offline:
+        stages = [s for s in stages if s not in DB_STAGES]
+    elif not args.allow_truncate and any(s in WRITE_STAGES for s in stages):
+        import config
+        print(f"Refusing to run the {'/'.join(WRITE_STAGES)} stages: they TRUNCATE table '{args.table}' "
+              f"on {config.DB_HOST}/{config.DB_NAME}. "
+              f"Pass --allow-truncate (scratch database only), --offline, or --stages without them.")
+        sys.exit(2)
+
+    run_benchmarks(
+        sizes=_csv_list(args.sizes, int),
+        duplicate_ratios=_csv_list(args.duplicate_ratios, float),
+        date_formats=_csv_list(args.date_formats),
+        stages=stages,
+        table_name=args.table,
+        output=args.output,
+        workdir=args.workdir,
+        offline=args.offline,
+        keep_files=args.keep_files,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,3 +11,67 @@ DB_NAME = os.getenv('DB_NAME')
 
 # Table Name
 TABLE_NAME = 'inventory'
+
+# Import Tuning
+QUICK_VALIDATE_SAMPLE_ROWS = int(os.getenv('QUICK_VALIDATE_SAMPLE_ROWS', 5))
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', 5000))
+DRYRUN_CHUNK_ROWS = int(os.getenv('DRYRUN_CHUNK_ROWS', 100_000))
+DRYRUN_WORKERS = int(os.getenv('DRYRUN_WORKERS', 4))
+
+# Per-batch reports and artifacts (error reports, rejected rows)
+REPORT_FOLDER = os.getenv('REPORT_FOLDER', os.path.join('uploads', 'reports'))
+ERROR_EXAMPLE_ROWS = int(os.getenv('ERROR_EXAMPLE_ROWS', 5))
+
+# Schema changes: how long an ALTER that needs a table copy waits for running
+# imports into that table before it is refused (0 = refuse right away)
+SCHEMA_COPY_WAIT_SECONDS = int(os.getenv('SCHEMA_COPY_WAIT_SECONDS', 0))
+
+# Partitioned import tables: monthly partitions are pre-created this many months ahead
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+
+# Retention: archives of expired rows, batch size of the chunked deletes and
+# the pause between batches; upload_logs keeps this many months (0 = forever)
+ARCHIVE_FOLDER = os.getenv('ARCHIVE_FOLDER', os.path.join('uploads', 'archive'))
+RETENTION_BATCH_ROWS = int(os.getenv('RETENTION_BATCH_ROWS', 1000))
+RETENTION_BATCH_SLEEP = float(os.getenv('RETENTION_BATCH_SLEEP', 0.05))
+UPLOAD_LOGS_RETENTION_MONTHS = int(os.getenv('UPLOAD_LOGS_RETENTION_MONTHS', 0))
+
+# Type inference: rows of an uploaded sample file read to propose column types
+TYPE_INFERENCE_SAMPLE_ROWS = int(os.getenv('TYPE_INFERENCE_SAMPLE_ROWS', 100_000))
+
+# CSV parser for imports and quick validation: 'auto' (pyarrow when installed,
+# multithreaded), 'pyarrow' or 'pandas'
+CSV_ENGINE = os.getenv('CSV_ENGINE', 'auto').lower()
+# Encoding assumed for uploads that are neither UTF-8 nor UTF-16/32 (detected from the first 64 KB)
+CSV_FALLBACK_ENCODING = os.getenv('CSV_FALLBACK_ENCODING', 'cp1252')
+
+# Import scheduler: background workers shared by all uploads, files dispatched
+# round-robin across distributors weighted by priority, and the most files
+# one dist_id / one user may have importing at the same time (0 = no cap)
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 4))
+IMPORT_MAX_ACTIVE_PER_DIST = int(os.getenv('IMPORT_MAX_ACTIVE_PER_DIST', 2))
+IMPORT_MAX_ACTIVE_PER_USER = int(os.getenv('IMPORT_MAX_ACTIVE_PER_USER', 0))
+# Round-robin weight of each priority level accepted by POST /api/import
+IMPORT_PRIORITY_WEIGHTS = {'high': 4, 'normal': 2, 'low': 1}
+
+# Admission control on uploads: at most this many files waiting in the import
+# queue, this many bytes accepted but not yet imported (uploads being received
+# plus queued/running files), and always keep this much disk free in the
+# upload folder (0 = no limit). Rejected uploads get 429/503 with Retry-After.
+IMPORT_MAX_QUEUED_FILES = int(os.getenv('IMPORT_MAX_QUEUED_FILES', 200))
+IMPORT_MAX_INFLIGHT_BYTES = int(os.getenv('IMPORT_MAX_INFLIGHT_BYTES', 20 * 1024 ** 3))
+UPLOAD_MIN_FREE_BYTES = int(os.getenv('UPLOAD_MIN_FREE_BYTES', 2 * 1024 ** 3))
+IMPORT_RETRY_AFTER_SECONDS = int(os.getenv('IMPORT_RETRY_AFTER_SECONDS', 30))
+
+# Chunked uploads (POST /api/uploads): suggested chunk size for clients and how
+# long an unfinished upload workspace is kept before it is removed
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24))
+
+# Import table / column configs are cached in-process for this many seconds
+# (0 = no cache); writes through the app invalidate the cache immediately
+CONFIG_CACHE_SECONDS = int(os.getenv('CONFIG_CACHE_SECONDS', 30))
+
+# GET /api/tables/<name>/rows: default and maximum page size
+ROWS_PAGE_DEFAULT = int(os.getenv('ROWS_PAGE_DEFAULT', 1000))
+ROWS_PAGE_MAX = int(os.getenv('ROWS_PAGE_MAX', 10000))
@@ -0,0 +1,296 @@
+import codecs
+import csv
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: read_csv falls back to the pandas parser
+    pa = pc = pa_csv = None
+
+SNIFF_BYTES = 64 * 1024
+COUNT_BLOCK_BYTES = 16 * 1024 * 1024
+CANDIDATE_DELIMITERS = ',;|\t'
+
+# pandas' default na_values, so both engines turn the same cells into NaN
+NA_VALUES = ('', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null')
+_NUMBER_RE = r'^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$'
+
+# Longest first: the UTF-32-LE BOM starts with the UTF-16-LE one
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_encoding(filepath):
+    """
+    Detects the text encoding from the first SNIFF_BYTES of a file: a BOM
+    (UTF-8/16/32), BOM-less UTF-16 (NUL in every other byte), strict UTF-8,
+    and otherwise CSV_FALLBACK_ENCODING (Windows-1252 by default, Latin-1
+    when the sample has bytes that code page leaves undefined).
+    """
+    with open(filepath, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    even, odd = sample[0::2], sample[1::2]
+    if odd and odd.count(0) > len(odd) * 0.3 and even.count(0) < len(even) * 0.05:
+        return 'utf-16-le'
+    if even and even.count(0) > len(even) * 0.3 and odd.count(0) < len(odd) * 0.05:
+        return 'utf-16-be'
+
+    try:
+        # final=False: a multi-byte character cut at the sample boundary is fine
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode(config.CSV_FALLBACK_ENCODING)
+        return config.CSV_FALLBACK_ENCODING
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _is_wide(encoding):
+    """UTF-16/32: a newline is not a single b'\\n' byte."""
+    return codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32'))
+
+
+def sniff_delimiter(filepath, default=',', encoding='utf-8'):
+    """Detects the field delimiter from the first few KB of a file."""
+    with open(filepath, 'r', newline='', encoding=encoding, errors='replace') as f:
+        sample = f.read(SNIFF_BYTES)
+    if not sample:
+        return default
+
+    # A line cut off at the sample boundary confuses the sniffer
+    if len(sample) == SNIFF_BYTES and '\n' in sample:
+        sample = sample[:sample.rfind('\n')]
+
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        return default
+
+
+def count_rows(filepath, has_header=True, quotechar=b'"', encoding='utf-8'):
+    """
+    Counts CSV records with a memory-mapped newline scan.
+    Newlines inside quoted fields are skipped, but the quote-aware scan only
+    runs when the file actually contains a quote character.
+    Trailing blank lines are ignored; blank lines in the middle are counted.
+    UTF-16/32 files are decoded block by block instead.
+    """
+    if os.path.getsize(filepath) == 0:
+        return 0
+    if _is_wide(encoding):
+        return _count_rows_decoded(filepath, has_header, quotechar.decode('ascii'), encoding)
+
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Ignore trailing newlines so "a\nb\n" and "a\nb" count the same
+        end = len(mm)
+        while end > 0 and mm[end - 1:end] in (b'\n', b'\r'):
+            end -= 1
+        if end == 0:
+            return 0
+
+        if mm.find(quotechar, 0, end) == -1:
+            newlines = _count_newlines(mm, end)
+        else:
+            newlines = _count_newlines_quoted(mm, end, quotechar)
+
+    records = newlines + 1
+    if has_header:
+        records -= 1
+    return max(records, 0)
+
+
+def _count_rows_decoded(filepath, has_header, quotechar, encoding):
+    count = 0
+    trailing = 0
+    inside = False
+    has_content = False
+    with open(filepath, 'r', newline='', encoding=encoding) as f:
+        while True:
+            block = f.read(COUNT_BLOCK_BYTES // 4)
+            if not block:
+                break
+            parts = block.split(quotechar)
+            for i, part in enumerate(parts):
+                if not inside:
+                    count += part.count('\n')
+                if i < len(parts) - 1:
+                    inside = not inside
+            # Newlines after the last content so far, dropped like the trailing ones in count_rows
+            content = block.rstrip('\r\n')
+            tail = block[len(content):].count('\n')
+            trailing = trailing + tail if not content else tail
+            has_content = has_content or bool(content)
+    if not has_content:
+        return 0
+    records = count - trailing + 1
+    if has_header:
+        records -= 1
+    return max(records, 0)
+
+
+def _count_newlines(mm, end):
+    count = 0
+    for start in range(0, end, COUNT_BLOCK_BYTES):
+        count += mm[start:min(start + COUNT_BLOCK_BYTES, end)].count(b'\n')
+    return count
+
+
+def _count_newlines_quoted(mm, end, quotechar):
+    # Splitting on the quote char alternates between outside/inside segments.
+    # Escaped quotes ("") toggle twice, so the parity stays correct.
+    count = 0
+    inside = False
+    for start in range(0, end, COUNT_BLOCK_BYTES):
+        parts = mm[start:min(start + COUNT_BLOCK_BYTES, end)].split(quotechar)
+        for i, part in enumerate(parts):
+            if not inside:
+                count += part.count(b'\n')
+            if i < len(parts) - 1:
+                inside = not inside
+    return count
+
+
+def csv_engine():
+    """Parser used by read_csv: CSV_ENGINE ('auto', 'pyarrow' or 'pandas'), 'auto' = pyarrow when installed."""
+    engine = config.CSV_ENGINE
+    if engine == 'pandas' or pa_csv is None:
+        return 'pandas'
+    return 'pyarrow'
+
+
+def _string_dtype():
+    # Same dtype as pandas 3's dtype=str (Arrow buffers, NaN for missing); older
+    # pandas has no NaN-semantics Arrow string dtype, so values become Python str
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        return None
+
+
+def _read_csv_arrow(filepath, sep, nrows, encoding):
+    # Header through pandas so duplicate names are mangled ('qty', 'qty.1') exactly as before
+    columns = list(pd.read_csv(filepath, sep=sep, dtype=str, nrows=0, encoding=encoding).columns)
+    # Non-UTF-8 input is transcoded to UTF-8 block by block while it is read
+    arrow_encoding = 'utf8' if codecs.lookup(encoding).name == 'utf-8' else encoding
+    read_options = pa_csv.ReadOptions(use_threads=True, column_names=columns, skip_rows=1, encoding=arrow_encoding)
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in columns},
+        null_values=list(NA_VALUES), strings_can_be_null=True,
+    )
+    if nrows is None:
+        table = pa_csv.read_csv(filepath, read_options, parse_options, convert_options)
+    else:
+        batches = []
+        with pa_csv.open_csv(filepath, read_options, parse_options, convert_options) as reader:
+            read = 0
+            for batch in reader:
+                batches.append(batch)
+                read += batch.num_rows
+                if read >= nrows:
+                    break
+        table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, nrows)
+
+    dtype = _string_dtype()
+    if dtype is None:
+        return table.to_pandas()
+    return table.to_pandas(types_mapper=lambda arrow_type: dtype if pa.types.is_string(arrow_type) else None)
+
+
+def _read_csv(filepath, sep, nrows, encoding):
+    if csv_engine() == 'pyarrow':
+        try:
+            return _read_csv_arrow(filepath, sep, nrows, encoding)
+        except (pa.ArrowInvalid, pd.errors.EmptyDataError, UnicodeDecodeError):
+            pass
+    return pd.read_csv(filepath, sep=sep, dtype=str, nrows=nrows, encoding=encoding)
+
+
+def read_csv(filepath, sep=None, nrows=None, encoding=None):
+    """
+    Reads a CSV/TXT file with every column as strings (like pd.read_csv(dtype=str)).
+    With pyarrow the file is parsed by several threads straight into Arrow
+    buffers; rows pyarrow rejects (e.g. a short row pandas would pad with
+    NaN) fall back to the pandas parser, as does a missing pyarrow.
+    The encoding is detected from the head of the file unless given; both
+    parsers transcode to UTF-8 incrementally. The encoding used is stored in
+    df.attrs['encoding'].
+    """
+    encoding = encoding or detect_encoding(filepath)
+    sep = sep or sniff_delimiter(filepath, encoding=encoding)
+    try:
+        df = _read_csv(filepath, sep, nrows, encoding)
+    except UnicodeDecodeError:
+        if encoding != 'utf-8':
+            raise
+        # The head was plain UTF-8 (usually ASCII) but a later byte is not
+        encoding = config.CSV_FALLBACK_ENCODING
+        df = _read_csv(filepath, sep, nrows, encoding)
+    df.attrs['encoding'] = encoding
+    return df
+
+
+def read_csv_chunks(filepath, consume, chunksize, sep=None, nrows=None, encoding=None):
+    """
+    Streams a CSV/TXT file in DataFrames of `chunksize` string rows into
+    consume(chunks) and returns (its result, encoding used). Same encoding
+    rule as read_csv: when the head looked like UTF-8 but a later byte is
+    not, the whole pass is repeated with CSV_FALLBACK_ENCODING, so `consume`
+    must start from scratch on every call.
+    """
+    encoding = encoding or detect_encoding(filepath)
+    sep = sep or sniff_delimiter(filepath, encoding=encoding)
+
+    def run(encoding):
+        with pd.read_csv(filepath, sep=sep, dtype=str, nrows=nrows, chunksize=chunksize, encoding=encoding) as reader:
+            return consume(reader)
+
+    try:
+        return run(encoding), encoding
+    except UnicodeDecodeError:
+        if encoding != 'utf-8':
+            raise
+        return run(config.CSV_FALLBACK_ENCODING), config.CSV_FALLBACK_ENCODING
+
+
+def to_numeric(values):
+    """
+    pd.to_numeric(values, errors='coerce') for a column read by read_csv.
+    Arrow-backed columns are parsed by pyarrow.compute without building a
+    Python object per cell: all-integer columns without gaps stay int64,
+    anything else becomes float64 with NaN for blanks and unparseable text.
+    """
+    if pc is None or getattr(values.dtype, 'storage', None) != 'pyarrow':
+        return pd.to_numeric(values, errors='coerce')
+    try:
+        text = pc.utf8_trim_whitespace(pa.chunked_array(pa.array(values.array)))
+        if text.null_count == 0 and pc.all(pc.match_substring_regex(text, r'^[+-]?\d+$')).as_py():
+            numbers = pc.cast(text, pa.int64())
+        else:
+            numbers = pc.cast(pc.if_else(pc.match_substring_regex(text, _NUMBER_RE), text, None), pa.float64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # e.g. an integer beyond int64: let pandas decide (uint64/float)
+        return pd.to_numeric(values, errors='coerce')
+    return pd.Series(numbers.to_numpy(), index=values.index, name=values.name)
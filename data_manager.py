@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import mysql.connector
 from mysql.connector import Error
 import config
@@ -8,8 +9,22 @@ import tempfile
 import shutil
 import uuid
 import json
+import copy
 import threading
-
+import time
+import warnings
+import hashlib
+import re
+from decimal import Decimal, InvalidOperation
+import cProfile
+import io
+import pstats
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import csv_utils
+import metrics
 from gdrive_utils import upload_file_to_gdrive
 from dotenv import load_dotenv
 load_dotenv()
@@ -32,15 +47,34 @@ def get_connection():
         print(f"Error connecting to database: {e}")
         return None
 
-def export_data(filename, format_type='csv'):
-    """Exports data from the database to a CSV or Excel file."""
+def export_data(filename, format_type='csv', table_name=None, date_from=None, date_to=None):
+    """
+    Exports data from the database to a CSV or Excel file.
+    date_from/date_to (inclusive, 'YYYY-MM-DD') filter on the partition column
+    of partitioned tables, so only the matching partitions are read.
+    """
+    table_name = table_name or config.TABLE_NAME
+    partition_column = get_partitioned_tables().get(table_name) if (date_from or date_to) else None
+    if (date_from or date_to) and not partition_column:
+        print(f"Error during export: {table_name} is not partitioned, date filters are not supported")
+        return False
+
     connection = get_connection()
     if not connection:
         return False
 
     try:
-        query = f"SELECT * FROM {config.TABLE_NAME}"
-        df = pd.read_sql(query, connection)
+        query = f"SELECT * FROM {table_name}"
+        conditions, params = [], []
+        if date_from:
+            conditions.append(f"{partition_column} >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append(f"{partition_column} < %s + INTERVAL 1 DAY")
+            params.append(date_to)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        df = pd.read_sql(query, connection, params=params or None)
         
         if format_type == 'csv':
             df.to_csv(filename, index=False)
@@ -56,11 +90,220 @@ def export_data(filename, format_type='csv'):
         if connection.is_connected():
             connection.close()
 
+
+ROW_FILTER_OPERATORS = {
+    'eq': '=', 'ne': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=',
+    'in': 'IN', 'prefix': 'LIKE', 'isnull': 'IS NULL',
+}
+
+
+def _parse_filter_value(value, data_type):
+    """Parses one filter value (query string) by the column's data_type; raises ValueError."""
+    value = value.strip()
+    if data_type == 'int':
+        return int(value)
+    if data_type == 'decimal':
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValueError(value)
+    if data_type == 'float':
+        return float(value)
+    if data_type == 'date':
+        return datetime.fromisoformat(value).date()
+    if data_type == 'datetime':
+        return datetime.fromisoformat(value)
+    if data_type == 'bool':
+        lowered = value.lower()
+        if lowered in BOOL_TRUE_VALUES:
+            return 1
+        if lowered in BOOL_FALSE_VALUES:
+            return 0
+        raise ValueError(value)
+    return value
+
+
+def _filter_sql(filters, types):
+    """
+    WHERE conditions for {'col__op': 'value'} filters (op in ROW_FILTER_OPERATORS,
+    no op = eq, 'in' takes comma-separated values, 'isnull' takes true/false),
+    with values typed by `types` ({column: data_type}).
+    Returns (True, (conditions, params)) or (False, message).
+    """
+    conditions, params = [], []
+    for key, raw in (filters or {}).items():
+        column, _, op = key.partition('__')
+        op = op or 'eq'
+        if column not in types:
+            return False, f"Unknown filter column '{column}'."
+        if op not in ROW_FILTER_OPERATORS:
+            return False, f"Unknown filter operator '{op}' (use {', '.join(ROW_FILTER_OPERATORS)})."
+        data_type = types[column]
+        try:
+            if op == 'isnull':
+                negate = _parse_filter_value(raw, 'bool') == 0
+                conditions.append(f"`{column}` IS {'NOT ' if negate else ''}NULL")
+            elif op == 'in':
+                values = [_parse_filter_value(v, data_type) for v in raw.split(',') if v.strip()]
+                if not values:
+                    return False, f"Filter '{key}' needs at least one value."
+                conditions.append(f"`{column}` IN ({', '.join(['%s'] * len(values))})")
+                params.extend(values)
+            elif op == 'prefix':
+                if data_type != 'str':
+                    return False, f"Filter '{key}': prefix only works on str columns."
+                escaped = raw.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                conditions.append(f"`{column}` LIKE %s")
+                params.append(escaped + '%')
+            else:
+                conditions.append(f"`{column}` {ROW_FILTER_OPERATORS[op]} %s")
+                params.append(_parse_filter_value(raw, data_type))
+        except (ValueError, TypeError):
+            return False, f"Filter '{key}': '{raw}' is not a valid {data_type}."
+    return True, (conditions, params)
+
+
+def prepare_rows_query(table_name, columns=None, filters=None, after=None, limit=1000, descending=False):
+    """
+    Builds a keyset-paginated SELECT over an import table.
+    columns: projection (id is always included); filters: see _filter_sql;
+    after: last id of the previous page. Filter values are typed by
+    column_definitions, so comparisons use the indexes.
+    Returns (True, {'columns', 'sql', 'params'}) or (False, message).
+    """
+    if table_name not in {t['table_name'] for t in get_import_tables()}:
+        return False, f"Unknown table '{table_name}'."
+
+    types = {'id': 'int'}
+    types.update({name: conf['data_type'] for name, conf in get_column_configs(table_name=table_name).items()})
+    types['ImportDate'] = 'datetime'
+
+    if columns:
+        unknown = [c for c in columns if c not in types]
+        if unknown:
+            return False, f"Unknown columns: {', '.join(unknown)}"
+        columns = ['id'] + [c for c in dict.fromkeys(columns) if c != 'id']
+    else:
+        columns = list(types)
+
+    ok, filtered = _filter_sql(filters, types)
+    if not ok:
+        return False, filtered
+    conditions, params = filtered
+    if after is not None:
+        conditions.insert(0, "`id` < %s" if descending else "`id` > %s")
+        params.insert(0, after)
+
+    sql = f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM {table_name}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY `id` {'DESC' if descending else 'ASC'} LIMIT %s"
+    params.append(int(limit))
+    return True, {'columns': columns, 'sql': sql, 'params': params}
+
+
+def iter_rows(query, fetch_size=1000):
+    """
+    Streams the rows of a prepare_rows_query() result as tuples through an
+    unbuffered cursor, fetch_size rows at a time, without building a DataFrame.
+    """
+    connection = get_connection()
+    if not connection:
+        raise RuntimeError("Database connection failed.")
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query['sql'], tuple(query['params']))
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        try:
+            if cursor is not None:
+                cursor.close()
+        except Error:
+            # client went away mid-stream; unread rows are dropped with the connection
+            pass
+        if connection.is_connected():
+            connection.close()
+
+
+def json_value(value):
+    """json.dumps default= for database values (Decimal keeps its precision as a string)."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+_config_generation = 0  # bumped by every config write in this process
+
+
+def invalidate_config_cache():
+    """Drops cached import table/column configs; called after every config write."""
+    global _config_generation
+    with _config_cache_lock:
+        _config_generation += 1
+        _config_cache.clear()
+
+
+def _cached_config(key, loader):
+    """
+    Cache entry {"value", "etag"} for `key`, reloaded by `loader` once it is
+    older than CONFIG_CACHE_SECONDS or the config was changed in this
+    process. The etag is a digest of the value, so it stays the same across
+    reloads (and across app processes) until the config really changes.
+    A loader returning None (no DB connection) is not cached.
+    """
+    with _config_cache_lock:
+        entry = _config_cache.get(key)
+        generation = _config_generation
+    if entry and time.monotonic() - entry['loaded_at'] < config.CONFIG_CACHE_SECONDS:
+        return entry
+
+    value = loader()
+    if value is None:
+        return None
+    digest = hashlib.md5(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    entry = {'value': value, 'etag': digest, 'loaded_at': time.monotonic()}
+    with _config_cache_lock:
+        # A write that happened while loading makes this value stale: serve it, but don't keep it
+        if generation == _config_generation and config.CONFIG_CACHE_SECONDS > 0:
+            _config_cache[key] = entry
+    return entry
+
+
+def config_etag(table_name=None):
+    """
+    Version of the import table list (plus the column configs of
+    `table_name`) for HTTP ETags, or None without a DB connection.
+    """
+    entries = [_cached_config(('tables',), _load_import_tables)]
+    if table_name:
+        entries.append(_cached_config(('columns', table_name), lambda: _load_column_configs(table_name)))
+    if None in entries:
+        return None
+    return hashlib.md5('.'.join(entry['etag'] for entry in entries).encode('ascii')).hexdigest()[:20]
+
+
 def get_column_configs(table_name='stocks'):
-    """Fetches column definitions and aliases from the database."""
+    """Fetches column definitions and aliases (served from the config cache)."""
+    entry = _cached_config(('columns', table_name), lambda: _load_column_configs(table_name))
+    return copy.deepcopy(entry['value']) if entry else {}
+
+
+def _load_column_configs(table_name):
+    """Column definitions and aliases from the database, or None without a connection."""
     connection = get_connection()
     if not connection:
-        return {}
+        return None
     
     try:
         cursor = connection.cursor(dictionary=True)
@@ -101,10 +344,51 @@ def get_column_configs(table_name='stocks'):
             cursor.close()
             connection.close()
 
+def get_known_columns():
+    """
+    Every header already mapped by some import table, lowercased:
+    {header: {"column_name", "aliases", "table_names"}}. A header is a column
+    name or one of its aliases; the most common mapping wins.
+    """
+    connection = get_connection()
+    if not connection: return {}
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT cd.table_name, cd.column_name, ca.alias_name
+            FROM column_definitions cd
+            LEFT JOIN column_aliases ca ON ca.column_id = cd.id
+        """)
+        rows = cursor.fetchall()
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    columns = {}
+    for row in rows:
+        column = columns.setdefault(row['column_name'], {'aliases': set(), 'table_names': set()})
+        column['table_names'].add(row['table_name'])
+        if row['alias_name']:
+            column['aliases'].add(row['alias_name'].lower())
+
+    known = {}
+    for name, column in sorted(columns.items(), key=lambda item: -len(item[1]['table_names'])):
+        entry = {'column_name': name, 'aliases': sorted(column['aliases'] - {name.lower()}),
+                 'table_names': sorted(column['table_names'])}
+        for header in {name.lower()} | column['aliases']:
+            known.setdefault(header, entry)
+    return known
+
 def get_import_tables():
-    """Fetches list of available import tables."""
+    """Fetches list of available import tables (served from the config cache)."""
+    entry = _cached_config(('tables',), _load_import_tables)
+    return copy.deepcopy(entry['value']) if entry else []
+
+
+def _load_import_tables():
     connection = get_connection()
-    if not connection: return []
+    if not connection: return None
     try:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM import_tables")
@@ -126,6 +410,7 @@ def update_column_config(column_id, is_mandatory, is_unique, data_type):
             (is_mandatory, is_unique, data_type, column_id)
         )
         connection.commit()
+        invalidate_config_cache()
         return True
     except Error as e:
         print(f"Error updating config: {e}")
@@ -146,6 +431,7 @@ def add_alias(column_id, alias_name):
             (column_id, alias_name.lower())
         )
         connection.commit()
+        invalidate_config_cache()
         return True
     except Error as e:
         print(f"Error adding alias: {e}")
@@ -163,6 +449,7 @@ def delete_alias(alias_id):
         cursor = connection.cursor()
         cursor.execute("DELETE FROM column_aliases WHERE id=%s", (alias_id,))
         connection.commit()
+        invalidate_config_cache()
         return True
     except Error as e:
         print(f"Error deleting alias: {e}")
@@ -183,6 +470,7 @@ def update_allowed_filename(table_id, allowed_filename):
             (allowed_filename.strip().lower(), table_id)
         )
         connection.commit()
+        invalidate_config_cache()
         return True
     except Error as e:
         print(f"Error updating allowed filename: {e}")
@@ -192,11 +480,28 @@ def update_allowed_filename(table_id, allowed_filename):
             cursor.close()
             connection.close()
 
-def create_new_import_table(table_name, display_name, initial_columns, allowed_filename=''):
+def create_new_import_table(table_name, display_name, initial_columns, allowed_filename='', indexes=None,
+                            partition_column=None):
     """
     Creates a new import table dynamically.
     allowed_filename: expected filename for auto-detect import
+    initial_columns: [{"name", "type", "sql_type", "is_unique", "is_indexed",
+             "is_mandatory" (default True), "aliases"}]
+    indexes: optional list of column lists for secondary (composite) indexes,
+             e.g. [['distid', 'date']]; columns flagged is_indexed get a single-column index
+    partition_column: optional date/datetime column (or 'ImportDate') to range-partition
+             the table by month. MySQL requires the partition column in every unique key,
+             so partitioned tables cannot have UNIQUE columns.
     """
+    invalid = _invalid_column_types(initial_columns)
+    if invalid:
+        print(f"Error creating table: {'; '.join(invalid)}")
+        return False
+    if partition_column:
+        partition_column = _resolve_partition_column(partition_column, initial_columns)
+        if not partition_column:
+            return False
+
     connection = get_connection()
     if not connection: return False
     
@@ -204,49 +509,75 @@ def create_new_import_table(table_name, display_name, initial_columns, allowed_f
         cursor = connection.cursor()
         
         # 1. Register in import_tables
-        cursor.execute(
-            "INSERT INTO import_tables (table_name, display_name, allowed_filename) VALUES (%s, %s, %s)",
-            (table_name, display_name, allowed_filename.strip().lower())
-        )
+        if partition_column:
+            cursor.execute(
+                "INSERT INTO import_tables (table_name, display_name, allowed_filename, partition_column) VALUES (%s, %s, %s, %s)",
+                (table_name, display_name, allowed_filename.strip().lower(), partition_column)
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO import_tables (table_name, display_name, allowed_filename) VALUES (%s, %s, %s)",
+                (table_name, display_name, allowed_filename.strip().lower())
+            )
         
         # 2. Create physical table
         col_defs = ["id INT AUTO_INCREMENT PRIMARY KEY"]
         unique_constraints = []
         
         for col in initial_columns:
-            dtype = "VARCHAR(255)"
-            default = "DEFAULT ''"
-            
-            if col['type'] == 'int':
-                dtype = "INT"
-                default = "DEFAULT 0"
-            elif col['type'] == 'date':
-                dtype = "DATE"
-                default = "NULL"
-            elif col['type'] == 'datetime':
-                dtype = "DATETIME"
-                default = "NULL"
-            
-            col_defs.append(f"{col['name']} {dtype} {default}")
+            if col['name'] == partition_column:
+                # Part of the primary key below, so it cannot be NULL
+                col_defs.append(f"{col['name']} {col['type'].upper()} NOT NULL")
+                continue
+            col_defs.append(f"{col['name']} {_column_type_sql(col['type'], col.get('sql_type'))}")
             
             if col.get('is_unique'):
                 unique_constraints.append(f"UNIQUE ({col['name']})")
             
         # Add system column ImportDate
-        col_defs.append("ImportDate DATETIME DEFAULT CURRENT_TIMESTAMP")
+        if partition_column == 'ImportDate':
+            col_defs.append("ImportDate DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP")
+        else:
+            col_defs.append("ImportDate DATETIME DEFAULT CURRENT_TIMESTAMP")
+        if partition_column:
+            col_defs[0] = "id INT AUTO_INCREMENT"
+            col_defs.append(f"PRIMARY KEY (id, {partition_column})")
+
+        # Secondary indexes
+        known = {col['name'].lower(): col['name'] for col in initial_columns}
+        known['importdate'] = 'ImportDate'
+        index_columns = [[col['name']] for col in initial_columns if col.get('is_indexed') and not col.get('is_unique')]
+        index_columns += list(indexes or [])
+        index_defs = []
+        for columns in index_columns:
+            resolved = _resolve_index_columns(columns, known)
+            if not resolved:
+                print(f"Error creating table: invalid index columns {columns}")
+                return False
+            index_defs.append(f"INDEX {_index_name(resolved)} ({', '.join(resolved)})")
             
-        create_sql = f"CREATE TABLE {table_name} ({', '.join(col_defs + unique_constraints)})"
+        create_sql = f"CREATE TABLE {table_name} ({', '.join(col_defs + unique_constraints + index_defs)})"
+        if partition_column:
+            create_sql += " " + _partition_clause(partition_column)
         cursor.execute(create_sql)
         
-        # 3. Register columns in column_definitions
+        # 3. Register columns in column_definitions (+ header aliases)
         for col in initial_columns:
             is_unique = col.get('is_unique', False)
             cursor.execute(
                 "INSERT INTO column_definitions (table_name, column_name, is_mandatory, is_unique, data_type) VALUES (%s, %s, %s, %s, %s)",
-                (table_name, col['name'], True, is_unique, col['type'])
+                (table_name, col['name'], col.get('is_mandatory', True), is_unique, col['type'])
             )
+            aliases = {a.strip().lower() for a in col.get('aliases') or []} - {'', col['name'].lower()}
+            if aliases:
+                column_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO column_aliases (column_id, alias_name) VALUES (%s, %s)",
+                    [(column_id, alias) for alias in sorted(aliases)]
+                )
             
         connection.commit()
+        invalidate_config_cache()
         return True
     except Error as e:
         print(f"Error creating table: {e}")
@@ -256,254 +587,1363 @@ def create_new_import_table(table_name, display_name, initial_columns, allowed_f
             cursor.close()
             connection.close()
 
-def add_column_to_table(table_name, column_name, data_type, is_unique=False):
-    """Adds a new column to an existing import table."""
+PARTITION_CATCH_ALL = 'pmax'
+PARTITION_HISTORY = 'p_old'
+
+
+def _resolve_partition_column(partition_column, initial_columns):
+    """Validates the partition column of a new table. Returns its name or None."""
+    if partition_column.lower() == 'importdate':
+        resolved = 'ImportDate'
+    else:
+        col = next((c for c in initial_columns if c['name'].lower() == partition_column.lower()), None)
+        if not col or col['type'] not in ('date', 'datetime'):
+            print(f"Error creating table: partition column '{partition_column}' must be a date/datetime column or ImportDate")
+            return None
+        resolved = col['name']
+    if any(c.get('is_unique') for c in initial_columns):
+        print("Error creating table: partitioned tables cannot have UNIQUE columns")
+        return None
+    return resolved
+
+
+def _month_start(d, offset=0):
+    month = d.month - 1 + offset
+    return d.replace(year=d.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def _month_partition(month):
+    """Partition holding `month` (a date on the 1st): name and VALUES LESS THAN clause."""
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{_month_start(month, 1):%Y-%m-%d}')"
+
+
+def _partition_clause(partition_column, months_ahead=None):
+    """
+    Monthly RANGE COLUMNS partitioning: history before the current month,
+    one partition per month up to `months_ahead`, and a MAXVALUE catch-all so
+    inserts never fail when maintenance is late.
+    """
+    months_ahead = config.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = _month_start(datetime.now().date())
+    parts = [f"PARTITION {PARTITION_HISTORY} VALUES LESS THAN ('{current:%Y-%m-%d}')"]
+    parts += [_month_partition(_month_start(current, i)) for i in range(months_ahead + 1)]
+    parts.append(f"PARTITION {PARTITION_CATCH_ALL} VALUES LESS THAN (MAXVALUE)")
+    return f"PARTITION BY RANGE COLUMNS({partition_column}) ({', '.join(parts)})"
+
+
+def get_partitions(table_name):
+    """Partitions of a table with their upper bound and approximate row counts."""
     connection = get_connection()
-    if not connection: return False
-    
+    if not connection: return []
     try:
-        cursor = connection.cursor()
-        
-        # 1. Alter physical table
-        dtype_sql = "VARCHAR(255) DEFAULT ''"
-        if data_type == 'int':
-            dtype_sql = "INT DEFAULT 0"
-        elif data_type == 'date':
-            dtype_sql = "DATE NULL"
-        elif data_type == 'datetime':
-            dtype_sql = "DATETIME NULL"
-            
-        alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {dtype_sql}"
-        if is_unique:
-             alter_sql += f", ADD UNIQUE ({column_name})"
-             
-        cursor.execute(alter_sql)
-        
-        # 2. Register in column_definitions
-        cursor.execute(
-            "INSERT INTO column_definitions (table_name, column_name, is_mandatory, is_unique, data_type) VALUES (%s, %s, %s, %s, %s)",
-            (table_name, column_name, False, is_unique, data_type)
-        )
-        
-        connection.commit()
-        return True
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS less_than, TABLE_ROWS AS `rows`
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table_name,))
+        partitions = cursor.fetchall()
+        for part in partitions:
+            part['less_than'] = (part['less_than'] or '').strip("'")
+        return partitions
     except Error as e:
-        print(f"Error adding column: {e}")
-        return False
+        print(f"Error reading partitions: {e}")
+        return []
     finally:
         if connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def _check_import_file_basic(filename):
-    """Basic validation for file existence and extension."""
-    if not os.path.exists(filename):
-        return False, ["File not found."]
-    _, extension = os.path.splitext(filename)
-    if extension.lower() not in ['.csv', '.txt']:
-        return False, [f"Unsupported file extension '{extension}'. Only .csv and .txt are allowed."]
-    return True, None
+
+def get_partitioned_tables():
+    """{table_name: partition_column} of import tables created with partitioning."""
+    connection = get_connection()
+    if not connection: return {}
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT table_name, partition_column FROM import_tables WHERE partition_column IS NOT NULL AND partition_column != ''")
+        return dict(cursor.fetchall())
+    except Error:
+        # partition_column not migrated yet
+        return {}
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
 
 
-def import_file_process(filename, table_name):
+def maintain_partitions(table_name=None, months_ahead=None):
     """
-    Generic import function for a specific table.
+    Pre-creates monthly partitions up to `months_ahead` months from now by
+    splitting them off the MAXVALUE catch-all (REORGANIZE PARTITION on an empty
+    partition only touches metadata). Returns {table_name: [created partitions]}.
     """
-    valid, errs = _check_import_file_basic(filename)
-    if not valid: return False, errs
-
-    base_name = os.path.basename(filename)
-    name_only, _ = os.path.splitext(base_name)
-    name_only_lower = name_only.lower()
+    months_ahead = config.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    tables = get_partitioned_tables()
+    if table_name:
+        tables = {t: c for t, c in tables.items() if t == table_name}
+
+    current = _month_start(datetime.now().date())
+    created = {}
+    for table in tables:
+        existing = {p['name'] for p in get_partitions(table)}
+        if PARTITION_CATCH_ALL not in existing:
+            print(f"Skipping {table}: no '{PARTITION_CATCH_ALL}' partition")
+            continue
+        missing = [_month_start(current, i) for i in range(months_ahead + 1)]
+        missing = [m for m in missing if f"p{m:%Y%m}" not in existing]
+        # Months before the newest existing partition would overlap its range; only extend forward
+        newest = max((p for p in existing if p.startswith('p') and p[1:].isdigit()), default=None)
+        if newest:
+            missing = [m for m in missing if f"p{m:%Y%m}" > newest]
+        if not missing:
+            created[table] = []
+            continue
+
+        parts = [_month_partition(m) for m in missing]
+        parts.append(f"PARTITION {PARTITION_CATCH_ALL} VALUES LESS THAN (MAXVALUE)")
+        connection = get_connection()
+        if not connection:
+            print("Database connection failed.")
+            break
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {PARTITION_CATCH_ALL} INTO ({', '.join(parts)})")
+            created[table] = [f"p{m:%Y%m}" for m in missing]
+            print(f"{table}: added partitions {', '.join(created[table])}")
+        except Error as e:
+            print(f"Error maintaining partitions of {table}: {e}")
+        finally:
+            if connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+    return created
+
+
+DATA_TYPES = ('str', 'int', 'date', 'datetime', 'decimal', 'float', 'bool')
+
+# Default physical type and default clause per column_definitions data_type
+_COLUMN_TYPES = {
+    'str': ("VARCHAR(255)", "DEFAULT ''"),
+    'int': ("INT", "DEFAULT 0"),
+    'date': ("DATE", "NULL"),
+    'datetime': ("DATETIME", "NULL"),
+    'decimal': ("DECIMAL(18,4)", "DEFAULT 0"),
+    'float': ("DOUBLE", "DEFAULT 0"),
+    'bool': ("TINYINT(1)", "DEFAULT 0"),
+}
+
+# Physical types accepted as a per-column override (sql_type), e.g. from type_inference
+_SQL_TYPE_RE = re.compile(
+    r'^(?:(?:TINYINT|SMALLINT|MEDIUMINT|INT|BIGINT)(?:\(\d+\))?(?: UNSIGNED)?'
+    r'|DECIMAL\(\d{1,2},\s*\d{1,2}\)|DOUBLE|FLOAT'
+    r'|CHAR\(\d{1,3}\)|VARCHAR\(\d{1,5}\)|TEXT'
+    r'|DATE|DATETIME)$',
+    re.IGNORECASE
+)
+
+
+def _column_type_sql(data_type, sql_type=None):
+    """Physical column type + default for a column_definitions data_type (sql_type overrides the type)."""
+    base, default = _COLUMN_TYPES.get(data_type, _COLUMN_TYPES['str'])
+    if sql_type:
+        base = sql_type.strip().upper()
+        if base == 'TEXT':
+            # TEXT columns cannot have a literal default on older MySQL
+            default = "NULL"
+    return f"{base} {default}"
+
+
+def _invalid_column_types(columns):
+    """Columns whose type or sql_type override is not supported, as error strings."""
+    invalid = []
+    for col in columns:
+        if col.get('type', 'str') not in DATA_TYPES:
+            invalid.append(f"{col['name']}: unknown data type '{col.get('type')}'")
+        elif col.get('sql_type') and not _SQL_TYPE_RE.match(col['sql_type'].strip()):
+            invalid.append(f"{col['name']}: unsupported sql_type '{col['sql_type']}'")
+    return invalid
+
+
+# ALTER TABLE algorithms from cheapest to most expensive. INSTANT only touches
+# metadata, INPLACE rebuilds without blocking writes (LOCK=NONE), COPY copies
+# the whole table and blocks writes while it runs.
+ALTER_ALGORITHMS = ('INSTANT', 'INPLACE', 'COPY')
+# Algorithm not supported for this change (1845/1846) or unknown to the server (1800, e.g. INSTANT on 5.7)
+_ALTER_UNSUPPORTED_ERRNOS = (1800, 1845, 1846)
+
+_active_imports = {}
+_active_imports_lock = threading.Lock()
+# Notified whenever an import starts/ends or a COPY releases its table
+_active_imports_changed = threading.Condition(_active_imports_lock)
+# Tables being rebuilt by ALTER ... ALGORITHM=COPY; imports into them wait until it ends
+_copy_tables = set()
+_schema_jobs = {}
+_schema_jobs_lock = threading.Lock()
+
+
+def _track_import(table_name, delta):
+    """
+    Counts running imports per table (this process), so COPY schema changes
+    can avoid them. An import starting while a COPY holds its table waits
+    for the COPY to finish.
+    """
+    if not table_name: return
+    with _active_imports_changed:
+        if delta > 0:
+            _active_imports_changed.wait_for(lambda: table_name not in _copy_tables)
+        _active_imports[table_name] = _active_imports.get(table_name, 0) + delta
+        if _active_imports[table_name] <= 0:
+            del _active_imports[table_name]
+        _active_imports_changed.notify_all()
 
-    # Load Config from DB
-    configs = get_column_configs(table_name=table_name)
-    if not configs:
-        return False, [f"Failed to load configuration for table {table_name}."]
 
-    connection = get_connection()
-    if not connection:
-        return False, ["Database connection failed."]
+def _imports_running(table_name):
+    with _active_imports_lock:
+        return _active_imports.get(table_name, 0) > 0
 
-    cursor = None
-    try:
-        cursor = connection.cursor(dictionary=True)
-        # Check Filename Validation against Table Config
-        cursor.execute("SELECT allowed_filename FROM import_tables WHERE table_name = %s", (table_name,))
-        table_info = cursor.fetchone()
-        
-        if table_info and table_info['allowed_filename']:
-            allowed_list = [a.strip().lower() for a in table_info['allowed_filename'].split(',') if a.strip()]
-            if allowed_list and name_only_lower not in allowed_list:
-                return False, [f"Filename '{name_only}' does not match any of the configured allowed filenames for table '{table_name}'. Expected one of: {', '.join(allowed_list)}"]
 
-        # Read File
-        df = pd.read_csv(filename, sep=None, engine='python', dtype=str)
+def _acquire_copy_gate(table_name, timeout):
+    """
+    Holds back new imports into table_name once none is running, waiting up
+    to `timeout` seconds for running ones. False if imports are still running.
+    """
+    with _active_imports_changed:
+        idle = _active_imports_changed.wait_for(
+            lambda: not _active_imports.get(table_name) and table_name not in _copy_tables, timeout)
+        if idle:
+            _copy_tables.add(table_name)
+        return idle
 
-        # Normalize Headers
-        df.columns = [str(col).strip().lower() for col in df.columns]
 
-        # Map Columns
-        final_columns = {}
-        missing_columns = []
-        column_mapping = { name: conf['aliases'] for name, conf in configs.items() }
-
-        for key, possible_names in column_mapping.items():
-            found = False
-            for name in possible_names:
-                if name in df.columns:
-                    final_columns[key] = name
-                    found = True
-                    break
-            if not found:
-                missing_columns.append(key)
-        
-        # Check Mandatory
-        missing_required = [col_key for col_key in missing_columns if configs[col_key]['is_mandatory']]
-        if missing_required:
-            return False, [f"Missing mandatory columns: {', '.join(missing_required)}"]
+def _release_copy_gate(table_name):
+    with _active_imports_changed:
+        _copy_tables.discard(table_name)
+        _active_imports_changed.notify_all()
 
-        # Prepare SQL
-        cursor = connection.cursor()
-        insert_keys = [k for k in configs.keys() if k != 'ImportDate']
-        placeholders = ', '.join(['%s'] * len(insert_keys))
-        columns_sql = ', '.join(insert_keys)
 
-        # 1. Condition for ON DUPLICATE KEY UPDATE (if exists)
-        # Only update ImportDate if any of the data columns changed
-        change_conditions = " OR ".join([f"NOT ({col} <=> VALUES({col}))" for col in insert_keys])
-        update_clause = f"ImportDate = IF({change_conditions}, VALUES(ImportDate), ImportDate)"
-        update_clause += ", " + ", ".join([f"{col}=VALUES({col})" for col in insert_keys])
+def add_columns_to_table(table_name, columns, job=None):
+    """
+    Adds several columns to an import table with a single ALTER TABLE, trying
+    ALGORITHM=INSTANT, then INPLACE (LOCK=NONE), then COPY. A COPY is refused
+    while imports into the table are running (after waiting up to
+    SCHEMA_COPY_WAIT_SECONDS); while it runs, imports into the table wait
+    for it to finish. `columns` is a list of
+    {"name", "type", "is_unique", "is_indexed"}.
+    Returns (success, algorithm used or error message).
+    """
+    if not columns:
+        return False, "No columns to add."
+    invalid = _invalid_column_types(columns)
+    if invalid:
+        return False, "; ".join(invalid)
+
+    clauses = []
+    for col in columns:
+        clauses.append(f"ADD COLUMN {col['name']} {_column_type_sql(col.get('type', 'str'), col.get('sql_type'))}")
+        if col.get('is_unique'):
+            clauses.append(f"ADD UNIQUE ({col['name']})")
+        elif col.get('is_indexed'):
+            clauses.append(f"ADD INDEX {_index_name([col['name']])} ({col['name']})")
+    # Adding an index always needs at least INPLACE
+    has_index = any(col.get('is_unique') or col.get('is_indexed') for col in columns)
 
-        # 2. Condition for preventing exact duplicate rows (for tables without unique keys)
-        # We check if an exact match of all columns already exists
-        where_conditions = " AND ".join([f"{col} <=> %s" for col in insert_keys])
-        
-        insert_query = f"""
-            INSERT INTO {table_name} ({columns_sql}, ImportDate) 
-            SELECT {placeholders}, NOW() 
-            FROM DUAL 
-            WHERE NOT EXISTS (
-                SELECT 1 FROM {table_name} 
-                WHERE {where_conditions}
-            )
-            ON DUPLICATE KEY UPDATE {update_clause}
-        """
+    connection = get_connection()
+    if not connection: return False, "Database connection failed."
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT CONNECTION_ID()")
+        if job is not None:
+            job['connection_id'] = cursor.fetchone()[0]
 
-        data_to_insert = []
-        errors = []
-        
-        for index, row in df.iterrows():
-            row_vals = []
-            row_valid = True
-            row_errors = []
-            
-            for key in insert_keys:
-                conf = configs[key]
-                col_ref = final_columns.get(key)
-                val = row[col_ref] if col_ref is not None else None
-
-                # Validation & Cleaning
-                if conf['is_mandatory'] and (pd.isna(val) or str(val).strip() == ''):
-                    row_errors.append(f"Row {index+1}: {key} is missing.")
-                    row_valid = False
-                    break
-                         
-                if pd.notna(val) and str(val).strip() != '':
-                    try:
-                        if conf['data_type'] == 'int':
-                            clean_val = int(float(val))
-                        elif conf['data_type'] == 'date':
-                            try:
-                                clean_val = pd.to_datetime(val, dayfirst=False).strftime('%Y-%m-%d')
-                            except:
-                                clean_val = pd.to_datetime(val, dayfirst=True).strftime('%Y-%m-%d')
-                        elif conf['data_type'] == 'datetime':
-                            try:
-                                clean_val = pd.to_datetime(val, dayfirst=False).strftime('%Y-%m-%d %H:%M:%S')
-                            except:
-                                clean_val = pd.to_datetime(val, dayfirst=True).strftime('%Y-%m-%d %H:%M:%S')
-                        else:
-                            clean_val = str(val)
-                    except Exception:
-                        row_errors.append(f"Row {index+1}: Invalid value for {key} ({val})")
-                        row_valid = False
-                        break
-                else:
-                    clean_val = 0 if conf['data_type'] == 'int' else (None if conf['data_type'] in ['date', 'datetime'] else '')
-                
-                row_vals.append(clean_val)
-            
-            if not row_valid:
-                errors.extend(row_errors)
+        algorithm = None
+        for candidate in ALTER_ALGORITHMS:
+            if candidate == 'INSTANT' and has_index:
                 continue
-            
-            # Pass values twice: once for SELECT, once for WHERE NOT EXISTS
-            data_to_insert.append(tuple(row_vals) + tuple(row_vals))
-
-        if data_to_insert:
-            success_count = 0
-            for vals in data_to_insert:
-                try:
-                    cursor.execute(insert_query, vals)
-                    if cursor.rowcount > 0:
-                        success_count += 1
-                except Exception as e:
-                    errors.append(f"SQL Error: {str(e)}")
-            
-            connection.commit()
-            return True, {"success_count": success_count, "errors": errors}
-        else:
-            return False, errors + ["No valid rows to insert."]
+            if candidate == 'COPY':
+                if job is not None and _imports_running(table_name): job['status'] = 'waiting'
+                if not _acquire_copy_gate(table_name, config.SCHEMA_COPY_WAIT_SECONDS):
+                    return False, (f"Change needs ALGORITHM=COPY (full table copy) and imports into "
+                                   f"{table_name} are running. Retry after they finish.")
+
+            if job is not None:
+                job['status'] = 'running'
+                job['algorithm'] = candidate
+            lock = ", LOCK=NONE" if candidate == 'INPLACE' else ""
+            try:
+                cursor.execute(f"ALTER TABLE {table_name} {', '.join(clauses)}, ALGORITHM={candidate}{lock}")
+                algorithm = candidate
+                break
+            except Error as e:
+                if e.errno not in _ALTER_UNSUPPORTED_ERRNOS:
+                    raise
+            finally:
+                if candidate == 'COPY':
+                    _release_copy_gate(table_name)
+
+        # Register in column_definitions
+        for col in columns:
+            cursor.execute(
+                "INSERT INTO column_definitions (table_name, column_name, is_mandatory, is_unique, data_type) VALUES (%s, %s, %s, %s, %s)",
+                (table_name, col['name'], False, bool(col.get('is_unique')), col.get('type', 'str'))
+            )
 
-    except Exception as e:
-        return False, [f"System Error: {str(e)}"]
+        connection.commit()
+        invalidate_config_cache()
+        return True, algorithm
+    except Error as e:
+        print(f"Error adding columns: {e}")
+        return False, str(e)
     finally:
         if connection and connection.is_connected():
-            if cursor: cursor.close()
+            cursor.close()
             connection.close()
 
 
-def import_dynamic_data(filename):
-    """Auto-detects table based on filename and processes the import."""
-    valid, errs = _check_import_file_basic(filename)
-    if not valid: return False, errs
+def add_column_to_table(table_name, column_name, data_type, is_unique=False, is_indexed=False):
+    """Adds a new column (optionally with a secondary index) to an existing import table."""
+    success, _ = add_columns_to_table(
+        table_name, [{'name': column_name, 'type': data_type, 'is_unique': is_unique, 'is_indexed': is_indexed}])
+    return success
 
-    base_name = os.path.basename(filename)
-    name_only_lower = os.path.splitext(base_name)[0].lower()
 
+def _run_schema_job(job):
+    success, result = add_columns_to_table(job['table_name'], job['columns'], job=job)
+    job['status'] = 'completed' if success else 'failed'
+    # On failure `algorithm` was only the last one tried; report it as failed_at instead
+    job['failed_at'] = None if success else job.get('algorithm')
+    job['algorithm'] = result if success else None
+    job['message'] = f"Added {len(job['columns'])} column(s) with ALGORITHM={result}." if success else result
+    job['progress'] = 100 if success else job.get('progress')
+    job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+
+
+def start_add_columns_job(table_name, columns):
+    """Runs add_columns_to_table in a background thread. Returns the job id to poll with get_schema_job."""
+    job_id = str(uuid.uuid4())
+    job = {
+        'job_id': job_id, 'table_name': table_name, 'columns': columns, 'status': 'queued',
+        'algorithm': None, 'failed_at': None, 'progress': 0, 'message': '', 'connection_id': None,
+        'created_at': datetime.now().isoformat(timespec='seconds'), 'finished_at': None,
+    }
+    with _schema_jobs_lock:
+        _schema_jobs[job_id] = job
+    threading.Thread(target=_run_schema_job, args=(job,), daemon=True).start()
+    return job_id
+
+
+def _alter_progress(connection_id):
+    """Percent done of the ALTER running on `connection_id` (performance_schema stage instruments), or None."""
     connection = get_connection()
-    if not connection: return False, ["Database connection failed."]
-    
+    if not connection: return None
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT table_name, allowed_filename FROM import_tables WHERE allowed_filename != ''")
-        tables = cursor.fetchall()
-        
-        for table in tables:
-            allowed_list = [a.strip().lower() for a in table['allowed_filename'].split(',') if a.strip()]
-            if name_only_lower in allowed_list:
-                return import_file_process(filename, table['table_name'])
-        
-        return False, [f"Filename '{os.path.splitext(base_name)[0]}' does not match any configured table. Update Master Config or select table manually."]
-    except Error as e:
-        return False, [f"Auto-detect Error: {str(e)}"]
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT s.WORK_COMPLETED, s.WORK_ESTIMATED
+            FROM performance_schema.events_stages_current s
+            JOIN performance_schema.threads t ON t.THREAD_ID = s.THREAD_ID
+            WHERE t.PROCESSLIST_ID = %s
+        """, (connection_id,))
+        row = cursor.fetchone()
+        if row and row[1]:
+            return round(100.0 * row[0] / row[1], 1)
+        return None
+    except Error:
+        return None
     finally:
         if connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def extract_zip(zip_path, extract_to):
-    valid_extensions = ['.csv', '.txt']
-    extracted_files = []
 
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zf:
-            zf.extractall(extract_to)
+def get_schema_job(job_id):
+    """Status of a schema change job; progress is refreshed from performance_schema while it runs."""
+    job = _schema_jobs.get(job_id)
+    if job is None:
+        return None
+    if job['status'] == 'running' and job.get('connection_id'):
+        progress = _alter_progress(job['connection_id'])
+        if progress is not None:
+            job['progress'] = progress
+    return {k: v for k, v in job.items() if k != 'connection_id'}
 
-        # Walk extracted directory and collect valid files
-        for root, dirs, files in os.walk(extract_to):
-            # Skip macOS resource fork directories
+
+def get_schema_jobs(limit=20):
+    """Most recent schema change jobs (kept in memory since the app started)."""
+    with _schema_jobs_lock:
+        jobs = sorted(_schema_jobs.values(), key=lambda j: j['created_at'], reverse=True)[:limit]
+    return [get_schema_job(j['job_id']) for j in jobs]
+
+
+INDEX_NAME_MAX = 64
+
+
+def _index_name(columns):
+    """Default name of a secondary index: idx_<col1>_<col2>... (MySQL identifiers max 64 chars)."""
+    return ('idx_' + '_'.join(columns))[:INDEX_NAME_MAX]
+
+
+def _resolve_index_columns(columns, known):
+    """Maps requested index columns onto real column names (case-insensitive). None if any is unknown."""
+    if isinstance(columns, str):
+        columns = columns.split(',')
+    resolved = [known.get(str(c).strip().lower()) for c in columns if str(c).strip()]
+    if not resolved or None in resolved or len(set(resolved)) != len(resolved):
+        return None
+    return resolved
+
+
+def _get_physical_columns(cursor, table_name):
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table_name,)
+    )
+    return {row[0].lower(): row[0] for row in cursor.fetchall()}
+
+
+def add_table_index(table_name, columns, index_name=None):
+    """
+    Creates a secondary (optionally composite) index online
+    (ALGORITHM=INPLACE, LOCK=NONE: reads and writes continue while it builds).
+    """
+    connection = get_connection()
+    if not connection: return False
+    try:
+        cursor = connection.cursor()
+        resolved = _resolve_index_columns(columns, _get_physical_columns(cursor, table_name))
+        if not resolved:
+            print(f"Error adding index: unknown or empty columns {columns} for table {table_name}")
+            return False
+        index_name = index_name or _index_name(resolved)
+        if not index_name.replace('_', '').isalnum() or len(index_name) > INDEX_NAME_MAX:
+            print(f"Error adding index: invalid index name '{index_name}'")
+            return False
+
+        cursor.execute(
+            f"ALTER TABLE {table_name} ADD INDEX {index_name} ({', '.join(resolved)}), ALGORITHM=INPLACE, LOCK=NONE"
+        )
+        return True
+    except Error as e:
+        print(f"Error adding index: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def drop_table_index(table_name, index_name):
+    """Drops a secondary index online. PRIMARY and UNIQUE indexes are managed through column config."""
+    connection = get_connection()
+    if not connection: return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT NON_UNIQUE FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+            (table_name, index_name)
+        )
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            print(f"Error dropping index: '{index_name}' is not a secondary index of {table_name}")
+            return False
+
+        cursor.execute(f"ALTER TABLE {table_name} DROP INDEX {index_name}, ALGORITHM=INPLACE, LOCK=NONE")
+        return True
+    except Error as e:
+        print(f"Error dropping index: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def get_table_indexes(table_name):
+    """
+    Lists the indexes of a table from information_schema.STATISTICS with their
+    columns and cardinality. Usage counters (rows read / fetched through the
+    index since server start) come from performance_schema when it is enabled,
+    otherwise they are None.
+    """
+    connection = get_connection()
+    if not connection: return []
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT INDEX_NAME AS name,
+                   GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) AS columns,
+                   MIN(NON_UNIQUE) = 0 AS is_unique,
+                   MAX(CARDINALITY) AS cardinality
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            GROUP BY INDEX_NAME
+            ORDER BY INDEX_NAME = 'PRIMARY' DESC, INDEX_NAME
+        """, (table_name,))
+        indexes = cursor.fetchall()
+        for index in indexes:
+            index['columns'] = index['columns'].split(',') if index['columns'] else []
+            index['is_unique'] = bool(index['is_unique'])
+            index['rows_read'] = None
+            index['rows_fetched'] = None
+
+        try:
+            cursor.execute("""
+                SELECT INDEX_NAME, COUNT_READ, COUNT_FETCH
+                FROM performance_schema.table_io_waits_summary_by_index_usage
+                WHERE OBJECT_SCHEMA = DATABASE() AND OBJECT_NAME = %s AND INDEX_NAME IS NOT NULL
+            """, (table_name,))
+            usage = {row['INDEX_NAME']: row for row in cursor.fetchall()}
+        except Error:
+            usage = {}
+        for index in indexes:
+            if index['name'] in usage:
+                index['rows_read'] = usage[index['name']]['COUNT_READ']
+                index['rows_fetched'] = usage[index['name']]['COUNT_FETCH']
+        return indexes
+    except Error as e:
+        print(f"Error reading indexes: {e}")
+        return []
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+SUMMARY_SUM_TYPES = ('int', 'decimal', 'float')
+_SUMMARY_NAME_RE = re.compile(r'^[A-Za-z0-9_]{1,64}$')
+_summary_rebuilds = {}
+_summary_rebuilds_lock = threading.Lock()
+
+
+def _read_summary_tables(connection, source_table=None, lock=False):
+    """
+    Summary definitions read through `connection`, [] before
+    migrate_summary_tables.py ran. With lock=True the rows are share-locked
+    until the caller commits, so a summary cannot be added or dropped for
+    `source_table` while an import into it is applying deltas.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        query = "SELECT * FROM summary_tables"
+        params = ()
+        if source_table:
+            query += " WHERE source_table = %s"
+            params = (source_table,)
+        cursor.execute(query + " ORDER BY summary_name" + (" LOCK IN SHARE MODE" if lock else ""), params)
+        rows = cursor.fetchall()
+    except Error as e:
+        if e.errno == 1146:  # summary_tables does not exist yet
+            return []
+        raise
+    finally:
+        cursor.close()
+    for row in rows:
+        row['group_columns'] = [c for c in row['group_columns'].split(',') if c]
+        row['sum_columns'] = [c for c in (row['sum_columns'] or '').split(',') if c]
+    return rows
+
+
+def get_summary_tables(source_table=None):
+    """Declared summary tables (served from the config cache), optionally only those of one import table."""
+    entry = _cached_config(('summaries',), _load_summary_tables)
+    summaries = copy.deepcopy(entry['value']) if entry else []
+    if source_table:
+        summaries = [s for s in summaries if s['source_table'] == source_table]
+    return summaries
+
+
+def _load_summary_tables():
+    connection = get_connection()
+    if not connection: return None
+    try:
+        return _read_summary_tables(connection)
+    except Error as e:
+        print(f"Error loading summary tables: {e}")
+        return None
+    finally:
+        if connection.is_connected():
+            connection.close()
+
+
+def _summary_column_types(table_name):
+    types = {name: conf['data_type'] for name, conf in get_column_configs(table_name=table_name).items()}
+    types['ImportDate'] = 'datetime'
+    return types
+
+
+def _summary_columns(summary):
+    """Columns of a summary table: group_key, the group columns, row_count and one sum_<col> per measure."""
+    return ['group_key'] + summary['group_columns'] + ['row_count'] + [f"sum_{c}" for c in summary['sum_columns']]
+
+
+def _summary_select_sql(summary, types, source):
+    """
+    SELECT of a summary's rows over `source` (caller adds WHERE and
+    "GROUP BY group_key"). Datetime columns are grouped per day. group_key
+    digests the group values NULL-safe, strings by their collation weight so
+    values the source treats as equal ('ab', 'AB') land in one group.
+    """
+    exprs, parts = [], []
+    for col in summary['group_columns']:
+        expr = f"DATE({col})" if types.get(col) == 'datetime' else col
+        exprs.append(expr)
+        if types.get(col) == 'str':
+            parts.append(f"IFNULL(HEX(WEIGHT_STRING({expr})), '\\\\N')")
+        else:
+            parts.append(_digest_column_sql(expr, types.get(col)))
+    select = [f"MD5(CONCAT_WS(CHAR(31 USING utf8mb4), {', '.join(parts)})) AS group_key"]
+    select += [f"ANY_VALUE({expr})" for expr in exprs] + ["COUNT(*)"]
+    select += [f"IFNULL(SUM({col}), 0)" for col in summary['sum_columns']]
+    return f"SELECT {', '.join(select)} FROM {source}"
+
+
+def _rows_by_keys_sql(pairs):
+    """
+    WHERE clause (and params) matching the stored rows that share a value of
+    one of the given unique columns with the given rows; `pairs` is
+    [(rows, columns)]. (None, None) when there is nothing to match.
+    """
+    conditions, params = [], []
+    for rows, columns in pairs:
+        for col in columns:
+            values = rows[col].dropna().unique().tolist()
+            if values:
+                conditions.append(f"{col} IN ({', '.join(['%s'] * len(values))})")
+                params.extend(values)
+    if not conditions:
+        return None, None
+    return " OR ".join(conditions), params
+
+
+def _collect_summary_deltas(cursor, summaries, types, source, where, params, deltas, sign, lock=False):
+    """
+    Adds sign * (row count, sums) of the rows of `source` matching `where`,
+    per summary group, to deltas ({summary_name: {group_key: [group values,
+    row count, [sums]]}}). Locking reads see the latest committed rows, not
+    the snapshot the import transaction started with.
+    """
+    for summary in summaries:
+        cursor.execute(f"{_summary_select_sql(summary, types, source)} WHERE {where} GROUP BY group_key"
+                       + (" FOR UPDATE" if lock else ""), params)
+        groups = deltas.setdefault(summary['summary_name'], {})
+        width = len(summary['group_columns'])
+        for group_key, *row in cursor.fetchall():
+            if isinstance(group_key, (bytes, bytearray)): group_key = group_key.decode('ascii')
+            values, count, sums = row[:width], row[width], row[width + 1:]
+            entry = groups.get(group_key)
+            if entry is None:
+                groups[group_key] = [values, sign * count, [sign * v for v in sums]]
+                continue
+            if sign > 0:
+                entry[0] = values
+            entry[1] += sign * count
+            entry[2] = [total + sign * v for total, v in zip(entry[2], sums)]
+
+
+def _apply_summary_deltas(cursor, summaries, deltas):
+    """
+    Adds accumulated group deltas to the summary tables (part of the caller's
+    transaction). Groups are written in group_key order so concurrent imports
+    lock summary rows in the same order; groups left without rows are removed.
+    """
+    for summary in sorted(summaries, key=lambda s: s['summary_name']):
+        groups = deltas.get(summary['summary_name']) or {}
+        changed = sorted(((key, entry) for key, entry in groups.items() if entry[1] or any(entry[2])),
+                         key=lambda item: item[0])
+        if not changed:
+            continue
+        name = summary['summary_name']
+        columns = _summary_columns(summary)
+        counters = columns[len(summary['group_columns']) + 1:]
+        row_placeholders = f"({', '.join(['%s'] * len(columns))})"
+        updates = ', '.join(f"{col} = {col} + VALUES({col})" for col in counters)
+        for start in range(0, len(changed), config.IMPORT_CHUNK_ROWS):
+            batch = changed[start:start + config.IMPORT_CHUNK_ROWS]
+            params = [v for key, (values, count, sums) in batch for v in (key, *values, count, *sums)]
+            cursor.execute(
+                f"INSERT INTO {name} ({', '.join(columns)}) VALUES {', '.join([row_placeholders] * len(batch))} "
+                f"ON DUPLICATE KEY UPDATE {updates}", params)
+        shrunk = [key for key, entry in changed if entry[1] < 0]
+        if shrunk:
+            cursor.execute(
+                f"DELETE FROM {name} WHERE row_count <= 0 AND group_key IN ({', '.join(['%s'] * len(shrunk))})",
+                shrunk)
+
+
+def add_summary_table(source_table, group_columns, sum_columns=None, summary_name=None):
+    """
+    Declares a summary table over an import table: one row per group of
+    `group_columns` (datetime columns per day) with row_count and
+    sum_<col> for every numeric column in `sum_columns`. Imports keep it up
+    to date; run rebuild_summary_table to fill it with the existing rows.
+    Returns (True, summary name) or (False, message).
+    """
+    if source_table not in {t['table_name'] for t in get_import_tables()}:
+        return False, f"Unknown import table '{source_table}'."
+    types = _summary_column_types(source_table)
+    known = {name.lower(): name for name in types}
+    resolved_groups = _resolve_index_columns(group_columns or [], known)
+    if not resolved_groups:
+        return False, "group_columns must be existing, distinct columns of the table."
+    resolved_sums = []
+    if sum_columns:
+        resolved_sums = _resolve_index_columns(sum_columns, known)
+        if not resolved_sums:
+            return False, "sum_columns must be existing, distinct columns of the table."
+    not_numeric = [c for c in resolved_sums if types[c] not in SUMMARY_SUM_TYPES]
+    if not_numeric:
+        return False, f"sum_columns must be {'/'.join(SUMMARY_SUM_TYPES)} columns: {', '.join(not_numeric)}"
+    summary = {'group_columns': resolved_groups, 'sum_columns': resolved_sums}
+    columns = _summary_columns(summary)
+    if len({c.lower() for c in columns}) != len(columns):
+        return False, "group_columns clash with the row_count/sum_<col> columns of the summary."
+
+    summary_name = summary_name or f"sum_{source_table}_by_{'_'.join(resolved_groups)}"[:INDEX_NAME_MAX]
+    if not _SUMMARY_NAME_RE.match(summary_name):
+        return False, "Summary name may only contain letters, numbers and underscores (max 64)."
+
+    connection = get_connection()
+    if not connection: return False, "Database connection failed."
+    cursor = None
+    created = False
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT COLUMN_NAME, COLUMN_TYPE, NUMERIC_SCALE, COLLATION_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (source_table,))
+        physical = {row[0].lower(): row for row in cursor.fetchall()}
+
+        col_defs = ["group_key CHAR(32) NOT NULL PRIMARY KEY"]
+        for col in resolved_groups:
+            _, column_type, _, collation = physical[col.lower()]
+            if types[col] == 'datetime':
+                col_defs.append(f"{col} DATE NULL")
+            else:
+                col_defs.append(f"{col} {column_type}{f' COLLATE {collation}' if collation else ''} NULL")
+        col_defs.append("row_count BIGINT NOT NULL DEFAULT 0")
+        for col in resolved_sums:
+            if types[col] == 'float':
+                sum_type = "DOUBLE"
+            elif types[col] == 'decimal':
+                sum_type = f"DECIMAL(38,{physical[col.lower()][2] or 0})"
+            else:
+                sum_type = "BIGINT"
+            col_defs.append(f"sum_{col} {sum_type} NOT NULL DEFAULT 0")
+
+        # CREATE TABLE commits implicitly, so the summary is registered only once it exists. The INSERT
+        # waits for running imports of source_table (they share-lock its summary_tables rows).
+        cursor.execute(f"CREATE TABLE {summary_name} ({', '.join(col_defs)})")
+        created = True
+        cursor.execute(
+            "INSERT INTO summary_tables (summary_name, source_table, group_columns, sum_columns) VALUES (%s, %s, %s, %s)",
+            (summary_name, source_table, ','.join(resolved_groups), ','.join(resolved_sums))
+        )
+        connection.commit()
+        invalidate_config_cache()
+        return True, summary_name
+    except Error as e:
+        print(f"Error creating summary table: {e}")
+        if created:
+            connection.rollback()
+            cursor.execute(f"DROP TABLE IF EXISTS {summary_name}")
+        return False, str(e)
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def delete_summary_table(summary_name):
+    """Drops a summary table and its definition. Waits for running imports of its source table."""
+    connection = get_connection()
+    if not connection: return False
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM summary_tables WHERE summary_name = %s", (summary_name,))
+        if cursor.rowcount == 0:
+            return False
+        connection.commit()
+        cursor.execute(f"DROP TABLE IF EXISTS {summary_name}")
+        invalidate_config_cache()
+        return True
+    except Error as e:
+        print(f"Error deleting summary table: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def rebuild_summary_table(summary_name):
+    """
+    Recomputes a summary table from all rows of its source table. The source
+    is locked against writes (LOCK TABLES ... READ) while it is scanned, so
+    imports wait instead of applying deltas the rebuild would miss; readers
+    of the summary wait as well. Returns (True, {"groups", "seconds"}) or
+    (False, message).
+    """
+    summary = next((s for s in get_summary_tables() if s['summary_name'] == summary_name), None)
+    if not summary:
+        return False, f"Unknown summary table '{summary_name}'."
+    source_table = summary['source_table']
+    types = _summary_column_types(source_table)
+
+    started = time.perf_counter()
+    connection = get_connection()
+    if not connection: return False, "Database connection failed."
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"LOCK TABLES {source_table} READ, {summary_name} WRITE")
+        try:
+            cursor.execute(f"DELETE FROM {summary_name}")
+            cursor.execute(f"INSERT INTO {summary_name} ({', '.join(_summary_columns(summary))}) "
+                           f"{_summary_select_sql(summary, types, source_table)} GROUP BY group_key")
+            groups = cursor.rowcount
+            connection.commit()
+        except Error:
+            # UNLOCK TABLES commits, so undo the DELETE first
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        cursor.execute("UPDATE summary_tables SET last_rebuilt_at = NOW() WHERE summary_name = %s", (summary_name,))
+        connection.commit()
+        invalidate_config_cache()
+        return True, {"groups": groups, "seconds": round(time.perf_counter() - started, 3)}
+    except Error as e:
+        print(f"Error rebuilding summary table {summary_name}: {e}")
+        return False, str(e)
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def _run_summary_rebuild(summary_name):
+    success, result = rebuild_summary_table(summary_name)
+    with _summary_rebuilds_lock:
+        _summary_rebuilds[summary_name].update({
+            'status': 'completed' if success else 'failed',
+            'message': f"{result['groups']} groups in {result['seconds']}s" if success else result,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        })
+
+
+def start_summary_rebuild(summary_name):
+    """Runs rebuild_summary_table in a background thread. False if a rebuild of it is already running here."""
+    with _summary_rebuilds_lock:
+        if _summary_rebuilds.get(summary_name, {}).get('status') == 'running':
+            return False
+        _summary_rebuilds[summary_name] = {
+            'status': 'running', 'message': '', 'started_at': datetime.now().isoformat(timespec='seconds'),
+            'finished_at': None,
+        }
+    threading.Thread(target=_run_summary_rebuild, args=(summary_name,), daemon=True).start()
+    return True
+
+
+def get_summary_rebuild(summary_name):
+    """Last background rebuild of a summary started by this process, or None."""
+    with _summary_rebuilds_lock:
+        rebuild = _summary_rebuilds.get(summary_name)
+        return dict(rebuild) if rebuild else None
+
+
+def get_summary_rows(summary_name, filters=None, limit=None):
+    """
+    Rows of a summary table ordered by its group columns, filtered like
+    GET /api/tables/<name>/rows (see _filter_sql) on group columns,
+    row_count and the sums. Returns (True, {"columns", "rows", "truncated"})
+    or (False, message).
+    """
+    summary = next((s for s in get_summary_tables() if s['summary_name'] == summary_name), None)
+    if not summary:
+        return False, f"Unknown summary table '{summary_name}'."
+    source_types = _summary_column_types(summary['source_table'])
+    types = {col: 'date' if source_types.get(col) == 'datetime' else source_types.get(col, 'str')
+             for col in summary['group_columns']}
+    types['row_count'] = 'int'
+    types.update({f"sum_{col}": source_types[col] for col in summary['sum_columns']})
+    ok, filtered = _filter_sql(filters, types)
+    if not ok:
+        return False, filtered
+    conditions, params = filtered
+
+    limit = limit or config.ROWS_PAGE_MAX
+    columns = _summary_columns(summary)[1:]
+    sql = f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM {summary_name}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {', '.join(summary['group_columns'])} LIMIT %s"
+
+    connection = get_connection()
+    if not connection: return False, "Database connection failed."
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql, tuple(params) + (limit + 1,))
+        rows = cursor.fetchall()
+        return True, {"columns": columns, "rows": rows[:limit], "truncated": len(rows) > limit}
+    except Error as e:
+        return False, str(e)
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def _check_import_file_basic(filename):
+    """Basic validation for file existence and extension."""
+    if not os.path.exists(filename):
+        return False, ["File not found."]
+    _, extension = os.path.splitext(filename)
+    if extension.lower() not in ['.csv', '.txt']:
+        return False, [f"Unsupported file extension '{extension}'. Only .csv and .txt are allowed."]
+    return True, None
+
+
+def _map_columns(columns, configs):
+    """Maps config column names to the file headers matching one of their aliases."""
+    final_columns = {}
+    missing_columns = []
+    for key, conf in configs.items():
+        for name in conf['aliases']:
+            if name in columns:
+                final_columns[key] = name
+                break
+        else:
+            missing_columns.append(key)
+    return final_columns, missing_columns
+
+
+_DIGEST_SEPARATOR = '\x1f'
+_DIGEST_NULL = '\\N'  # MySQL's own NULL marker in text exports
+
+
+def _digest_column_sql(col, data_type):
+    value = f"CAST({col} AS CHAR)"
+    if data_type == 'decimal':
+        # DECIMAL prints its full scale ('12.5000'); strip it like _normalize_number does
+        value = f"IF(INSTR({value}, '.'), TRIM(TRAILING '.' FROM TRIM(TRAILING '0' FROM {value})), {value})"
+    return f"IFNULL({value}, '\\\\N')"
+
+
+def _row_digest_sql(columns, types=None):
+    """SQL expression computing the same digest as _row_digests for a stored row."""
+    types = types or {}
+    parts = ', '.join(_digest_column_sql(col, types.get(col)) for col in columns)
+    return f"MD5(CONCAT_WS(CHAR(31 USING utf8mb4), {parts}))"
+
+
+def _normalize_number(value):
+    """Decimal/float text as MySQL prints it once trailing zeros are stripped ('12.50' -> '12.5', '3.0' -> '3')."""
+    try:
+        return format(Decimal(str(value)).normalize(), 'f')
+    except (InvalidOperation, ValueError):
+        return str(value)
+
+
+def _row_digests(frame, columns, types=None):
+    """MD5 over the cleaned values of each row (NULL-safe), matching _row_digest_sql."""
+    types = types or {}
+    parts = []
+    for col in columns:
+        values = frame[col]
+        if types.get(col) in ('decimal', 'float'):
+            values = values.map(_normalize_number, na_action='ignore')
+        parts.append(values.where(values.notna(), _DIGEST_NULL).astype(str))
+    joined = parts[0].str.cat(parts[1:], sep=_DIGEST_SEPARATOR) if len(parts) > 1 else parts[0]
+    return pd.Series([hashlib.md5(v.encode('utf-8')).hexdigest() for v in joined], index=frame.index)
+
+
+def _split_chunk(cursor, table_name, chunk, insert_keys, key_column, types=None):
+    """
+    Prefetches the stored rows for the keys in `chunk` (one IN query) and
+    splits it into (new rows, changed rows, other rows, unchanged count).
+    Rows with an empty key or a key repeated within the chunk end up in
+    `other` so they keep going through the row-by-row upsert in file order.
+    Unchanged rows (same digest as stored) are dropped.
+    """
+    keys = chunk[key_column].where(chunk[key_column].notna(), '').astype(str)
+    other = (keys == '') | keys.duplicated(keep=False)
+    lookup = [k for k in keys[~other].unique()]
+
+    existing = {}
+    if lookup:
+        placeholders = ', '.join(['%s'] * len(lookup))
+        cursor.execute(
+            f"SELECT CAST({key_column} AS CHAR), {_row_digest_sql(insert_keys, types)} FROM {table_name} "
+            f"WHERE {key_column} IN ({placeholders})",
+            lookup
+        )
+        for key, digest in cursor.fetchall():
+            if isinstance(key, (bytes, bytearray)): key = key.decode('utf-8')
+            if isinstance(digest, (bytes, bytearray)): digest = digest.decode('ascii')
+            existing[key] = digest
+
+    stored = keys.map(existing)
+    found = stored.notna() & ~other
+    unchanged = pd.Series(False, index=chunk.index)
+    if found.any():
+        unchanged[found] = _row_digests(chunk[found], insert_keys, types) == stored[found]
+
+    new_rows = chunk[~other & ~found]
+    changed_rows = chunk[found & ~unchanged]
+    return new_rows, changed_rows, chunk[other], int(unchanged.sum())
+
+
+def _upsert_update_clause(insert_keys, target=None):
+    """
+    ON DUPLICATE KEY UPDATE clause; ImportDate only moves if any of the data
+    columns changed. Pass the `target` table for INSERT ... SELECT, where the
+    selected table has the same column names and bare names are ambiguous.
+    """
+    t = f"{target}." if target else ""
+    change_conditions = " OR ".join([f"NOT ({t}{col} <=> VALUES({col}))" for col in insert_keys])
+    update_clause = f"{t}ImportDate = IF({change_conditions}, VALUES(ImportDate), {t}ImportDate)"
+    return update_clause + ", " + ", ".join([f"{t}{col}=VALUES({col})" for col in insert_keys])
+
+
+def _compare_stored(cursor, table_name, insert_keys, unique_keys, row):
+    """
+    'inserted', 'updated' or 'unchanged': what upserting `row` into
+    table_name would do, judged by the stored row sharing a unique value.
+    """
+    values = dict(zip(insert_keys, row))
+    keys = [k for k in unique_keys if not pd.isna(values[k])]
+    if not keys:
+        return 'inserted'
+    same = " AND ".join(f"{col} <=> %s" for col in insert_keys)
+    cursor.execute(f"SELECT MIN({same}) FROM {table_name} WHERE {' OR '.join(f'{k} = %s' for k in keys)}",
+                   tuple(row) + tuple(values[k] for k in keys))
+    (match,) = cursor.fetchall()[0]
+    if match is None:
+        return 'inserted'
+    return 'unchanged' if match else 'updated'
+
+
+def _bulk_write(cursor, sql_prefix, rows, row_placeholders, sql_suffix=''):
+    """Writes `rows` with a single multi-row INSERT. Returns cursor.rowcount."""
+    values = ', '.join([row_placeholders] * len(rows))
+    params = [v for row in rows.itertuples(index=False, name=None) for v in row]
+    cursor.execute(f"{sql_prefix} VALUES {values} {sql_suffix}", params)
+    return cursor.rowcount
+
+
+def import_file_process(filename, table_name, batch_id=None, timer=None, write_table=None):
+    """
+    Generic import function for a specific table.
+    Errors are returned aggregated per (column, error kind); when a batch_id
+    is given the full rejected rows are written to a gzip side file.
+    Stage durations are recorded on `timer` (a metrics.StageTimer).
+    With `write_table` (a staging copy of table_name, see atomic batches) rows
+    are still compared against table_name but written to write_table, and
+    the counts describe what promoting them into table_name will do.
+    """
+    valid, errs = _check_import_file_basic(filename)
+    if not valid: return False, errs
+
+    timer = timer or metrics.StageTimer()
+    base_name = os.path.basename(filename)
+    name_only, _ = os.path.splitext(base_name)
+    name_only_lower = name_only.lower()
+
+    # Load Config from DB
+    with timer.stage('load_config'):
+        configs = get_column_configs(table_name=table_name)
+    if not configs:
+        return False, [f"Failed to load configuration for table {table_name}."]
+
+    connection = get_connection()
+    if not connection:
+        return False, ["Database connection failed."]
+
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        # Check Filename Validation against Table Config
+        cursor.execute("SELECT allowed_filename FROM import_tables WHERE table_name = %s", (table_name,))
+        table_info = cursor.fetchone()
+        
+        if table_info and table_info['allowed_filename']:
+            allowed_list = [a.strip().lower() for a in table_info['allowed_filename'].split(',') if a.strip()]
+            if allowed_list and name_only_lower not in allowed_list:
+                return False, [f"Filename '{name_only}' does not match any of the configured allowed filenames for table '{table_name}'. Expected one of: {', '.join(allowed_list)}"]
+
+        # Read File
+        with timer.stage('read_csv'):
+            df = csv_utils.read_csv(filename)
+        timer.info['encoding'] = df.attrs.get('encoding')
+
+        # Normalize Headers
+        df.columns = [str(col).strip().lower() for col in df.columns]
+
+        # Map Columns
+        final_columns, missing_columns = _map_columns(df.columns, configs)
+        
+        # Check Mandatory
+        missing_required = [col_key for col_key in missing_columns if configs[col_key]['is_mandatory']]
+        if missing_required:
+            return False, [f"Missing mandatory columns: {', '.join(missing_required)}"]
+
+        # Prepare SQL
+        cursor = connection.cursor()
+        summaries = []
+        staged = write_table not in (None, table_name)
+        if not staged:
+            # Summary tables follow the rows in this transaction (staging copies are summarized when promoted)
+            summaries = _read_summary_tables(connection, table_name, lock=True)
+        write_table = write_table or table_name
+        insert_keys = [k for k in configs.keys() if k != 'ImportDate']
+        placeholders = ', '.join(['%s'] * len(insert_keys))
+        columns_sql = ', '.join(insert_keys)
+
+        # 1. Condition for ON DUPLICATE KEY UPDATE (if exists)
+        update_clause = _upsert_update_clause(insert_keys)
+
+        # 2. Condition for preventing exact duplicate rows (for tables without unique keys)
+        # We check if an exact match of all columns already exists
+        where_conditions = " AND ".join([f"{col} <=> %s" for col in insert_keys])
+        # Staged rows must be new to the staging copy and to the real table
+        probe_tables = [write_table, table_name] if staged else [write_table]
+        not_exists = " AND ".join(f"NOT EXISTS (SELECT 1 FROM {t} WHERE {where_conditions})" for t in probe_tables)
+
+        insert_query = f"""
+            INSERT INTO {write_table} ({columns_sql}, ImportDate) 
+            SELECT {placeholders}, NOW() 
+            FROM DUAL 
+            WHERE {not_exists}
+            ON DUPLICATE KEY UPDATE {update_clause}
+        """
+
+        # Validate & clean all rows at once
+        with timer.stage('clean'):
+            clean, errors = _validate_frame(df, configs, final_columns)
+            bad_index = df.index[errors['row'].unique() - 1] if not errors.empty else df.index[:0]
+            valid_rows = clean.drop(index=bad_index)[insert_keys].astype(object)
+
+        # 3. Lean multi-row statements for tables with a unique key: brand-new keys are
+        # plain INSERTs, keys already stored reuse the ON DUPLICATE KEY UPDATE clause
+        # (so ImportDate still only moves when data changed) without the NOT EXISTS probe.
+        row_placeholders = f"({placeholders}, NOW())"
+        bulk_insert_prefix = f"INSERT INTO {write_table} ({columns_sql}, ImportDate)"
+        bulk_update_suffix = f"ON DUPLICATE KEY UPDATE {update_clause}"
+
+        # Chunks are split on the first unique column: unchanged rows are skipped client-side
+        key_column = next((k for k in insert_keys if configs[k]['is_unique']), None)
+        column_types = {k: configs[k]['data_type'] for k in insert_keys}
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        sql_errors = []
+        latencies = []
+
+        # Summary deltas: rows reachable through a unique column are aggregated before and after each
+        # chunk is written; rows without any unique value can only be inserted and are tracked by id
+        unique_keys = [k for k in insert_keys if configs[k]['is_unique']]
+        unique_positions = [insert_keys.index(k) for k in unique_keys]
+        summary_types = dict(column_types, ImportDate='datetime')
+        summary_deltas = {}
+        inserted_ids = []
+
+        def collect_deltas(pairs, sign):
+            where, params = _rows_by_keys_sql(pairs)
+            if where:
+                with timer.stage('summary'):
+                    _collect_summary_deltas(cursor, summaries, summary_types, table_name, where, params,
+                                            summary_deltas, sign, lock=True)
+
+        def upsert_rows(rows):
+            for index, *row_vals in rows.itertuples(index=True, name=None):
+                started = time.perf_counter()
+                try:
+                    # Pass values once for SELECT and once per WHERE NOT EXISTS
+                    cursor.execute(insert_query, tuple(row_vals) * (1 + len(probe_tables)))
+                    # rowcount: 1 = inserted, 2 = updated, 0 = identical row already there
+                    outcome = {1: 'inserted', 2: 'updated'}.get(cursor.rowcount, 'unchanged')
+                    if staged and outcome == 'inserted' and unique_keys:
+                        # New to staging only; the stored row decides what promotion will do
+                        outcome = _compare_stored(cursor, table_name, insert_keys, unique_keys, row_vals)
+                    counts[outcome] += 1
+                    if summaries and cursor.rowcount == 1 and all(pd.isna(row_vals[i]) for i in unique_positions):
+                        inserted_ids.append(cursor.lastrowid)
+                except Exception as e:
+                    sql_errors.append({'row': index + 1, 'column': '*', 'error': 'sql_error', 'value': str(e)})
+                latencies.append(time.perf_counter() - started)
+
+        def bulk_rows(stage, rows, sql_suffix=''):
+            # A failed multi-row statement is rolled back as a whole; retry row by row
+            # so a single bad row (e.g. a clash on another unique column) is reported alone.
+            with timer.stage(stage):
+                started = time.perf_counter()
+                try:
+                    rowcount = _bulk_write(cursor, bulk_insert_prefix, rows, row_placeholders, sql_suffix)
+                except Exception:
+                    rowcount = None
+                latencies.append(time.perf_counter() - started)
+            if rowcount is None:
+                with timer.stage('upsert'):
+                    upsert_rows(rows)
+            return rowcount
+
+        for start in range(0, len(valid_rows), config.IMPORT_CHUNK_ROWS):
+            chunk = valid_rows.iloc[start:start + config.IMPORT_CHUNK_ROWS]
+            if not key_column:
+                with timer.stage('upsert'):
+                    upsert_rows(chunk)
+                continue
+
+            with timer.stage('prefetch'):
+                new_rows, changed_rows, other_rows, skipped = _split_chunk(
+                    cursor, table_name, chunk, insert_keys, key_column, column_types)
+            counts['unchanged'] += skipped
+            if summaries:
+                # Stored versions of the rows about to change, in one OR query so a stored row matched through
+                # several unique values counts once. New rows are matched on every unique column too: the
+                # prefetch compares keys as text ('ABC' vs stored 'abc'), and its locks cover racing imports.
+                collect_deltas([(rows, unique_keys) for rows in (changed_rows, other_rows, new_rows)], -1)
+
+            if not new_rows.empty and bulk_rows('bulk_insert', new_rows) is not None:
+                counts['inserted'] += len(new_rows)
+            if not changed_rows.empty:
+                rowcount = bulk_rows('bulk_update', changed_rows, bulk_update_suffix)
+                if rowcount is not None and staged:
+                    # Staging starts empty, so these are inserts there; the prefetch found them changed
+                    counts['updated'] += len(changed_rows)
+                elif rowcount is not None:
+                    # Multi-row ODKU rowcount: 2 per updated row, 1 per (racing) insert, 0 if equal
+                    updated, inserted = divmod(max(rowcount, 0), 2)
+                    counts['updated'] += updated
+                    counts['inserted'] += inserted
+                    counts['unchanged'] += max(len(changed_rows) - updated - inserted, 0)
+            if not other_rows.empty:
+                with timer.stage('upsert'):
+                    upsert_rows(other_rows)
+            if summaries:
+                collect_deltas([(rows, unique_keys) for rows in (new_rows, changed_rows, other_rows)], 1)
+        metrics.observe_many('import_db_statement_seconds', latencies, table=table_name)
+        success_count = counts['inserted'] + counts['updated']
+
+        if sql_errors:
+            errors = pd.concat([errors, pd.DataFrame(sql_errors)], ignore_index=True)
+        errors = errors.sort_values('row', kind='stable')
+        error_summary = _summarize_errors(errors)
+        error_rows = int(errors['row'].nunique())
+
+        rejected_file = None
+        if batch_id and error_rows:
+            with timer.stage('rejected_rows'):
+                rejected_file = _write_rejected_rows(df, errors, batch_id, base_name)
+
+        timer.rows.update({'read': len(df), 'error': error_rows, **counts})
+        if valid_rows.empty:
+            return False, _format_error_summary(error_summary) + ["No valid rows to insert."]
+
+        if summaries:
+            with timer.stage('summary'):
+                for start in range(0, len(inserted_ids), config.IMPORT_CHUNK_ROWS):
+                    ids = inserted_ids[start:start + config.IMPORT_CHUNK_ROWS]
+                    _collect_summary_deltas(cursor, summaries, summary_types, table_name,
+                                            f"id IN ({', '.join(['%s'] * len(ids))})", ids, summary_deltas, 1)
+                _apply_summary_deltas(cursor, summaries, summary_deltas)
+
+        with timer.stage('commit'):
+            connection.commit()
+
+        timer.export('import_stage_seconds', table=table_name)
+        metrics.inc('import_rows_total', success_count, table=table_name, result='success')
+        metrics.inc('import_rows_total', error_rows, table=table_name, result='error')
+        if timer.total() > 0:
+            metrics.observe('import_rows_per_second', len(df) / timer.total(),
+                            buckets=metrics.ROWS_PER_SEC_BUCKETS, table=table_name)
+        return True, {"success_count": success_count, **counts, "errors": error_summary, "error_rows": error_rows,
+                      "rejected_file": rejected_file, "table_name": table_name, "metrics": timer.as_dict()}
+
+    except Exception as e:
+        return False, [f"System Error: {str(e)}"]
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def import_dynamic_data(filename, batch_id=None, timer=None):
+    """Auto-detects table based on filename and processes the import."""
+    valid, errs = _check_import_file_basic(filename)
+    if not valid: return False, errs
+
+    base_name = os.path.basename(filename)
+    name_only_lower = os.path.splitext(base_name)[0].lower()
+
+    connection = get_connection()
+    if not connection: return False, ["Database connection failed."]
+    
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT table_name, allowed_filename FROM import_tables WHERE allowed_filename != ''")
+        tables = cursor.fetchall()
+        
+        for table in tables:
+            allowed_list = [a.strip().lower() for a in table['allowed_filename'].split(',') if a.strip()]
+            if name_only_lower in allowed_list:
+                return import_file_process(filename, table['table_name'], batch_id=batch_id, timer=timer)
+        
+        return False, [f"Filename '{os.path.splitext(base_name)[0]}' does not match any configured table. Update Master Config or select table manually."]
+    except Error as e:
+        return False, [f"Auto-detect Error: {str(e)}"]
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+UPLOAD_BLOCK_BYTES = 1024 * 1024
+
+
+def _copy_hashed(source, target_path):
+    """Copies a binary stream to target_path block by block. Returns its SHA-256 hex digest."""
+    digest = hashlib.sha256()
+    with open(target_path, 'wb') as out:
+        for block in iter(lambda: source.read(UPLOAD_BLOCK_BYTES), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+def save_upload(file_storage, filepath):
+    """Saves an uploaded file (werkzeug FileStorage) and hashes it in the same pass. Returns the SHA-256."""
+    return _copy_hashed(file_storage.stream, filepath)
+
+
+def extract_zip(zip_path, extract_to, file_hashes=None):
+    """
+    Extracts the data files of a ZIP. When `file_hashes` (a dict) is given,
+    members are extracted block by block and hashed on the way
+    ({extracted path: sha256}).
+    """
+    valid_extensions = ['.csv', '.txt']
+    extracted_files = []
+
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            if file_hashes is None:
+                zf.extractall(extract_to)
+            else:
+                root = os.path.realpath(extract_to)
+                for member in zf.infolist():
+                    target = os.path.realpath(os.path.join(root, member.filename))
+                    # Same traversal guard as extractall: nothing outside extract_to
+                    if member.is_dir() or not target.startswith(root + os.sep):
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zf.open(member) as source:
+                        file_hashes[target] = _copy_hashed(source, target)
+
+        # Walk extracted directory and collect valid files
+        for root, dirs, files in os.walk(extract_to):
+            # Skip macOS resource fork directories
             dirs[:] = [d for d in dirs if d != '__MACOSX']
             for fname in files:
                 # Skip hidden/resource fork files
@@ -565,19 +2005,36 @@ def import_multiple_files(file_paths, table_name='auto'):
 # "Validation Process": 4,
 # "Validasi Sukses": 5,
 # "Validasi Failed": 6,
+# "Duplicate": 7,
 # "Processing Failed": 8,
 # "Processing Complete": 9,
 
-def create_import_job(batch_id, filename, dist_id=None, file_size=None, user_id=None):
-    """Creates a new import job record in the database."""
+def create_import_job(batch_id, filename, dist_id=None, file_size=None, user_id=None, file_hash=None,
+                      table_name=None, status='3'):
+    """
+    Creates a new import job record in the database.
+    file_hash/table_name feed duplicate-upload detection (find_duplicate_upload).
+    """
     print(f"Creating job for batch_id: {batch_id}, filename: {filename}")
     connection = get_connection()
     if not connection: return None
     try:
         cursor = connection.cursor()
+        params = (filename, filename, file_size, status, batch_id, dist_id, user_id)
+        if file_hash:
+            try:
+                cursor.execute(
+                    "INSERT INTO upload_logs (file_type, file_name, file_size, status, file_name_zip, distid, user_id, file_hash, table_name, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())",
+                    params + (file_hash, table_name)
+                )
+                connection.commit()
+                return batch_id
+            except Error as e:
+                if e.errno != 1054: # Unknown column: migrate_upload_logs_hash.py not run yet
+                    raise
         cursor.execute(
-            "INSERT INTO upload_logs (file_type, file_name, file_size, status, file_name_zip, distid, user_id, created_at) VALUES (%s, %s, %s, '3', %s, %s, %s, NOW())",
-            (filename, filename, file_size, batch_id, dist_id, user_id)
+            "INSERT INTO upload_logs (file_type, file_name, file_size, status, file_name_zip, distid, user_id, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())",
+            params
         )
         connection.commit()
         return batch_id
@@ -591,7 +2048,8 @@ def create_import_job(batch_id, filename, dist_id=None, file_size=None, user_id=
 
 
 def update_job_status(batch_id, filename=None, status=None, total_rows=None, processed_rows=None,
-                      success_count=None, error_count=None, error_details=None, message=None, notes=None, link_file=None):
+                      success_count=None, error_count=None, error_details=None, message=None, notes=None, link_file=None,
+                      stage_metrics=None):
     """Updates the status of an import job (or specific file in a batch)."""
     connection = get_connection()
     if not connection: return False
@@ -635,6 +2093,10 @@ def update_job_status(batch_id, filename=None, status=None, total_rows=None, pro
             updates.append("link_file = %s")
             params.append(link_file)
 
+        if stage_metrics:
+            updates.append("stage_metrics = %s")
+            params.append(json.dumps(stage_metrics))
+
         if not updates:
             return True
 
@@ -849,120 +2311,421 @@ def get_job_file_details(batch_id):
             connection.close()
 
 
-def quick_validate_file(filepath, table_name, dist_id=None):
+def _detect_table_for_file(filepath):
+    """Resolves the target table from the filename via allowed_filename. Returns (table_name, error)."""
+    name_only = os.path.splitext(os.path.basename(filepath))[0].lower()
+
+    connection = get_connection()
+    if not connection: return None, "DB connection failed"
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT table_name, allowed_filename FROM import_tables WHERE allowed_filename != ''")
+        tables = cursor.fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    for t in tables:
+        allowed_list = [a.strip().lower() for a in t['allowed_filename'].split(',') if a.strip()]
+        if name_only in allowed_list:
+            return t['table_name'], None
+    return None, f"Filename '{name_only}' not recognized."
+
+
+def quick_validate_file(filepath, table_name, dist_id=None, timer=None):
     """
     Quick validation: checks file extension, headers, and basic rules.
+    Only the header and the first QUICK_VALIDATE_SAMPLE_ROWS rows are parsed;
+    the row count comes from a memory-mapped newline scan.
+    Stage durations are recorded on `timer` (a metrics.StageTimer).
     """
+    timer = timer or metrics.StageTimer()
+    try:
+        return _quick_validate_file(filepath, table_name, dist_id, timer)
+    finally:
+        timer.export('quick_validate_stage_seconds')
+
+
+def _validate_sample(df, configs, dist_id=None):
+    """Checks mandatory headers, dist_id prefix and types on the sample rows. Returns an error message or None."""
+    # Check mandatory column headers exist
+    column_mapping = {name: conf['aliases'] for name, conf in configs.items()}
+    missing_required = []
+
+    for key, possible_names in column_mapping.items():
+        if configs[key]['is_mandatory']:
+            found = any(name in df.columns for name in possible_names)
+            if not found:
+                missing_required.append(key)
+
+    if missing_required:
+        return f"Missing mandatory columns: {', '.join(missing_required)}"
+
+    # dist_id prefix validation (first 2 digits)
+    if dist_id and str(dist_id).strip():
+        target_prefix = str(dist_id).strip()[:2]
+        
+        # Find the actual column in DF that maps to 'distid' (database column name)
+        distid_col_in_df = None
+        # We look for 'distid' key in configs or any case-insensitive variation if 'distid' is common
+        search_key = 'DISTID'
+        if search_key in configs:
+            aliases = configs[search_key]['aliases']
+            for alias in aliases:
+                if alias in df.columns:
+                    distid_col_in_df = alias
+                    break
+        
+        if distid_col_in_df:
+            # Check first 5 rows for prefix match
+            sample_dist = df.head(5)[distid_col_in_df].dropna().astype(str)
+            for val in sample_dist:
+                val_clean = val.strip()
+                if val_clean and val_clean[:2] != target_prefix:
+                    return f"DistID value does not match expected prefix '{target_prefix}' for dist_id '{dist_id}'. Found value: '{val_clean}'"
+
+    # Validate first 2 data rows (basic type check)
+    sample = df.head(2)
+    row_errors = []
+
+    for idx, row in sample.iterrows():
+        for key, conf in configs.items():
+            aliases = conf['aliases']
+            val = None
+            for alias in aliases:
+                if alias in sample.columns:
+                    val = row[alias]
+                    break
+
+            if val is None or (pd.isna(val) and conf['is_mandatory']):
+                if conf['is_mandatory']:
+                    row_errors.append(f"Row {idx+1}: {key} is missing.")
+                continue
+
+            if pd.notna(val) and str(val).strip() != '':
+                if conf['data_type'] == 'int':
+                    try:
+                        int(float(val))
+                    except (ValueError, TypeError):
+                        row_errors.append(f"Row {idx+1}: {key} must be integer, got '{val}'.")
+                elif conf['data_type'] == 'date':
+                    try:
+                        pd.to_datetime(val, errors='raise')
+                    except:
+                        row_errors.append(f"Row {idx+1}: {key} invalid date format '{val}'.")
+                elif conf['data_type'] in ('decimal', 'float'):
+                    try:
+                        float(val)
+                    except (ValueError, TypeError):
+                        row_errors.append(f"Row {idx+1}: {key} must be a number, got '{val}'.")
+                elif conf['data_type'] == 'bool':
+                    if str(val).strip().lower() not in BOOL_TRUE_VALUES | BOOL_FALSE_VALUES:
+                        row_errors.append(f"Row {idx+1}: {key} must be true/false, got '{val}'.")
+
+    if row_errors:
+        return f"Validation errors in sample rows: {'; '.join(row_errors)}"
+    return None
+
+
+def _quick_validate_file(filepath, table_name, dist_id, timer):
     valid, errs = _check_import_file_basic(filepath)
     if not valid: return False, errs[0], 0
 
     try:
-        df = pd.read_csv(filepath, sep=None, engine='python', dtype=str)
+        with timer.stage('read_sample'):
+            encoding = csv_utils.detect_encoding(filepath)
+            sep = csv_utils.sniff_delimiter(filepath, encoding=encoding)
+            df = csv_utils.read_csv(filepath, sep=sep, nrows=config.QUICK_VALIDATE_SAMPLE_ROWS, encoding=encoding)
+        timer.info['encoding'] = encoding
         if df.empty: return False, "File is empty.", 0
-        total_rows = len(df)
+        with timer.stage('count_rows'):
+            total_rows = csv_utils.count_rows(filepath, encoding=encoding)
+        timer.rows['total'] = total_rows
 
         # Normalize headers
         df.columns = [str(col).strip().lower() for col in df.columns]
 
         # Auto-detect if needed
         if not table_name or table_name == 'auto':
-            base_name = os.path.basename(filepath)
-            name_only = os.path.splitext(base_name)[0].lower()
-            
-            connection = get_connection()
-            if not connection: return False, "DB connection failed", 0
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT table_name, allowed_filename FROM import_tables WHERE allowed_filename != ''")
-            tables = cursor.fetchall()
-            
-            target_table = None
-            for t in tables:
-                allowed_list = [a.strip().lower() for a in t['allowed_filename'].split(',') if a.strip()]
-                if name_only in allowed_list:
-                    target_table = t['table_name']
-                    break
-            
-            if not target_table:
-                return False, f"Filename '{name_only}' not recognized.", 0
-            table_name = target_table
+            with timer.stage('detect_table'):
+                table_name, error_msg = _detect_table_for_file(filepath)
+            if not table_name:
+                return False, error_msg, 0
 
-        configs = get_column_configs(table_name=table_name)
+        with timer.stage('load_config'):
+            configs = get_column_configs(table_name=table_name)
         if not configs:
             return False, f"No column configuration found for table '{table_name}'.", 0
 
-        # Check mandatory column headers exist
-        column_mapping = {name: conf['aliases'] for name, conf in configs.items()}
-        missing_required = []
+        with timer.stage('validate'):
+            error_msg = _validate_sample(df, configs, dist_id)
+        if error_msg:
+            return False, error_msg, total_rows
 
-        for key, possible_names in column_mapping.items():
-            if configs[key]['is_mandatory']:
-                found = any(name in df.columns for name in possible_names)
-                if not found:
-                    missing_required.append(key)
+        return True, None, total_rows
 
-        if missing_required:
-            return False, f"Missing mandatory columns: {', '.join(missing_required)}", total_rows
+    except Exception as e:
+        return False, f"Error reading file: {str(e)}", 0
 
-        # dist_id prefix validation (first 2 digits)
-        if dist_id and str(dist_id).strip():
-            target_prefix = str(dist_id).strip()[:2]
-            
-            # Find the actual column in DF that maps to 'distid' (database column name)
-            distid_col_in_df = None
-            # We look for 'distid' key in configs or any case-insensitive variation if 'distid' is common
-            search_key = 'DISTID'
-            if search_key in configs:
-                aliases = configs[search_key]['aliases']
-                for alias in aliases:
-                    if alias in df.columns:
-                        distid_col_in_df = alias
-                        break
-            
-            if distid_col_in_df:
-                # Check first 5 rows for prefix match
-                sample_dist = df.head(5)[distid_col_in_df].dropna().astype(str)
-                for val in sample_dist:
-                    val_clean = val.strip()
-                    if val_clean and val_clean[:2] != target_prefix:
-                        return False, f"DistID value does not match expected prefix '{target_prefix}' for dist_id '{dist_id}'. Found value: '{val_clean}'", total_rows
-
-        # Validate first 2 data rows (basic type check)
-        sample = df.head(2)
-        row_errors = []
-
-        for idx, row in sample.iterrows():
-            for key, conf in configs.items():
-                aliases = conf['aliases']
-                val = None
-                for alias in aliases:
-                    if alias in sample.columns:
-                        val = row[alias]
-                        break
-
-                if val is None or (pd.isna(val) and conf['is_mandatory']):
-                    if conf['is_mandatory']:
-                        row_errors.append(f"Row {idx+1}: {key} is missing.")
-                    continue
+# ==================== FULL VALIDATION (DRY RUN) ====================
 
-                if pd.notna(val) and str(val).strip() != '':
-                    if conf['data_type'] == 'int':
-                        try:
-                            int(float(val))
-                        except (ValueError, TypeError):
-                            row_errors.append(f"Row {idx+1}: {key} must be integer, got '{val}'.")
-                    elif conf['data_type'] == 'date':
-                        try:
-                            pd.to_datetime(val, errors='raise')
-                        except:
-                            row_errors.append(f"Row {idx+1}: {key} invalid date format '{val}'.")
-
-        if row_errors:
-            return False, f"Validation errors in sample rows: {'; '.join(row_errors)}", total_rows
+def _parse_dates(values):
+    """
+    Vectorized equivalent of the per-value pd.to_datetime fallback used on import:
+    the format inferred from the first value, then mixed month-first, then day-first.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(values, errors='coerce')
+        for dayfirst in (False, True):
+            retry = values.notna() & parsed.isna()
+            if not retry.any():
+                break
+            parsed[retry] = pd.to_datetime(values[retry], errors='coerce', format='mixed', dayfirst=dayfirst)
+    return parsed
 
-        return True, None, total_rows
 
+BOOL_TRUE_VALUES = {'true', 't', 'yes', 'y', 'ya', '1'}
+BOOL_FALSE_VALUES = {'false', 'f', 'no', 'n', 'tidak', '0'}
+_DECIMAL_VALUE_RE = r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?'
+
+
+def _validate_frame(df, configs, final_columns, dist_id=None):
+    """
+    Vectorized validation and cleaning of a frame read with dtype=str.
+    Returns (clean, errors): clean holds the converted value of every config
+    column (same index as df), errors has one record per failing cell with
+    columns row, column, error, value.
+    """
+    clean = pd.DataFrame(index=df.index)
+    error_frames = []
+    prefix = str(dist_id).strip()[:2] if dist_id and str(dist_id).strip() else None
+
+    def add_errors(mask, key, kind, raw):
+        if mask.any():
+            error_frames.append(pd.DataFrame({
+                'row': df.index[mask] + 1,
+                'column': key,
+                'error': kind,
+                'value': raw[mask].values,
+            }))
+
+    for key, conf in configs.items():
+        if key == 'ImportDate':
+            continue
+        col_ref = final_columns.get(key)
+        if col_ref is not None:
+            raw = df[col_ref]
+            present = raw.notna() & (raw.str.strip().fillna('') != '')
+        else:
+            raw = pd.Series(None, index=df.index, dtype=object)
+            present = pd.Series(False, index=df.index)
+
+        if conf['is_mandatory']:
+            add_errors(~present, key, 'missing', raw)
+
+        data_type = conf['data_type']
+        if data_type == 'int':
+            parsed = csv_utils.to_numeric(raw.where(present))
+            bad = present & ~(np.isfinite(parsed) & (parsed.abs() < 2 ** 63))
+            add_errors(bad, key, 'invalid_int', raw)
+            clean[key] = np.trunc(parsed.where(present & ~bad, 0)).astype('int64')
+        elif data_type in ('date', 'datetime'):
+            parsed = _parse_dates(raw.where(present))
+            bad = present & parsed.isna()
+            add_errors(bad, key, f'invalid_{data_type}', raw)
+            fmt = '%Y-%m-%d' if data_type == 'date' else '%Y-%m-%d %H:%M:%S'
+            clean[key] = parsed.dt.strftime(fmt).astype(object).where(present & ~bad, None)
+        elif data_type == 'decimal':
+            # Kept as text so MySQL converts it to DECIMAL exactly (no float rounding)
+            value = raw.str.strip()
+            bad = present & ~value.str.fullmatch(_DECIMAL_VALUE_RE).fillna(False).astype(bool)
+            add_errors(bad, key, 'invalid_decimal', raw)
+            clean[key] = value.astype(object).where(present & ~bad, '0')
+        elif data_type == 'float':
+            parsed = csv_utils.to_numeric(raw.where(present))
+            bad = present & ~np.isfinite(parsed)
+            add_errors(bad, key, 'invalid_float', raw)
+            clean[key] = parsed.where(present & ~bad, 0.0).astype('float64')
+        elif data_type == 'bool':
+            value = raw.str.strip().str.lower()
+            truthy = value.isin(BOOL_TRUE_VALUES)
+            bad = present & ~truthy & ~value.isin(BOOL_FALSE_VALUES)
+            add_errors(bad, key, 'invalid_bool', raw)
+            clean[key] = (present & truthy).astype('int64')
+        else:
+            clean[key] = raw.astype(object).where(present, '')
+
+        if prefix and key == 'DISTID':
+            add_errors(present & (raw.str.strip().str[:2] != prefix), key, 'distid_prefix', raw)
+
+    if error_frames:
+        errors = pd.concat(error_frames, ignore_index=True)
+    else:
+        errors = pd.DataFrame(columns=['row', 'column', 'error', 'value'])
+    return clean, errors
+
+
+def _batch_report_dir(batch_id):
+    """Returns (and creates) the per-batch directory for reports and artifacts."""
+    path = os.path.join(config.REPORT_FOLDER, batch_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_report_path(batch_id, filename, suffix):
+    """Path of a batch artifact for one file, e.g. suffix 'dryrun.csv'."""
+    return os.path.join(config.REPORT_FOLDER, os.path.basename(batch_id), f"{os.path.basename(filename)}.{suffix}")
+
+
+def _summarize_errors(errors, examples=None):
+    """Aggregates per-cell errors into {column, error, count, rows, examples} records (first K rows each)."""
+    if errors.empty:
+        return []
+    if examples is None:
+        examples = config.ERROR_EXAMPLE_ROWS
+
+    summary = []
+    for (column, kind), group in errors.groupby(['column', 'error'], sort=False):
+        head = group.head(examples)
+        summary.append({
+            "column": column,
+            "error": kind,
+            "count": int(len(group)),
+            "rows": [int(r) for r in head['row']],
+            "examples": [None if pd.isna(v) else str(v) for v in head['value']],
+        })
+    return summary
+
+
+def _format_error_summary(summary):
+    """One readable line per aggregated error, e.g. for job messages."""
+    lines = []
+    for item in summary:
+        rows = ', '.join(str(r) for r in item['rows'])
+        more = ', ...' if item['count'] > len(item['rows']) else ''
+        lines.append(f"{item['column']}: {item['error']} in {item['count']} row(s) (rows {rows}{more})")
+    return lines
+
+
+def _write_rejected_rows(df, errors, batch_id, filename):
+    """Writes the original rejected rows (+ _row and _errors columns) to a gzip CSV. Returns the path."""
+    reasons = (errors['column'] + ':' + errors['error']).groupby(errors['row']).agg('; '.join)
+    rejected = df.loc[reasons.index - 1].copy()
+    rejected.insert(0, '_row', reasons.index)
+    rejected['_errors'] = reasons.values
+
+    _batch_report_dir(batch_id)
+    path = get_report_path(batch_id, filename, 'rejected.csv.gz')
+    rejected.to_csv(path, index=False, compression='gzip')
+    return path
+
+
+def _dry_run_chunk(chunk, configs, final_columns, unique_keys, dist_id):
+    clean, errors = _validate_frame(chunk, configs, final_columns, dist_id)
+    keys = {}
+    for key in unique_keys:
+        col_ref = final_columns.get(key)
+        if col_ref is None:
+            continue
+        present = chunk[col_ref].str.strip().fillna('') != ''
+        keys[key] = clean[key][present]
+    return len(chunk), errors, keys
+
+
+def dry_run_validate_file(filepath, table_name, batch_id, dist_id=None):
+    """
+    Validates every row of a file without writing to the target table.
+    Chunks are validated in parallel; in-file uniqueness of is_unique columns
+    is checked once all chunks are done. Errors are written to a CSV report.
+    """
+    fname = os.path.basename(filepath)
+    valid, errs = _check_import_file_basic(filepath)
+    if not valid:
+        return {"filename": fname, "valid": False, "error": errs[0], "rows": 0}
+
+    if not table_name or table_name == 'auto':
+        table_name, error_msg = _detect_table_for_file(filepath)
+        if not table_name:
+            return {"filename": fname, "valid": False, "error": error_msg, "rows": 0}
+
+    configs = get_column_configs(table_name=table_name)
+    if not configs:
+        return {"filename": fname, "valid": False, "error": f"No column configuration found for table '{table_name}'.", "rows": 0}
+    unique_keys = [k for k, conf in configs.items() if conf['is_unique'] and k != 'ImportDate']
+
+    # Header check only; row-level problems are collected in the report below
+    encoding = csv_utils.detect_encoding(filepath)
+    sep = csv_utils.sniff_delimiter(filepath, encoding=encoding)
+    try:
+        header = pd.read_csv(filepath, sep=sep, dtype=str, nrows=0, encoding=encoding)
     except Exception as e:
-        return False, f"Error reading file: {str(e)}", 0
+        return {"filename": fname, "valid": False, "error": f"Error reading file: {str(e)}", "rows": 0}
+    final_columns, missing_columns = _map_columns([str(col).strip().lower() for col in header.columns], configs)
+    missing_required = [key for key in missing_columns if configs[key]['is_mandatory']]
+    if missing_required:
+        return {"filename": fname, "valid": False, "error": f"Missing mandatory columns: {', '.join(missing_required)}", "rows": 0}
+
+    def validate_chunks(reader):
+        # Fresh state per pass: read_csv_chunks repeats the pass after an encoding fallback
+        rows = 0
+        error_frames = []
+        key_parts = {key: [] for key in unique_keys}
+
+        def collect(future):
+            nonlocal rows
+            n, errors, keys = future.result()
+            rows += n
+            if not errors.empty:
+                error_frames.append(errors)
+            for key, values in keys.items():
+                key_parts[key].append(values)
+
+        with ThreadPoolExecutor(max_workers=config.DRYRUN_WORKERS) as pool:
+            pending = deque()
+            for chunk in reader:
+                chunk.columns = [str(col).strip().lower() for col in chunk.columns]
+                pending.append(pool.submit(_dry_run_chunk, chunk, configs, final_columns, unique_keys, dist_id))
+                # Bound the number of chunks held in memory
+                while len(pending) > config.DRYRUN_WORKERS * 2:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+        return rows, error_frames, key_parts
+
+    try:
+        (rows, error_frames, key_parts), encoding = csv_utils.read_csv_chunks(
+            filepath, validate_chunks, config.DRYRUN_CHUNK_ROWS, sep=sep, encoding=encoding)
+    except (UnicodeDecodeError, pd.errors.ParserError) as e:
+        return {"filename": fname, "valid": False, "error": f"Error reading file: {str(e)}", "rows": 0}
+
+    for key, parts in key_parts.items():
+        if not parts:
+            continue
+        values = pd.concat(parts)
+        dup = values.duplicated(keep='first')
+        if dup.any():
+            error_frames.append(pd.DataFrame({
+                'row': values.index[dup] + 1,
+                'column': key,
+                'error': 'duplicate',
+                'value': values[dup].values,
+            }))
+
+    result = {"filename": fname, "table_name": table_name, "encoding": encoding, "rows": rows, "error_rows": 0, "errors": []}
+    if error_frames:
+        errors = pd.concat(error_frames, ignore_index=True).sort_values(['row', 'column'], kind='stable')
+        result["error_rows"] = int(errors['row'].nunique())
+        result["errors"] = _summarize_errors(errors)
+        report_path = get_report_path(batch_id, fname, 'dryrun.csv')
+        _batch_report_dir(batch_id)
+        errors.to_csv(report_path, index=False)
+        result["report"] = report_path
+
+    result["valid_rows"] = rows - result["error_rows"]
+    result["valid"] = result["error_rows"] == 0
+    return result
+
 
 def _check_missing_table_files(all_file_paths, batch_id, dist_id):
     """
@@ -1019,123 +2782,567 @@ def _check_missing_table_files(all_file_paths, batch_id, dist_id):
             cursor.close()
             connection.close()
 
-def process_import_async(file_paths, table_name, batch_id, temp_dirs=None):
+# ==================== PROFILING ====================
+# cProfile allows a single active profiler per interpreter (Python 3.12+),
+# so only one import is profiled at a time; others run unprofiled.
+_profiler_lock = threading.Lock()
+
+
+def _get_profiled_tables():
+    """Names of import tables with profile_imports enabled (empty if the column does not exist yet)."""
+    connection = get_connection()
+    if not connection: return set()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT table_name FROM import_tables WHERE profile_imports = 1")
+        return {row[0] for row in cursor.fetchall()}
+    except Error:
+        return set()
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def _resolve_table_name(filepath, table_name):
+    if table_name and table_name != 'auto':
+        return table_name
+    return _detect_table_for_file(filepath)[0]
+
+
+def find_duplicate_upload(table_name, file_hash):
     """
-    Background worker: processes all files for a batch job.
-    Updates job status in DB as it progresses.
-    Cleans up files when done.
+    Batch id of the latest completed import of a byte-identical file into
+    `table_name` (upload_logs.file_hash), or None.
+    """
+    if not table_name or not file_hash:
+        return None
+    connection = get_connection()
+    if not connection: return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT file_name_zip FROM upload_logs WHERE table_name = %s AND file_hash = %s AND status = '9' "
+            "ORDER BY created_at DESC LIMIT 1",
+            (table_name, file_hash)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Error as e:
+        # file_hash not migrated yet: no duplicate detection
+        print(f"Error looking up file hash: {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def skip_duplicate_uploads(batch_id, file_paths, file_hashes, table_name, dist_id=None, user_id=None):
+    """
+    Drops re-uploads of files that were already imported: a file is a
+    duplicate when an identical file (same SHA-256) completed an import into
+    the same target table. Each duplicate gets a job row with status '7'
+    ("duplicate of batch X") and is removed from disk. `file_hashes` is
+    keyed by real path (see extract_zip).
+    Returns ([(path, target_table)] still to import, [duplicate dicts]).
+    """
+    fresh, duplicates = [], []
+    for path in file_paths:
+        target = _resolve_table_name(path, table_name)
+        file_hash = file_hashes.get(os.path.realpath(path))
+        duplicate_of = find_duplicate_upload(target, file_hash)
+        if not duplicate_of:
+            fresh.append((path, target))
+            continue
+
+        fname = os.path.basename(path)
+        create_import_job(batch_id, fname, dist_id, file_size=os.path.getsize(path), user_id=user_id,
+                          file_hash=file_hash, table_name=target, status='7')
+        update_job_status(batch_id, filename=fname, message=f"Duplikat dari batch {duplicate_of}",
+                          notes=f"File identik sudah diimport ke {target} pada batch {duplicate_of}")
+        duplicates.append({"filename": fname, "table_name": target, "duplicate_of": duplicate_of})
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return fresh, duplicates
+
+
+def set_table_profiling(table_id, enabled):
+    """Enables/disables profiling of every import into a table."""
+    connection = get_connection()
+    if not connection: return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE import_tables SET profile_imports = %s WHERE id = %s", (bool(enabled), table_id))
+        connection.commit()
+        invalidate_config_cache()
+        return True
+    except Error as e:
+        print(f"Error updating profiling flag: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def set_table_retention(table_id, months):
+    """Sets how many months of rows an import table keeps (0/None = keep forever). Applied by retention.py."""
+    connection = get_connection()
+    if not connection: return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE import_tables SET retention_months = %s WHERE id = %s", (months or None, table_id))
+        connection.commit()
+        invalidate_config_cache()
+        return True
+    except Error as e:
+        print(f"Error updating retention policy: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def get_profile_path(batch_id):
+    return os.path.join(config.REPORT_FOLDER, os.path.basename(batch_id), 'profile.prof')
+
+
+def get_profile_summary(batch_id, limit=50):
+    """Top functions of a stored batch profile by cumulative time, as text."""
+    out = io.StringIO()
+    stats = pstats.Stats(get_profile_path(batch_id), stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def _new_import_batch(file_paths, table_name, batch_id, temp_dirs=None, validation_timers=None, profile=False):
+    """State shared by the files of one upload batch while they are imported (possibly on several workers)."""
+    return {
+        'batch_id': batch_id, 'table_name': table_name, 'temp_dirs': list(temp_dirs or []),
+        'validation_timers': validation_timers or {}, 'profile': profile,
+        'profiled_tables': _get_profiled_tables(), 'profiler': None,
+        'pending': len(file_paths), 'lock': threading.Lock(),
+    }
+
+
+def _finish_import_batch(batch):
+    """Saves the batch profile and removes the extraction directories once every file is done."""
+    profiler = batch['profiler']
+    if profiler and profiler.getstats():
+        try:
+            _batch_report_dir(batch['batch_id'])
+            profiler.dump_stats(get_profile_path(batch['batch_id']))
+        except Exception as e:
+            print(f"Error saving profile for batch {batch['batch_id']}: {e}")
+    for td in batch['temp_dirs']:
+        try:
+            shutil.rmtree(td, ignore_errors=True)
+        except:
+            pass
+
+
+def _record_import_result(batch, filepath, result, messages, timer, queue_wait=None, scheduling=None, extra_notes=''):
+    """
+    Writes the final job status of one imported file: counts, notes (date
+    range summary, encoding, Drive link), the Drive upload and its stage
+    metrics. `result`/`messages` are what import_file_process returned.
+    `extra_notes` (e.g. profiling skipped) are kept for failed files too.
+    """
+    batch_id, table_name = batch['batch_id'], batch['table_name']
+    validation_timers = batch['validation_timers']
+    fname = os.path.basename(filepath)
+    file_success = 0
+    file_errors = []
+    error_rows = 0
+    unchanged = 0
+    file_status = '2'
+    message = ''
+    notes = ''
+    drive_link = None
+
+    if result:
+        file_success = messages.get('success_count', 0) if isinstance(messages, dict) else 0
+        file_errors = messages.get('errors', []) if isinstance(messages, dict) else []
+        error_rows = messages.get('error_rows', 0) if isinstance(messages, dict) else 0
+        unchanged = messages.get('unchanged', 0) if isinstance(messages, dict) else 0
+        notes = f"Berhasil memproses {(file_success + unchanged + error_rows)} data"
+        if isinstance(messages, dict) and 'inserted' in messages:
+            notes += (f"; {messages['inserted']} baru, {messages['updated']} diperbarui, "
+                      f"{unchanged} tidak berubah")
+        if error_rows:
+            notes += f"; {error_rows} baris ditolak"
+        message = f"File uploaded successfully"
+        notes += extra_notes
+        if timer.info.get('encoding') not in (None, 'utf-8', 'utf-8-sig'):
+            notes += f"; Encoding file {timer.info['encoding']} dikonversi ke UTF-8"
+
+        # Extract date range summary from DOTANGGAL column if present
+        summary_started = time.perf_counter()
+        try:
+            df_summary = csv_utils.read_csv(filepath, encoding=timer.info.get('encoding'))
+            df_summary.columns = [str(col).strip().lower() for col in df_summary.columns]
+            if 'dotanggal' in df_summary.columns:
+                dates = pd.to_datetime(df_summary['dotanggal'], errors='coerce').dropna()
+                if not dates.empty:
+                    min_date = dates.min().strftime('%d/%m/%Y')
+                    max_date = dates.max().strftime('%d/%m/%Y')
+                    notes += f"; Periode DO: {min_date} s/d {max_date}"
+            if 'amount_jual' in df_summary.columns:
+                total_jual = pd.to_numeric(df_summary['amount_jual'], errors='coerce').sum()
+                notes += f"; Total Penjualan: Rp {total_jual:,.0f}"
+            if 'exportdate' or 'export_date' in df_summary.columns:
+                dates = pd.to_datetime(df_summary['exportdate'], errors='coerce').dropna()
+                if not dates.empty:
+                    min_date = dates.min().strftime('%d/%m/%Y')
+                    max_date = dates.max().strftime('%d/%m/%Y')
+                    notes += f"; dengan Export Date: {min_date} s/d {max_date}"
+        except Exception as e_date:
+            print(f"Warning: Could not extract date range from DOTANGGAL: {e_date}")
+        timer.add('summary', time.perf_counter() - summary_started)
+
+        with timer.stage('gdrive_upload'):
+            upload_to_gdrive_result = upload_to_gdrive([filepath])
+        if isinstance(upload_to_gdrive_result, list):
+            for res in upload_to_gdrive_result:
+                if 'error' in res:
+                    notes += f"; GDrive upload failed: {res['error']}"
+                else:
+                    drive_link = f"https://drive.google.com/file/d/{res['gdrive_file_id']}/view?usp=drive_link"
+                    notes += f"; Uploaded to GDrive with link : {drive_link}"
+
+        else:
+            notes += f"; GDrive upload skipped: {upload_to_gdrive_result}"
+
+        if not file_errors: 
+            file_status = '9'
+        else:
+            file_status = '9' # Logic: completed processing the file. Errors are details.
+    else:
+        error_msgs = messages if isinstance(messages, list) else [str(messages)]
+        file_errors = error_msgs
+        # Rows import_file_process rejected before giving up; 0 when it failed before counting any
+        error_rows = timer.rows.get('error', 0)
+        file_status = '2'
+        message = error_msgs[0] if error_msgs else "File processing failed."
+        # e.g. why a failed import has no profile
+        notes = extra_notes.lstrip('; ')
+
+    stage_metrics = timer.as_dict()
+    stage_metrics['queue_wait_seconds'] = round(queue_wait, 4) if queue_wait is not None else None
+    if scheduling:
+        stage_metrics['scheduling'] = scheduling
+    if fname in validation_timers:
+        stage_metrics['validation'] = validation_timers[fname].as_dict()
+    file_table = messages.get('table_name', table_name) if isinstance(messages, dict) else table_name
+    for stage in ('summary', 'gdrive_upload'):
+        if stage in timer.stages:
+            metrics.observe('import_stage_seconds', timer.stages[stage], stage=stage, table=file_table)
+    metrics.inc('import_files_total', table=file_table, status=file_status)
+
+    # Update final status for this file
+    update_job_status(
+        batch_id, 
+        filename=fname, 
+        status=file_status, 
+        success_count=file_success, 
+        error_count=error_rows,
+        error_details=file_errors if file_errors else None,
+        processed_rows=(file_success + unchanged + error_rows),
+        total_rows=(file_success + unchanged + error_rows),
+        message=message,
+        notes=notes,
+        link_file=drive_link,
+        stage_metrics=stage_metrics
+    )
+
+
+def _process_import_file(batch, filepath, queued_at=None, scheduling=None):
+    """
+    Imports one file of a batch and writes its final job status.
+    queued_at (epoch seconds) is when the file was queued; the wait is stored
+    as queue_wait_seconds in its stage metrics, next to `scheduling`
+    (priority/tenant facts from the import scheduler).
+    """
+    batch_id, table_name = batch['batch_id'], batch['table_name']
+    validation_timers = batch['validation_timers']
+    fname = os.path.basename(filepath)
+    timer = metrics.StageTimer()
+    queue_wait = time.time() - queued_at if queued_at else None
+    if queue_wait is not None:
+        metrics.observe('import_queue_wait_seconds', queue_wait, priority=(scheduling or {}).get('priority', 'normal'))
+
+    try:
+        # Mark file as processing
+        update_job_status(batch_id, filename=fname, status='3')
+
+        # Resolved up front so schema changes can see which tables are being imported into
+        import_table = _resolve_table_name(filepath, table_name)
+        file_profiler = None
+        wants_profile = batch['profile'] or (batch['profiled_tables'] and import_table in batch['profiled_tables'])
+        if wants_profile:
+            with batch['lock']:
+                batch['profiler'] = batch['profiler'] or cProfile.Profile()
+            file_profiler = batch['profiler'] if _profiler_lock.acquire(blocking=False) else None
+            if file_profiler:
+                file_profiler.enable()
+        _track_import(import_table, 1)
+        try:
+            if table_name and table_name != 'auto':
+                result, messages = import_file_process(filepath, table_name, batch_id=batch_id, timer=timer)
+            else:
+                result, messages = import_dynamic_data(filepath, batch_id=batch_id, timer=timer)
+        finally:
+            _track_import(import_table, -1)
+            if file_profiler:
+                file_profiler.disable()
+                _profiler_lock.release()
+
+        extra_notes = "; Profiling skipped: another import is being profiled" if wants_profile and not file_profiler else ''
+        _record_import_result(batch, filepath, result, messages, timer, queue_wait=queue_wait, scheduling=scheduling,
+                              extra_notes=extra_notes)
+
+    except Exception as e:
+        # File level exception
+        update_job_status(
+            batch_id, 
+            filename=fname, 
+            status='failed',
+            error_count=1,
+            error_details=[f"Unexpected error processing file: {str(e)}"]
+        )
+
+
+def run_import_file(batch, filepath, queued_at=None, scheduling=None):
+    """Imports one file of a batch, removes it, and finishes the batch after its last file."""
+    try:
+        _process_import_file(batch, filepath, queued_at=queued_at, scheduling=scheduling)
+    except Exception as e:
+        print(f"Error importing {filepath} for batch {batch['batch_id']}: {e}")
+    finally:
+        try:
+            os.remove(filepath)
+        except:
+            pass
+        with batch['lock']:
+            batch['pending'] -= 1
+            finished = batch['pending'] <= 0
+        if finished:
+            _finish_import_batch(batch)
+
+
+STAGING_TABLE_MARKER = '__stg_'
+
+
+def _staging_table_name(table_name, batch_id):
+    suffix = f"{STAGING_TABLE_MARKER}{batch_id.replace('-', '')[:12]}"
+    return table_name[:INDEX_NAME_MAX - len(suffix)] + suffix
+
+
+def _create_staging_table(table_name, batch_id):
+    """Empty copy of an import table (columns, keys, partitions) for an atomic batch. Returns its name or None."""
+    staging = _staging_table_name(table_name, batch_id)
+    connection = get_connection()
+    if not connection: return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TABLE {staging} LIKE {table_name}")
+        return staging
+    except Error as e:
+        print(f"Error creating staging table for {table_name}: {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def _drop_staging_tables(staging_tables):
+    staging_tables = [t for t in staging_tables if t]
+    if not staging_tables:
+        return
+    connection = get_connection()
+    if not connection: return
+    try:
+        cursor = connection.cursor()
+        for staging in staging_tables:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    except Error as e:
+        print(f"Error dropping staging tables: {e}")
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def promote_staging_tables(staging_tables):
+    """
+    Copies every staging table ({table_name: staging_table}) into its import
+    table in a single transaction, with the same upsert rules as
+    import_file_process, and folds the changed rows into the table's summary
+    tables in that transaction. Returns (True, {table_name: affected rows}) or
+    (False, error message) after a rollback.
+    """
+    connection = get_connection()
+    if not connection:
+        return False, "Database connection failed."
+    cursor = None
+    try:
+        # autocommit is off: every INSERT ... SELECT below is part of one transaction
+        cursor = connection.cursor()
+        affected = {}
+        for table_name, staging in staging_tables.items():
+            configs = get_column_configs(table_name=table_name)
+            insert_keys = [k for k in configs.keys() if k != 'ImportDate']
+            if not insert_keys:
+                raise Error(msg=f"No column configuration for {table_name}.")
+            columns_sql = ', '.join(insert_keys)
+            unique_keys = [k for k in insert_keys if configs[k]['is_unique']]
+            summaries = _read_summary_tables(connection, table_name, lock=True)
+            types = dict({k: configs[k]['data_type'] for k in insert_keys}, ImportDate='datetime')
+            deltas = {}
+            where = ""
+            if not unique_keys:
+                # No unique key: skip rows identical to a stored row, like the per-row NOT EXISTS probe
+                matches = " AND ".join(f"t.{col} <=> s.{col}" for col in insert_keys)
+                not_stored = f"NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {matches})"
+                where = f"WHERE {not_stored}"
+                # Insert-only, so exactly the staging rows passing that probe are added to the summaries
+                _collect_summary_deltas(cursor, summaries, types, f"{staging} s", not_stored, (), deltas, 1, lock=True)
+            elif summaries:
+                # Stored rows sharing a unique value with a staging row, before and after the upsert,
+                # plus staging rows without any unique value (always inserted)
+                touched = " OR ".join(f"{col} IN (SELECT {col} FROM {staging})" for col in unique_keys)
+                no_key = " AND ".join(f"{col} IS NULL" for col in unique_keys)
+                _collect_summary_deltas(cursor, summaries, types, table_name, touched, (), deltas, -1, lock=True)
+                _collect_summary_deltas(cursor, summaries, types, staging, no_key, (), deltas, 1)
+            cursor.execute(
+                f"INSERT INTO {table_name} ({columns_sql}, ImportDate) "
+                f"SELECT {', '.join('s.' + col for col in insert_keys)}, s.ImportDate FROM {staging} s {where} "
+                f"ON DUPLICATE KEY UPDATE {_upsert_update_clause(insert_keys, table_name)}"
+            )
+            affected[table_name] = cursor.rowcount
+            if unique_keys and summaries:
+                _collect_summary_deltas(cursor, summaries, types, table_name, touched, (), deltas, 1, lock=True)
+            _apply_summary_deltas(cursor, summaries, deltas)
+        connection.commit()
+        return True, affected
+    except Error as e:
+        connection.rollback()
+        return False, str(e)
+    finally:
+        if connection and connection.is_connected():
+            if cursor: cursor.close()
+            connection.close()
+
+
+def _process_atomic_batch(batch, file_paths, queued_at=None, scheduling=None):
+    """
+    All-or-nothing import: every file is loaded into a staging copy of its
+    table (compared against the real table, so counts stay accurate). Only
+    when every file imports without rejected rows are the staging tables
+    promoted to the real tables in one short transaction; otherwise nothing
+    is promoted and every file of the batch is marked failed.
     """
+    batch_id, table_name = batch['batch_id'], batch['table_name']
+    queue_wait = time.time() - queued_at if queued_at else None
+    if queue_wait is not None:
+        metrics.observe('import_queue_wait_seconds', queue_wait, priority=(scheduling or {}).get('priority', 'normal'))
+
+    staging = {}
+    outcomes = {}
+    failure = None
+    promote_seconds = 0.0
     try:
         for filepath in file_paths:
             fname = os.path.basename(filepath)
-            
-            try:
-                # Mark file as processing
-                update_job_status(batch_id, filename=fname, status='3')
-                
-                if table_name and table_name != 'auto':
-                    result, messages = import_file_process(filepath, table_name)
-                else:
-                    result, messages = import_dynamic_data(filepath)
-
-                file_success = 0
-                file_errors = []
-                file_status = '2'
-                message = ''
-                notes = ''
-                
-                if result:
-                    file_success = messages.get('success_count', 0) if isinstance(messages, dict) else 0
-                    file_errors = messages.get('errors', []) if isinstance(messages, dict) else []
-                    notes = f"Berhasil memproses {(file_success + len(file_errors))} data"
-                    message = f"File uploaded successfully"
-
-                    # Extract date range summary from DOTANGGAL column if present
-                    try:
-                        df_summary = pd.read_csv(filepath, sep=None, engine='python', dtype=str)
-                        df_summary.columns = [str(col).strip().lower() for col in df_summary.columns]
-                        if 'dotanggal' in df_summary.columns:
-                            dates = pd.to_datetime(df_summary['dotanggal'], errors='coerce').dropna()
-                            if not dates.empty:
-                                min_date = dates.min().strftime('%d/%m/%Y')
-                                max_date = dates.max().strftime('%d/%m/%Y')
-                                notes += f"; Periode DO: {min_date} s/d {max_date}"
-                        if 'amount_jual' in df_summary.columns:
-                            total_jual = pd.to_numeric(df_summary['amount_jual'], errors='coerce').sum()
-                            notes += f"; Total Penjualan: Rp {total_jual:,.0f}"
-                        if 'exportdate' or 'export_date' in df_summary.columns:
-                            dates = pd.to_datetime(df_summary['exportdate'], errors='coerce').dropna()
-                            if not dates.empty:
-                                min_date = dates.min().strftime('%d/%m/%Y')
-                                max_date = dates.max().strftime('%d/%m/%Y')
-                                notes += f"; dengan Export Date: {min_date} s/d {max_date}"
-                    except Exception as e_date:
-                        print(f"Warning: Could not extract date range from DOTANGGAL: {e_date}")
-                    drive_link = None
-
-                    upload_to_gdrive_result = upload_to_gdrive([filepath])
-                    if isinstance(upload_to_gdrive_result, list):
-                        for res in upload_to_gdrive_result:
-                            if 'error' in res:
-                                notes += f"; GDrive upload failed: {res['error']}"
-                            else:
-                                drive_link = f"https://drive.google.com/file/d/{res['gdrive_file_id']}/view?usp=drive_link"
-                                notes += f"; Uploaded to GDrive with link : {drive_link}"
-                                
-                    else:
-                        notes += f"; GDrive upload skipped: {upload_to_gdrive_result}"
-                    
-                    if not file_errors: 
-                        file_status = '9'
-                    else:
-                        file_status = '9' # Logic: completed processing the file. Errors are details.
+            update_job_status(batch_id, filename=fname, status='3')
+            timer = metrics.StageTimer()
+            import_table = _resolve_table_name(filepath, table_name)
+            if not import_table:
+                result, messages = False, [f"Filename '{os.path.splitext(fname)[0]}' does not match any configured table."]
+            else:
+                if import_table not in staging:
+                    with timer.stage('staging'):
+                        staging[import_table] = _create_staging_table(import_table, batch_id)
+                    _track_import(import_table, 1)
+                if staging[import_table]:
+                    result, messages = import_file_process(filepath, import_table, batch_id=batch_id, timer=timer,
+                                                           write_table=staging[import_table])
                 else:
-                    error_msgs = messages if isinstance(messages, list) else [str(messages)]
-                    file_errors = error_msgs
-                    file_status = '2'
-                    message = error_msgs[0] if error_msgs else "File processing failed."
+                    result, messages = False, [f"Failed to create staging table for {import_table}."]
+            if result and messages.get('error_rows'):
+                result, messages = False, ([f"{messages['error_rows']} baris ditolak, batch atomik dibatalkan"]
+                                           + _format_error_summary(messages.get('errors', [])))
+            outcomes[filepath] = (result, messages, timer)
+            if not result:
+                failure = f"{fname}: {messages[0] if messages else 'import failed'}"
+                break
+
+        if not failure:
+            started = time.perf_counter()
+            promoted, detail = promote_staging_tables({t: s for t, s in staging.items() if s})
+            promote_seconds = time.perf_counter() - started
+            if not promoted:
+                failure = f"Promosi ke table tujuan gagal: {detail}"
+    finally:
+        _drop_staging_tables(staging.values())
+        for import_table in staging:
+            _track_import(import_table, -1)
 
-                # Update final status for this file
-                update_job_status(
-                    batch_id, 
-                    filename=fname, 
-                    status=file_status, 
-                    success_count=file_success, 
-                    error_count=len(file_errors),
-                    error_details=file_errors if file_errors else None,
-                    processed_rows=(file_success + len(file_errors)),
-                    total_rows=(file_success + len(file_errors)),
-                    message=message,
-                    notes=notes,
-                    link_file=drive_link
-                )
+    for filepath in file_paths:
+        result, messages, timer = outcomes.get(filepath, (False, None, metrics.StageTimer()))
+        if failure:
+            if result or messages is None:
+                result, messages = False, [f"Batch atomik dibatalkan, tidak ada data yang diimport ({failure})"]
+            _record_import_result(batch, filepath, result, messages, timer, queue_wait=queue_wait, scheduling=scheduling)
+        else:
+            timer.info['atomic_promote_seconds'] = round(promote_seconds, 4)
+            _record_import_result(batch, filepath, result, messages, timer, queue_wait=queue_wait, scheduling=scheduling,
+                                  extra_notes=f"; Dipromosikan atomik bersama {len(file_paths)} file")
 
-            except Exception as e:
-                # File level exception
-                update_job_status(
-                    batch_id, 
-                    filename=fname, 
-                    status='failed',
-                    error_count=1,
-                    error_details=[f"Unexpected error processing file: {str(e)}"]
-                )
 
+def run_atomic_import(batch, file_paths, queued_at=None, scheduling=None):
+    """Runs an all-or-nothing batch, then removes its files and finishes the batch."""
+    try:
+        _process_atomic_batch(batch, file_paths, queued_at=queued_at, scheduling=scheduling)
     except Exception as e:
-        print(f"Batch level error in process_import_async: {e}")
-        pass
+        print(f"Error in atomic import of batch {batch['batch_id']}: {e}")
+        for filepath in file_paths:
+            update_job_status(batch['batch_id'], filename=os.path.basename(filepath), status='2',
+                              error_details=[f"Unexpected error in atomic batch: {str(e)}"])
     finally:
-        # Cleanup files
-        for fp in file_paths:
+        for filepath in file_paths:
             try:
-                os.remove(fp)
+                os.remove(filepath)
             except:
                 pass
-        if temp_dirs:
-            for td in temp_dirs:
-                try:
-                    shutil.rmtree(td, ignore_errors=True)
-                except:
-                    pass
+        _finish_import_batch(batch)
+
+
+def process_import_async(file_paths, table_name, batch_id, temp_dirs=None, queued_at=None, validation_timers=None,
+                         profile=False):
+    """
+    Background worker: processes all files for a batch job, one after the other.
+    Updates job status in DB as it progresses.
+    Cleans up files when done.
+    queued_at (epoch seconds) and validation_timers ({filename: StageTimer}
+    from quick validation) are folded into the stage metrics of each file.
+    Files are run under cProfile when `profile` is set or their table has
+    profile_imports enabled; the profile is stored with the batch.
+    The web app queues files through import_scheduler instead, which runs
+    them with run_import_file on a fair, shared worker pool.
+    """
+    batch = _new_import_batch(file_paths, table_name, batch_id, temp_dirs, validation_timers, profile)
+    if not file_paths:
+        _finish_import_batch(batch)
+    for filepath in file_paths:
+        run_import_file(batch, filepath, queued_at=queued_at)
 
 def upload_to_gdrive(filepath):
     """Uploads a file to Google Drive and returns the file ID."""
@@ -1,63 +1,221 @@
-import csv
+"""
+Vectorized test data generator for import tables.
+
+Emits CSV files for any table defined in column_definitions (or the default
+`stocks` layout), optionally with dirty data: missing values, invalid values,
+alias headers, alternate delimiters and encodings. Outputs can be packaged as
+ZIP batches where every table file is named after its allowed_filename, just
+like a distributor upload.
+
+Usage:
+    python generate_big_stock_test.py                                  # 200k stocks rows
+    python generate_big_stock_test.py --tables stocks,sales --rows 50000000 \\
+        --missing-rate 0.01 --invalid-rate 0.005 --alias-rate 0.5 \\
+        --delimiter ';' --encoding cp1252 --zip --batches 3
+"""
+import argparse
 import os
-from datetime import datetime, timedelta
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1_000_000
+
+# Default `stocks` config, mirrors the seed in db_setup.py
+STOCK_COLUMNS = [
+    {'name': 'sku', 'data_type': 'str', 'is_unique': True, 'is_mandatory': True, 'aliases': ['sku', 'kode barang', 'item code']},
+    {'name': 'warehouse_code', 'data_type': 'str', 'is_unique': False, 'is_mandatory': True, 'aliases': ['warehouse_code', 'kode gudang', 'warehouse', 'gudang']},
+    {'name': 'stock_pcs', 'data_type': 'int', 'is_unique': False, 'is_mandatory': True, 'aliases': ['stock_pcs', 'stock pcs', 'pcs', 'stok pcs']},
+    {'name': 'stock_box', 'data_type': 'int', 'is_unique': False, 'is_mandatory': False, 'aliases': ['stock_box', 'stock box', 'box', 'stok box']},
+    {'name': 'stock_cs', 'data_type': 'int', 'is_unique': False, 'is_mandatory': False, 'aliases': ['stock_cs', 'stock cs', 'cs', 'stok cs']},
+    {'name': 'date', 'data_type': 'date', 'is_unique': False, 'is_mandatory': False, 'aliases': ['date', 'tanggal']},
+]
+
+INVALID_VALUES = {
+    'int': np.array(['abc', '12x', '1,5', '--'], dtype=object),
+    'date': np.array(['2025-13-45', 'notadate', '31/31/2025', '00-00-0000'], dtype=object),
+    'datetime': np.array(['2025-13-45 25:61:00', 'notadate', 'yesterday'], dtype=object),
+    'decimal': np.array(['1.2.3', 'abc', '1,5', '--'], dtype=object),
+    'float': np.array(['1.2.3', 'abc', 'NaNx', '--'], dtype=object),
+    'bool': np.array(['maybe', '2', 'x', '--'], dtype=object),
+}
+BOOL_VOCAB = np.array(['true', 'false', 'yes', 'no', '1', '0'], dtype=object)
+
+
+def load_table_columns(table_name):
+    """Reads the column layout of an import table from column_definitions."""
+    import data_manager
+    configs = data_manager.get_column_configs(table_name=table_name)
+    return [
+        {'name': name, 'data_type': conf['data_type'], 'is_unique': conf['is_unique'],
+         'is_mandatory': conf['is_mandatory'], 'aliases': conf['aliases']}
+        for name, conf in configs.items() if name != 'ImportDate'
+    ]
+
+
+def load_allowed_filename(table_name):
+    """First allowed_filename of the table (falls back to the table name)."""
+    import data_manager
+    for table in data_manager.get_import_tables():
+        if table['table_name'] == table_name and table.get('allowed_filename'):
+            return table['allowed_filename'].split(',')[0].strip()
+    return table_name
+
+
+def _date_vocab(start_date, days, date_format):
+    # Formatting a year of dates once and indexing into it beats strftime per row
+    return pd.date_range(start_date, periods=days, freq='D').strftime(date_format).to_numpy(dtype=object)
+
+
+def generate_chunk(columns, rng, offset, size, start_date='2025-01-01', duplicate_ratio=0.0,
+                   missing_rate=0.0, invalid_rate=0.0, date_format='%Y-%m-%d', dist_id=None):
+    """
+    Generates `size` rows (global row numbers offset..offset+size-1) as a
+    DataFrame of strings keyed by column name.
+    """
+    positions = np.arange(offset, offset + size)
+    date_vocab = _date_vocab(start_date, 365, date_format)
+    data = {}
+
+    for i, col in enumerate(columns):
+        name, data_type = col['name'], col['data_type']
+
+        if name.upper() == 'DISTID' and dist_id:
+            values = np.full(size, str(dist_id), dtype=object)
+        elif data_type == 'int':
+            values = rng.integers(0, 1000, size).astype(str).astype(object)
+        elif data_type == 'decimal':
+            values = (rng.integers(0, 10_000_000, size) / 100).astype(str).astype(object)
+        elif data_type == 'float':
+            values = rng.random(size).round(6).astype(str).astype(object)
+        elif data_type == 'bool':
+            values = BOOL_VOCAB[rng.integers(0, len(BOOL_VOCAB), size)]
+        elif data_type == 'date':
+            values = date_vocab[(positions + i) % len(date_vocab)]
+        elif data_type == 'datetime':
+            seconds = rng.integers(0, 86400, size)
+            times = pd.to_timedelta(seconds, unit='s').astype(str).str[-8:].to_numpy(dtype=object)
+            values = date_vocab[(positions + i) % len(date_vocab)] + ' ' + times
+        elif col['is_unique']:
+            ids = positions.copy()
+            if duplicate_ratio > 0:
+                dup = (rng.random(size) < duplicate_ratio) & (positions > 0)
+                ids[dup] = (rng.random(dup.sum()) * positions[dup]).astype(np.int64)
+            values = (name.upper()[:3] + pd.Series(ids).astype(str).str.zfill(8)).to_numpy(dtype=object)
+        else:
+            vocab = np.array([f"{name.upper()[:2]}{n:03d}" for n in range(10)], dtype=object)
+            values = vocab[positions % len(vocab)]
+
+        if invalid_rate > 0 and data_type in INVALID_VALUES:
+            bad = rng.random(size) < invalid_rate
+            values = values.copy()
+            values[bad] = rng.choice(INVALID_VALUES[data_type], bad.sum())
+        if missing_rate > 0:
+            gone = rng.random(size) < missing_rate
+            values = values.copy()
+            values[gone] = ''
+
+        data[name] = values
+
+    return pd.DataFrame(data)
+
+
+def write_table_csv(output_path, columns, row_count, seed=42, alias_rate=0.0, delimiter=',',
+                    encoding='utf-8', chunk_rows=CHUNK_ROWS, **chunk_options):
+    """Writes `row_count` generated rows to a CSV file, chunk by chunk."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    header = []
+    for col in columns:
+        aliases = [a for a in col.get('aliases', []) if a != col['name']]
+        header.append(rng.choice(aliases) if aliases and rng.random() < alias_rate else col['name'])
+
+    # One handle for the whole file so BOM-writing encodings (utf-16) emit a single BOM
+    with open(output_path, 'w', newline='', encoding=encoding) as f:
+        for offset in range(0, row_count, chunk_rows):
+            size = min(chunk_rows, row_count - offset)
+            chunk = generate_chunk(columns, rng, offset, size, **chunk_options)
+            chunk.to_csv(f, sep=delimiter, index=False, header=header if offset == 0 else False)
+        if row_count == 0:
+            f.write(delimiter.join(header) + '\n')
+
+    print(f"Generated {row_count} rows to {output_path}")
+    return output_path
+
+
+def generate_zip_batches(output_dir, tables, row_count, batches=1, seed=42, zip_prefix='batch', **options):
+    """
+    Writes `batches` ZIP files, each holding one CSV per table named after its
+    allowed_filename. `tables` is a list of (allowed_filename, columns).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    zip_paths = []
+    for b in range(batches):
+        zip_path = os.path.join(output_dir, f"{zip_prefix}_{b + 1:03d}.zip")
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for t, (allowed_filename, columns) in enumerate(tables):
+                csv_path = os.path.join(output_dir, f"{allowed_filename}.csv")
+                write_table_csv(csv_path, columns, row_count, seed=seed + b * 1000 + t, **options)
+                zf.write(csv_path, arcname=os.path.basename(csv_path))
+                os.remove(csv_path)
+        zip_paths.append(zip_path)
+        print(f"Packaged {zip_path}")
+    return zip_paths
 
 
 def generate_big_stock_csv(
     output_path: str,
     row_count: int = 200_000,
     start_date: str = "2025-01-01",
+    duplicate_ratio: float = 0.0,
+    date_format: str = "%Y-%m-%d",
+    seed: int = 42,
 ) -> None:
-    """Generate a large CSV for testing stock import.
-
-    Columns follow the default `stocks` config:
-    - sku (str, mandatory)
-    - warehouse_code (str, mandatory)
-    - stock_pcs (int, mandatory)
-    - stock_box (int)
-    - stock_cs (int)
-    - date (date, optional)
-    """
+    """Generate a large CSV for testing stock import (default `stocks` layout)."""
+    write_table_csv(output_path, STOCK_COLUMNS, row_count, seed=seed, start_date=start_date,
+                    duplicate_ratio=duplicate_ratio, date_format=date_format)
 
-    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
-    header = [
-        "sku",
-        "warehouse_code",
-        "stock_pcs",
-        "stock_box",
-        "stock_cs",
-        "date",
-    ]
+def main():
+    parser = argparse.ArgumentParser(description="Generate test data for import tables.")
+    parser.add_argument('--tables', default='', help="Comma-separated tables from column_definitions. Empty = default stocks layout (no DB).")
+    parser.add_argument('--rows', type=int, default=200_000, help="Rows per table file.")
+    parser.add_argument('--output-dir', default='.', help="Directory for generated files.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start-date', default='2025-01-01')
+    parser.add_argument('--date-format', default='%Y-%m-%d')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0, help="Fraction of rows reusing an earlier unique key.")
+    parser.add_argument('--missing-rate', type=float, default=0.0, help="Fraction of cells left empty.")
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help="Fraction of typed (non-string) cells with unparseable values.")
+    parser.add_argument('--alias-rate', type=float, default=0.0, help="Probability a header uses an alias instead of the column name.")
+    parser.add_argument('--delimiter', default=',')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--dist-id', default=None, help="Value for a DISTID column.")
+    parser.add_argument('--zip', action='store_true', help="Package each batch as a ZIP named per allowed_filename.")
+    parser.add_argument('--batches', type=int, default=1, help="Number of ZIP batches (with --zip).")
+    args = parser.parse_args()
 
-    base_date = datetime.strptime(start_date, "%Y-%m-%d")
-
-    with open(output_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-
-        for i in range(1, row_count + 1):
-            sku = f"SKU{i:06d}"
-            warehouse_code = f"WH{i % 10:03d}"  # 10 gudang
-            stock_pcs = (i * 3) % 1000
-            stock_box = (i * 2) % 200
-            stock_cs = i % 50
-            date_val = base_date + timedelta(days=i % 365)
-
-            writer.writerow([
-                sku,
-                warehouse_code,
-                stock_pcs,
-                stock_box,
-                stock_cs,
-                date_val.strftime("%Y-%m-%d"),
-            ])
+    table_names = [t.strip() for t in args.tables.split(',') if t.strip()]
+    if table_names:
+        tables = [(load_allowed_filename(t), load_table_columns(t)) for t in table_names]
+    else:
+        # Default: stocks layout, nama file bisa disesuaikan dengan `allowed_filename` di Master Config.
+        tables = [("pv_inventory_big", STOCK_COLUMNS)]
 
-    print(f"Generated {row_count} rows to {output_path}")
+    options = dict(
+        alias_rate=args.alias_rate, delimiter=args.delimiter, encoding=args.encoding,
+        start_date=args.start_date, date_format=args.date_format, duplicate_ratio=args.duplicate_ratio,
+        missing_rate=args.missing_rate, invalid_rate=args.invalid_rate, dist_id=args.dist_id,
+    )
+    if args.zip:
+        generate_zip_batches(args.output_dir, tables, args.rows, batches=args.batches, seed=args.seed, **options)
+    else:
+        for t, (allowed_filename, columns) in enumerate(tables):
+            write_table_csv(os.path.join(args.output_dir, f"{allowed_filename}.csv"), columns, args.rows,
+                            seed=args.seed + t, **options)
 
 
 if __name__ == "__main__":
-    # Default: buat file besar untuk tabel `stocks`.
-    # Nama file bisa kamu sesuaikan dengan `allowed_filename` di Master Config.
-    output_file = "pv_inventory_big.csv"  # ganti kalau perlu
-    generate_big_stock_csv(output_file, row_count=200_000)
+    main()
@@ -0,0 +1,268 @@
+"""
+Fair scheduling of background imports.
+
+Every uploaded file becomes one task in a per-tenant queue. A tenant is the
+dist_id of the upload (the user_id when no dist_id is given) at one
+priority level. A fixed pool of IMPORT_WORKERS threads dispatches tasks with
+smooth weighted round-robin across the non-empty queues, weighted by
+IMPORT_PRIORITY_WEIGHTS, so a distributor uploading 40 files gets one file
+in turn with everybody else instead of the whole pool. Tenants that already
+run IMPORT_MAX_ACTIVE_PER_DIST (or users at IMPORT_MAX_ACTIVE_PER_USER)
+files are passed over until one of their files finishes.
+
+An atomic batch (all-or-nothing, see data_manager.run_atomic_import) is
+queued as a single task holding all its files, so they are staged and
+promoted together by one worker.
+
+Queues live in memory: files still waiting when the process stops keep
+their "Waiting" (3) job status and have to be uploaded again.
+
+Admission control: admit() is asked before an upload body is read and
+refuses it (429 while the queue or the in-flight bytes are at their limit,
+503 when the upload folder would drop below UPLOAD_MIN_FREE_BYTES free).
+In-flight bytes are uploads being received plus files queued or importing.
+"""
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+import config
+import data_manager
+
+PRIORITIES = tuple(config.IMPORT_PRIORITY_WEIGHTS)
+DEFAULT_PRIORITY = 'normal'
+
+_cond = threading.Condition()
+_queues = {}      # (priority, tenant) -> deque of tasks
+_credit = {}      # (priority, tenant) -> smooth round-robin credit
+_running = {}     # ('dist', dist_id) / ('user', user_id) -> files importing now
+_active = 0       # files importing now, all tenants
+_reserved_bytes = 0  # request bodies admitted and still being handled
+_queued_bytes = 0    # files queued or importing
+_workers = []
+
+
+def normalize_priority(priority):
+    """Known priority level or None (empty = DEFAULT_PRIORITY)."""
+    priority = (priority or DEFAULT_PRIORITY).strip().lower()
+    return priority if priority in config.IMPORT_PRIORITY_WEIGHTS else None
+
+
+def _tenant(dist_id, user_id):
+    if dist_id:
+        return f"dist:{dist_id}"
+    if user_id:
+        return f"user:{user_id}"
+    return 'anonymous'
+
+
+def _capped(task):
+    """True while the task's distributor or user already runs its maximum number of files."""
+    if config.IMPORT_MAX_ACTIVE_PER_DIST > 0 and task['dist_id'] and \
+            _running.get(('dist', task['dist_id']), 0) >= config.IMPORT_MAX_ACTIVE_PER_DIST:
+        return True
+    if config.IMPORT_MAX_ACTIVE_PER_USER > 0 and task['user_id'] and \
+            _running.get(('user', task['user_id']), 0) >= config.IMPORT_MAX_ACTIVE_PER_USER:
+        return True
+    return False
+
+
+def _limits(task):
+    return [key for key in (('dist', task['dist_id']), ('user', task['user_id'])) if key[1]]
+
+
+def _next_task():
+    """
+    Smooth weighted round-robin (as in nginx upstreams) over the queues whose
+    head task is not capped. Called with _cond held. Returns a task or None.
+    """
+    global _active
+    eligible = [key for key, queue in _queues.items() if queue and not _capped(queue[0])]
+    if not eligible:
+        return None
+    total = 0
+    for key in eligible:
+        weight = config.IMPORT_PRIORITY_WEIGHTS[key[0]]
+        _credit[key] = _credit.get(key, 0) + weight
+        total += weight
+    chosen = max(eligible, key=lambda key: _credit[key])
+    _credit[chosen] -= total
+
+    task = _queues[chosen].popleft()
+    if not _queues[chosen]:
+        del _queues[chosen]
+        _credit.pop(chosen, None)
+    for key in _limits(task):
+        _running[key] = _running.get(key, 0) + 1
+    _active += 1
+    return task
+
+
+def _worker():
+    global _active, _queued_bytes
+    while True:
+        with _cond:
+            task = _next_task()
+            while task is None:
+                _cond.wait()
+                task = _next_task()
+        try:
+            scheduling = {
+                'priority': task['priority'], 'tenant': task['tenant'],
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            if task.get('filepaths'):
+                data_manager.run_atomic_import(task['batch'], task['filepaths'], queued_at=task['queued_at'],
+                                               scheduling=scheduling)
+            else:
+                data_manager.run_import_file(task['batch'], task['filepath'], queued_at=task['queued_at'],
+                                             scheduling=scheduling)
+        except Exception as e:
+            print(f"Import worker error on {task['filepath']}: {e}")
+        finally:
+            with _cond:
+                _active -= 1
+                _queued_bytes -= task['size']
+                for key in _limits(task):
+                    _running[key] -= 1
+                    if _running[key] <= 0:
+                        del _running[key]
+                _cond.notify_all()
+
+
+def _ensure_workers():
+    """Starts the worker pool on first use (called with _cond held)."""
+    while len(_workers) < max(config.IMPORT_WORKERS, 1):
+        thread = threading.Thread(target=_worker, name=f"import-worker-{len(_workers) + 1}", daemon=True)
+        _workers.append(thread)
+        thread.start()
+
+
+def submit_batch(file_paths, table_name, batch_id, temp_dirs=None, validation_timers=None, profile=False,
+                 dist_id=None, user_id=None, priority=DEFAULT_PRIORITY, atomic=False):
+    """
+    Queues every file of an upload batch for import (same arguments as
+    data_manager.process_import_async). With `atomic` the files are queued
+    as one all-or-nothing task. Returns immediately.
+    """
+    priority = normalize_priority(priority) or DEFAULT_PRIORITY
+    batch = data_manager._new_import_batch(file_paths, table_name, batch_id, temp_dirs, validation_timers, profile)
+    if not file_paths:
+        data_manager._finish_import_batch(batch)
+        return
+    global _queued_bytes
+    tenant = _tenant(dist_id, user_id)
+    queued_at = time.time()
+    sizes = [_file_size(filepath) for filepath in file_paths]
+    with _cond:
+        _ensure_workers()
+        queue = _queues.setdefault((priority, tenant), deque())
+        if atomic:
+            queue.append({
+                'batch': batch, 'filepath': file_paths[0], 'filepaths': list(file_paths), 'queued_at': queued_at,
+                'priority': priority, 'tenant': tenant, 'dist_id': dist_id, 'user_id': user_id, 'size': sum(sizes),
+            })
+        else:
+            for filepath, size in zip(file_paths, sizes):
+                queue.append({
+                    'batch': batch, 'filepath': filepath, 'queued_at': queued_at, 'priority': priority,
+                    'tenant': tenant, 'dist_id': dist_id, 'user_id': user_id, 'size': size,
+                })
+        _queued_bytes += sum(sizes)
+        _cond.notify_all()
+
+
+def _file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
+def _free_bytes(folder):
+    try:
+        return shutil.disk_usage(folder).free
+    except OSError:
+        return None
+
+
+def admit(nbytes, folder):
+    """
+    Reserves `nbytes` (the Content-Length of an upload) when the importer
+    has room for it. Returns None when admitted (call release(nbytes) once
+    the request is done) or (http_status, reason) when it is refused.
+    """
+    global _reserved_bytes
+    nbytes = max(nbytes or 0, 0)
+    free = _free_bytes(folder)
+    with _cond:
+        waiting = sum(len(queue) for queue in _queues.values())
+        if config.IMPORT_MAX_QUEUED_FILES > 0 and waiting >= config.IMPORT_MAX_QUEUED_FILES:
+            return 429, f"Import queue is full ({waiting} files waiting). Try again later."
+        inflight = _reserved_bytes + _queued_bytes
+        # An upload larger than the whole budget is still let through when nothing else is in flight
+        if config.IMPORT_MAX_INFLIGHT_BYTES > 0 and inflight and \
+                inflight + nbytes > config.IMPORT_MAX_INFLIGHT_BYTES:
+            return 429, "Too many uploads in progress. Try again later."
+        if free is not None and free - nbytes < config.UPLOAD_MIN_FREE_BYTES:
+            return 503, "Not enough free disk space for uploads. Try again later."
+        _reserved_bytes += nbytes
+    return None
+
+
+def release(nbytes):
+    """Releases bytes reserved by admit()."""
+    global _reserved_bytes
+    with _cond:
+        _reserved_bytes -= max(nbytes or 0, 0)
+
+
+def admission_stats(folder):
+    """Current admission limits and load (for GET /api/import/limits)."""
+    free = _free_bytes(folder)
+    with _cond:
+        waiting = sum(len(queue) for queue in _queues.values())
+        load = {
+            'queued_files': waiting,
+            'running_files': _active,
+            'reserved_bytes': _reserved_bytes,
+            'queued_bytes': _queued_bytes,
+            'inflight_bytes': _reserved_bytes + _queued_bytes,
+            'free_disk_bytes': free,
+        }
+    limits = {
+        'workers': max(config.IMPORT_WORKERS, 1),
+        'max_queued_files': config.IMPORT_MAX_QUEUED_FILES,
+        'max_inflight_bytes': config.IMPORT_MAX_INFLIGHT_BYTES,
+        'min_free_disk_bytes': config.UPLOAD_MIN_FREE_BYTES,
+        'max_active_per_dist': config.IMPORT_MAX_ACTIVE_PER_DIST,
+        'max_active_per_user': config.IMPORT_MAX_ACTIVE_PER_USER,
+        'retry_after_seconds': config.IMPORT_RETRY_AFTER_SECONDS,
+    }
+    saturated = bool(
+        (config.IMPORT_MAX_QUEUED_FILES > 0 and waiting >= config.IMPORT_MAX_QUEUED_FILES)
+        or (config.IMPORT_MAX_INFLIGHT_BYTES > 0 and load['inflight_bytes'] >= config.IMPORT_MAX_INFLIGHT_BYTES)
+        or (free is not None and free < config.UPLOAD_MIN_FREE_BYTES)
+    )
+    return {'accepting': not saturated, 'limits': limits, 'load': load}
+
+
+def queue_stats():
+    """Snapshot of waiting files per tenant/priority and running files per distributor/user."""
+    now = time.time()
+    with _cond:
+        waiting = [
+            {'priority': priority, 'tenant': tenant, 'files': len(queue),
+             'oldest_wait_seconds': round(now - queue[0]['queued_at'], 3)}
+            for (priority, tenant), queue in _queues.items() if queue
+        ]
+        running = [{'scope': scope, 'id': key, 'files': count} for (scope, key), count in _running.items()]
+        return {
+            'workers': len(_workers) or max(config.IMPORT_WORKERS, 1),
+            'waiting_files': sum(w['files'] for w in waiting),
+            'running_files': _active,
+            'waiting': sorted(waiting, key=lambda w: -w['oldest_wait_seconds']),
+            'running': running,
+        }
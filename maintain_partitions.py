@@ -0,0 +1,25 @@
+"""
+Pre-creates monthly partitions for partitioned import tables.
+Run daily from cron, e.g.:
+    0 1 * * * cd /path/to/app && python3 maintain_partitions.py
+"""
+import argparse
+
+import data_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-create future monthly partitions of import tables.")
+    parser.add_argument('--table', default=None, help="Only this table (default: all partitioned tables).")
+    parser.add_argument('--months-ahead', type=int, default=None, help="Months to create ahead (default: PARTITION_MONTHS_AHEAD).")
+    args = parser.parse_args()
+
+    created = data_manager.maintain_partitions(table_name=args.table, months_ahead=args.months_ahead)
+    if not created:
+        print("No partitioned tables found.")
+    for table, partitions in created.items():
+        print(f"{table}: {', '.join(partitions) if partitions else 'up to date'}")
+
+
+if __name__ == "__main__":
+    main()
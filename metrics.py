@@ -0,0 +1,143 @@
+"""
+In-process metrics for the import pipeline, rendered in Prometheus text format.
+
+Counters and histograms live in module-level dicts guarded by a lock, keyed by
+(metric name, sorted label items). StageTimer collects per-stage durations of
+one file so they can be persisted on the job row and fed into the histograms.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+ROWS_PER_SEC_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+METRIC_HELP = {
+    'import_files_total': ('counter', 'Imported files by table and final status.'),
+    'import_rows_total': ('counter', 'Imported rows by table and result.'),
+    'import_stage_seconds': ('histogram', 'Duration of each import stage per file.'),
+    'import_rows_per_second': ('histogram', 'Import throughput per file.'),
+    'import_queue_wait_seconds': ('histogram', 'Time a file waited between upload and start of processing.'),
+    'import_db_statement_seconds': ('histogram', 'Latency of individual write statements during import.'),
+    'quick_validate_stage_seconds': ('histogram', 'Duration of each quick validation stage per file.'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increments a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    """Records one observation in a histogram."""
+    observe_many(name, [value], buckets=buckets, **labels)
+
+
+def observe_many(name, values, buckets=SECONDS_BUCKETS, **labels):
+    """Records many observations at once (one lock round-trip), e.g. per-statement latencies."""
+    if not len(values):
+        return
+    counts = [0] * (len(buckets) + 1)
+    total = 0.0
+    for v in values:
+        counts[bisect.bisect_left(buckets, v)] += 1
+        total += v
+
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        for i, c in enumerate(counts):
+            hist['counts'][i] += c
+        hist['sum'] += total
+        hist['count'] += len(values)
+
+
+class StageTimer:
+    """Collects durations (seconds) and row counts per stage for one file, plus file facts (e.g. encoding)."""
+
+    def __init__(self):
+        self.stages = {}
+        self.rows = {}
+        self.info = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, other):
+        if other:
+            for name, seconds in other.stages.items():
+                self.add(name, seconds)
+            self.rows.update(other.rows)
+            self.info.update(other.info)
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'rows': dict(self.rows),
+            'total_seconds': round(self.total(), 4),
+            **self.info,
+        }
+
+    def export(self, metric, **labels):
+        """Feeds every stage duration into a histogram labelled by stage."""
+        for name, seconds in self.stages.items():
+            observe(metric, seconds, stage=name, **labels)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in items]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus():
+    """Renders all metrics in the Prometheus text exposition format (0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: {**h, 'counts': list(h['counts'])} for k, h in _histograms.items()}
+
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(hist['buckets']) + ['+Inf'], hist['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    return '\n'.join(lines) + '\n'
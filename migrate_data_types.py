@@ -0,0 +1,34 @@
+import data_manager
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Add decimal, float and bool to the data_type enum
+        try:
+            cursor.execute(
+                "ALTER TABLE column_definitions MODIFY COLUMN data_type "
+                "ENUM('str', 'int', 'date', 'datetime', 'decimal', 'float', 'bool') DEFAULT 'str'"
+            )
+            print("Modified 'data_type' ENUM to include 'decimal', 'float' and 'bool'.")
+        except Error as e:
+            print(f"Error modifying 'data_type': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,35 @@
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Date/datetime column (or ImportDate) a table is range-partitioned by, NULL = not partitioned
+        try:
+            cursor.execute("ALTER TABLE import_tables ADD COLUMN partition_column VARCHAR(64) NULL")
+            print("Added 'partition_column' column to import_tables.")
+        except Error as e:
+            if e.errno == 1060: # Duplicate column name
+                 print("'partition_column' column already exists.")
+            else:
+                 print(f"Error adding 'partition_column': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
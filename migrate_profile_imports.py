@@ -0,0 +1,36 @@
+
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Opt-in flag: run every import into this table under the profiler
+        try:
+            cursor.execute("ALTER TABLE import_tables ADD COLUMN profile_imports BOOLEAN DEFAULT FALSE")
+            print("Added 'profile_imports' column to import_tables.")
+        except Error as e:
+            if e.errno == 1060: # Duplicate column name
+                 print("'profile_imports' column already exists.")
+            else:
+                 print(f"Error adding 'profile_imports': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,35 @@
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Months of rows an import table keeps, NULL = forever (applied by retention.py)
+        try:
+            cursor.execute("ALTER TABLE import_tables ADD COLUMN retention_months INT NULL")
+            print("Added 'retention_months' column to import_tables.")
+        except Error as e:
+            if e.errno == 1060: # Duplicate column name
+                 print("'retention_months' column already exists.")
+            else:
+                 print(f"Error adding 'retention_months': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
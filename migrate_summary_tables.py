@@ -0,0 +1,40 @@
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Summary tables declared in master config, kept up to date by every import of source_table
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS summary_tables (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            summary_name VARCHAR(64) NOT NULL UNIQUE,
+            source_table VARCHAR(100) NOT NULL,
+            group_columns VARCHAR(1000) NOT NULL,
+            sum_columns VARCHAR(1000) NOT NULL DEFAULT '',
+            last_rebuilt_at DATETIME NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_summary_tables_source (source_table)
+        )
+        """)
+        print("Table 'summary_tables' created or already exists.")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
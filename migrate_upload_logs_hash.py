@@ -0,0 +1,47 @@
+
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # SHA-256 of the uploaded file and its target table, for duplicate upload detection
+        for column, definition in (('file_hash', 'CHAR(64) NULL'), ('table_name', 'VARCHAR(100) NULL')):
+            try:
+                cursor.execute(f"ALTER TABLE upload_logs ADD COLUMN {column} {definition}")
+                print(f"Added '{column}' column to upload_logs.")
+            except Error as e:
+                if e.errno == 1060: # Duplicate column name
+                     print(f"'{column}' column already exists.")
+                else:
+                     print(f"Error adding '{column}': {e}")
+
+        try:
+            cursor.execute("ALTER TABLE upload_logs ADD INDEX idx_upload_logs_file_hash (table_name, file_hash), "
+                           "ALGORITHM=INPLACE, LOCK=NONE")
+            print("Added index 'idx_upload_logs_file_hash'.")
+        except Error as e:
+            if e.errno == 1061: # Duplicate key name
+                 print("'idx_upload_logs_file_hash' index already exists.")
+            else:
+                 print(f"Error adding 'idx_upload_logs_file_hash': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
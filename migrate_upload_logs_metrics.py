@@ -0,0 +1,36 @@
+
+import data_manager
+import mysql.connector
+from mysql.connector import Error
+
+def migrate():
+    connection = data_manager.get_connection()
+    if not connection:
+        print("Failed to connect to DB.")
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # Per-stage durations and row counts of each imported file
+        try:
+            cursor.execute("ALTER TABLE upload_logs ADD COLUMN stage_metrics JSON NULL")
+            print("Added 'stage_metrics' column to upload_logs.")
+        except Error as e:
+            if e.errno == 1060: # Duplicate column name
+                 print("'stage_metrics' column already exists.")
+            else:
+                 print(f"Error adding 'stage_metrics': {e}")
+
+        connection.commit()
+        print("Migration completed.")
+
+    except Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,34 @@
+"""
+Rebuilds summary tables from their import tables, e.g. after declaring a
+summary, after rows were changed outside the import pipeline, or to check
+that the incremental updates did not drift:
+    python3 rebuild_summaries.py                    # every summary table
+    python3 rebuild_summaries.py --table sales      # summaries of one import table
+    python3 rebuild_summaries.py --summary sum_sales_by_DISTID
+The import table is locked against writes while it is scanned.
+"""
+import argparse
+
+import data_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute summary tables from their import tables.")
+    parser.add_argument('--table', default=None, help="Only summaries of this import table.")
+    parser.add_argument('--summary', default=None, help="Only this summary table.")
+    args = parser.parse_args()
+
+    summaries = [s for s in data_manager.get_summary_tables(source_table=args.table)
+                 if not args.summary or s['summary_name'] == args.summary]
+    if not summaries:
+        print("No summary tables found.")
+    for summary in summaries:
+        success, result = data_manager.rebuild_summary_table(summary['summary_name'])
+        if success:
+            print(f"{summary['summary_name']:<40} {result['groups']:>10} groups {result['seconds']:>8.1f}s")
+        else:
+            print(f"{summary['summary_name']:<40} failed: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Retention and archival for import tables and upload_logs.
+
+Policies: import_tables.retention_months per import table (NULL/0 = keep
+forever) and UPLOAD_LOGS_RETENTION_MONTHS for upload_logs. Rows older than
+the first day of the month N months back are written to a gzip CSV under
+ARCHIVE_FOLDER/<table>/ and then deleted in primary-key-ordered batches of
+RETENTION_BATCH_ROWS, each in its own short transaction, so no long locks
+are held. Each delete batch also subtracts its rows from the table's
+summary tables in the same transaction. Monthly partitions that lie
+entirely before the cutoff are archived and dropped as a whole; a DROP
+PARTITION cannot share a transaction with those updates, so the summaries
+of such a table are rebuilt afterwards instead.
+
+Usage:
+    python retention.py                      # all policies
+    python retention.py --table sales        # one table (import table or upload_logs)
+    python retention.py --dry-run            # only count expired rows
+"""
+import argparse
+import csv
+import gzip
+import os
+import time
+from datetime import datetime
+
+from mysql.connector import Error
+
+import config
+import data_manager
+
+UPLOAD_LOGS_TABLE = 'upload_logs'
+
+
+def get_policies():
+    """[(table_name, date_column, months)] for every table with a retention policy."""
+    policies = []
+    connection = data_manager.get_connection()
+    if not connection:
+        raise RuntimeError("Database connection failed.")
+    try:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT * FROM import_tables WHERE retention_months > 0")
+            rows = cursor.fetchall()
+        except Error:
+            # retention_months not migrated yet
+            rows = []
+        for row in rows:
+            policies.append((row['table_name'], row.get('partition_column') or 'ImportDate', row['retention_months']))
+        cursor.close()
+    finally:
+        connection.close()
+
+    if config.UPLOAD_LOGS_RETENTION_MONTHS > 0:
+        policies.append((UPLOAD_LOGS_TABLE, 'created_at', config.UPLOAD_LOGS_RETENTION_MONTHS))
+    return policies
+
+
+def retention_cutoff(months, today=None):
+    """First day of the month `months` months back: rows before it are expired."""
+    return data_manager._month_start(today or datetime.now().date(), -months)
+
+
+def _primary_key_column(cursor, table_name):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+        ORDER BY ORDINAL_POSITION LIMIT 1
+    """, (table_name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _expired_partitions(table_name, cutoff):
+    """Monthly partitions (pYYYYMM) whose whole range is before the cutoff."""
+    bound = f"{cutoff:%Y-%m-%d}"
+    return [p['name'] for p in data_manager.get_partitions(table_name)
+            if p['name'][1:].isdigit() and p['less_than'] and p['less_than'] <= bound]
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+class _Archive:
+    """Gzip CSV archive opened lazily on the first archived row."""
+
+    def __init__(self, table_name, cutoff):
+        folder = os.path.join(config.ARCHIVE_FOLDER, table_name)
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        self.path = os.path.join(folder, f"{table_name}_before_{cutoff:%Y%m%d}_{stamp}.csv.gz")
+        self._file = None
+        self._writer = None
+
+    def write(self, columns, rows):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, 'wt', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+        self._writer.writerows([_csv_value(v) for v in row] for row in rows)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            return self.path
+        return None
+
+
+def _archive_and_delete(connection, table_name, key_column, where_sql, params, archive, batch_rows, delete=True,
+                        summary_source=None):
+    """
+    Keyset loop over `key_column`: archive a batch, delete exactly those keys
+    and commit. With delete=False rows are only archived (the caller drops
+    the partition afterwards). With `summary_source` (the import table) the
+    deleted rows are subtracted from its summary tables in the batch's
+    transaction. Returns the row count.
+    """
+    cursor = connection.cursor()
+    total = 0
+    last_key = None
+    summary_types = None
+    try:
+        while True:
+            keyset = f" AND {key_column} > %s" if last_key is not None else ""
+            cursor.execute(
+                f"SELECT * FROM {table_name} WHERE {where_sql}{keyset} ORDER BY {key_column} LIMIT %s",
+                tuple(params) + ((last_key,) if last_key is not None else ()) + (batch_rows,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            columns = cursor.column_names
+            key_index = columns.index(key_column)
+            keys = [row[key_index] for row in rows]
+
+            # Archive first: a crash between the two steps leaves a row archived twice, never lost
+            archive.write(columns, rows)
+            total += len(rows)
+            last_key = keys[-1]
+            if not delete:
+                continue
+
+            placeholders = ', '.join(['%s'] * len(keys))
+            summaries = data_manager._read_summary_tables(connection, summary_source, lock=True) if summary_source else []
+            if summaries:
+                summary_types = summary_types or data_manager._summary_column_types(summary_source)
+                deltas = {}
+                data_manager._collect_summary_deltas(cursor, summaries, summary_types, table_name,
+                                                     f"{key_column} IN ({placeholders})", keys, deltas, -1, lock=True)
+            cursor.execute(f"DELETE FROM {table_name} WHERE {key_column} IN ({placeholders})", keys)
+            if summaries:
+                data_manager._apply_summary_deltas(cursor, summaries, deltas)
+            connection.commit()
+            if config.RETENTION_BATCH_SLEEP > 0:
+                time.sleep(config.RETENTION_BATCH_SLEEP)
+    finally:
+        cursor.close()
+    return total
+
+
+def apply_retention(table_name, date_column, months, dry_run=False, batch_rows=None):
+    """
+    Archives and deletes rows of `table_name` with `date_column` older than
+    `months` months. Returns a report dict (rows, partitions dropped,
+    seconds, rows_per_sec, archive path).
+    """
+    batch_rows = batch_rows or config.RETENTION_BATCH_ROWS
+    cutoff = retention_cutoff(months)
+    report = {'table_name': table_name, 'cutoff': f"{cutoff:%Y-%m-%d}", 'rows': 0,
+              'partitions_dropped': [], 'archive': None, 'seconds': 0.0, 'rows_per_sec': None}
+    started = time.perf_counter()
+
+    connection = data_manager.get_connection()
+    if not connection:
+        raise RuntimeError("Database connection failed.")
+    archive = _Archive(table_name, cutoff)
+    try:
+        cursor = connection.cursor()
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE {date_column} < %s", (cutoff,))
+            report['rows'] = cursor.fetchone()[0]
+            report['partitions_dropped'] = _expired_partitions(table_name, cutoff)
+            cursor.close()
+            return report
+
+        key_column = _primary_key_column(cursor, table_name)
+        cursor.close()
+        if not key_column:
+            raise RuntimeError(f"{table_name} has no primary key; batched deletes need one.")
+
+        # Whole expired partitions: archive their rows, then drop them (metadata only)
+        for partition in _expired_partitions(table_name, cutoff):
+            report['rows'] += _archive_and_delete(
+                connection, f"{table_name} PARTITION ({partition})", key_column, "1 = 1", (), archive, batch_rows,
+                delete=False)
+            cursor = connection.cursor()
+            cursor.execute(f"ALTER TABLE {table_name} DROP PARTITION {partition}")
+            cursor.close()
+            report['partitions_dropped'].append(partition)
+
+        # Remaining expired rows (unpartitioned tables, history partition)
+        report['rows'] += _archive_and_delete(
+            connection, table_name, key_column, f"{date_column} < %s", (cutoff,), archive, batch_rows,
+            summary_source=None if table_name == UPLOAD_LOGS_TABLE else table_name)
+    finally:
+        report['archive'] = archive.close()
+        if connection.is_connected():
+            connection.close()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    if report['seconds'] > 0:
+        report['rows_per_sec'] = round(report['rows'] / report['seconds'], 1)
+    return report
+
+
+def run(table_name=None, dry_run=False):
+    reports = []
+    for table, date_column, months in get_policies():
+        if table_name and table != table_name:
+            continue
+        try:
+            report = apply_retention(table, date_column, months, dry_run=dry_run)
+        except Exception as e:
+            print(f"{table}: retention failed: {e}")
+            continue
+        reports.append(report)
+        if report['partitions_dropped'] and not dry_run:
+            # Batched deletes already updated the summaries; dropped partitions need a recount
+            for summary in data_manager.get_summary_tables(source_table=table):
+                success, result = data_manager.rebuild_summary_table(summary['summary_name'])
+                if not success:
+                    print(f"{table}: rebuilding summary {summary['summary_name']} failed: {result}")
+        action = "expired" if dry_run else "archived+deleted"
+        print(f"{table:<24} keep={months:>3}m cutoff={report['cutoff']} {report['rows']:>10} rows {action} "
+              f"{report['seconds']:>8.1f}s {report['rows_per_sec'] or 0:>10.0f} rows/s"
+              + (f" dropped={','.join(report['partitions_dropped'])}" if report['partitions_dropped'] else "")
+              + (f" -> {report['archive']}" if report['archive'] else ""))
+    if not reports:
+        print("No retention policies matched.")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and delete expired rows of import tables and upload_logs.")
+    parser.add_argument('--table', default=None, help="Only this table (default: every table with a policy).")
+    parser.add_argument('--dry-run', action='store_true', help="Only count expired rows, change nothing.")
+    args = parser.parse_args()
+    run(table_name=args.table, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
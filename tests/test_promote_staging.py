@@ -0,0 +1,140 @@
+"""
+Atomic batch promotion against a real MySQL server.
+
+Runs only when TEST_DB_NAME names a scratch database (TEST_DB_HOST,
+TEST_DB_USER and TEST_DB_PASSWORD default to the DB_* settings); the tables
+it creates are dropped afterwards. Never point it at the app database.
+
+    TEST_DB_NAME=import_test python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import data_manager
+
+TEST_DB_NAME = os.getenv('TEST_DB_NAME')
+pytestmark = pytest.mark.skipif(not TEST_DB_NAME, reason="TEST_DB_NAME (scratch MySQL database) not set")
+
+KEYED = 'test_promote_keyed'
+KEYLESS = 'test_promote_keyless'
+CONFIGS = {
+    KEYED: {
+        'sku': {'is_mandatory': True, 'is_unique': True, 'data_type': 'str', 'aliases': ['sku']},
+        'qty': {'is_mandatory': True, 'is_unique': False, 'data_type': 'int', 'aliases': ['qty']},
+    },
+    KEYLESS: {
+        'sku': {'is_mandatory': True, 'is_unique': False, 'data_type': 'str', 'aliases': ['sku']},
+        'qty': {'is_mandatory': True, 'is_unique': False, 'data_type': 'int', 'aliases': ['qty']},
+    },
+}
+
+
+def _execute(*statements, fetch=False):
+    connection = data_manager.get_connection()
+    assert connection, "Database connection failed."
+    try:
+        cursor = connection.cursor()
+        for sql in statements:
+            cursor.execute(sql)
+        rows = cursor.fetchall() if fetch else None
+        connection.commit()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
+
+
+def _create(table_name, unique):
+    _execute(
+        f"DROP TABLE IF EXISTS {table_name}",
+        f"CREATE TABLE {table_name} (id INT AUTO_INCREMENT PRIMARY KEY, "
+        f"sku VARCHAR(32) NOT NULL{' UNIQUE' if unique else ''}, qty INT NOT NULL, "
+        f"ImportDate DATETIME DEFAULT CURRENT_TIMESTAMP)",
+    )
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'DB_HOST', os.getenv('TEST_DB_HOST', config.DB_HOST))
+    monkeypatch.setattr(config, 'DB_USER', os.getenv('TEST_DB_USER', config.DB_USER))
+    monkeypatch.setattr(config, 'DB_PASSWORD', os.getenv('TEST_DB_PASSWORD', config.DB_PASSWORD))
+    monkeypatch.setattr(config, 'DB_NAME', TEST_DB_NAME)
+    monkeypatch.setattr(data_manager, 'get_column_configs', lambda table_name=None: CONFIGS[table_name])
+    _execute("CREATE TABLE IF NOT EXISTS import_tables "
+             "(table_name VARCHAR(100), allowed_filename VARCHAR(255) DEFAULT '')")
+    _create(KEYED, unique=True)
+    _create(KEYLESS, unique=False)
+    _execute(f"INSERT INTO {KEYED} (sku, qty, ImportDate) VALUES "
+             f"('A', 1, '2020-01-01'), ('B', 2, '2020-01-01'), ('C', 3, '2020-01-01')",
+             f"INSERT INTO {KEYLESS} (sku, qty) VALUES ('A', 1), ('B', 2)")
+    yield tmp_path
+    _execute(f"DROP TABLE IF EXISTS {KEYED}", f"DROP TABLE IF EXISTS {KEYLESS}",
+             f"DROP TABLE IF EXISTS {KEYED}_stage", f"DROP TABLE IF EXISTS {KEYLESS}_stage")
+
+
+def _stage(table_name):
+    staging = f"{table_name}_stage"
+    _execute(f"DROP TABLE IF EXISTS {staging}", f"CREATE TABLE {staging} LIKE {table_name}")
+    return staging
+
+
+def _csv(tmp_path, table_name, lines):
+    path = tmp_path / f"{table_name}.csv"
+    path.write_text("sku,qty\n" + "".join(f"{line}\n" for line in lines))
+    return str(path)
+
+
+def test_promote_keyed_insert_update_unchanged(db):
+    staging = _stage(KEYED)
+    # A unchanged, B updated, D new
+    _execute(f"INSERT INTO {staging} (sku, qty) VALUES ('A', 1), ('B', 20), ('D', 4)")
+
+    ok, affected = data_manager.promote_staging_tables({KEYED: staging})
+
+    assert ok, affected
+    # ODKU rowcount: 0 unchanged + 2 updated + 1 inserted
+    assert affected == {KEYED: 3}
+    rows = _execute(f"SELECT sku, qty, ImportDate = '2020-01-01' FROM {KEYED} ORDER BY sku", fetch=True)
+    assert rows == [('A', 1, 1), ('B', 20, 0), ('C', 3, 1), ('D', 4, 0)]
+
+
+def test_promote_keyless_skips_stored_rows(db):
+    staging = _stage(KEYLESS)
+    _execute(f"INSERT INTO {staging} (sku, qty) VALUES ('A', 1), ('A', 5), ('C', 3)")
+
+    ok, affected = data_manager.promote_staging_tables({KEYLESS: staging})
+
+    assert ok, affected
+    assert affected == {KEYLESS: 2}
+    rows = _execute(f"SELECT sku, qty FROM {KEYLESS} ORDER BY sku, qty", fetch=True)
+    assert rows == [('A', 1), ('A', 5), ('B', 2), ('C', 3)]
+
+
+def test_staged_import_counts_match_promotion(db):
+    staging = _stage(KEYED)
+    # A unchanged, B and C updated, D new, E new with a repeated key (row-by-row path)
+    path = _csv(db, KEYED, ['A,1', 'B,20', 'C,30', 'D,4', 'E,5', 'E,6'])
+
+    ok, result = data_manager.import_file_process(path, KEYED, write_table=staging)
+
+    assert ok, result
+    assert (result['inserted'], result['updated'], result['unchanged']) == (2, 3, 1)
+    ok, _ = data_manager.promote_staging_tables({KEYED: staging})
+    assert ok
+    rows = _execute(f"SELECT sku, qty FROM {KEYED} ORDER BY sku", fetch=True)
+    assert rows == [('A', 1), ('B', 20), ('C', 30), ('D', 4), ('E', 6)]
+
+
+def test_staged_keyless_import_counts_stored_rows_unchanged(db):
+    staging = _stage(KEYLESS)
+    path = _csv(db, KEYLESS, ['A,1', 'B,2', 'C,3'])
+
+    ok, result = data_manager.import_file_process(path, KEYLESS, write_table=staging)
+
+    assert ok, result
+    assert (result['inserted'], result['unchanged']) == (1, 2)
@@ -0,0 +1,97 @@
+"""
+Incremental summary maintenance against a real MySQL server.
+
+Runs only when TEST_DB_NAME names a scratch database (TEST_DB_HOST,
+TEST_DB_USER and TEST_DB_PASSWORD default to the DB_* settings); the tables
+it creates are dropped afterwards. Never point it at the app database.
+
+    TEST_DB_NAME=import_test python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import data_manager
+import migrate_summary_tables
+
+TEST_DB_NAME = os.getenv('TEST_DB_NAME')
+pytestmark = pytest.mark.skipif(not TEST_DB_NAME, reason="TEST_DB_NAME (scratch MySQL database) not set")
+
+TABLE = 'test_summary_items'
+SUMMARY = 'test_summary_items_by_wh'
+CONFIGS = {
+    'code': {'is_mandatory': True, 'is_unique': True, 'data_type': 'str', 'aliases': ['code']},
+    'ean': {'is_mandatory': True, 'is_unique': True, 'data_type': 'str', 'aliases': ['ean']},
+    'wh': {'is_mandatory': True, 'is_unique': False, 'data_type': 'str', 'aliases': ['wh']},
+    'qty': {'is_mandatory': True, 'is_unique': False, 'data_type': 'int', 'aliases': ['qty']},
+}
+
+
+def _execute(*statements, fetch=False):
+    connection = data_manager.get_connection()
+    assert connection, "Database connection failed."
+    try:
+        cursor = connection.cursor()
+        for sql in statements:
+            cursor.execute(sql)
+        rows = cursor.fetchall() if fetch else None
+        connection.commit()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'DB_HOST', os.getenv('TEST_DB_HOST', config.DB_HOST))
+    monkeypatch.setattr(config, 'DB_USER', os.getenv('TEST_DB_USER', config.DB_USER))
+    monkeypatch.setattr(config, 'DB_PASSWORD', os.getenv('TEST_DB_PASSWORD', config.DB_PASSWORD))
+    monkeypatch.setattr(config, 'DB_NAME', TEST_DB_NAME)
+    monkeypatch.setattr(data_manager, 'get_column_configs', lambda table_name=None: CONFIGS)
+    monkeypatch.setattr(data_manager, 'get_import_tables', lambda: [{'table_name': TABLE}])
+    _execute("CREATE TABLE IF NOT EXISTS import_tables "
+             "(table_name VARCHAR(100), allowed_filename VARCHAR(255) DEFAULT '')")
+    migrate_summary_tables.migrate()
+    data_manager.delete_summary_table(SUMMARY)
+    _execute(
+        f"DROP TABLE IF EXISTS {TABLE}",
+        # Default (case-insensitive) collation: 'ABC' and 'abc' are the same key
+        f"CREATE TABLE {TABLE} (id INT AUTO_INCREMENT PRIMARY KEY, code VARCHAR(32) NOT NULL UNIQUE, "
+        f"ean VARCHAR(32) NOT NULL UNIQUE, wh VARCHAR(16) NOT NULL, qty INT NOT NULL, "
+        f"ImportDate DATETIME DEFAULT CURRENT_TIMESTAMP)",
+        f"INSERT INTO {TABLE} (code, ean, wh, qty) VALUES ('abc', 'E1', 'W1', 5), ('xyz', 'E2', 'W1', 1)",
+    )
+    ok, name = data_manager.add_summary_table(TABLE, ['wh'], ['qty'], SUMMARY)
+    assert ok, name
+    ok, result = data_manager.rebuild_summary_table(SUMMARY)
+    assert ok, result
+    yield tmp_path
+    data_manager.delete_summary_table(SUMMARY)
+    _execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def _summary():
+    return _execute(f"SELECT wh, row_count, sum_qty FROM {SUMMARY} ORDER BY wh", fetch=True)
+
+
+def _recount():
+    return _execute(f"SELECT wh, COUNT(*), SUM(qty) FROM {TABLE} GROUP BY wh ORDER BY wh", fetch=True)
+
+
+def test_reimport_with_first_key_in_other_case_keeps_summary_exact(db):
+    assert _summary() == [('W1', 2, 6)]
+    # The prefetch compares keys as text, so 'ABC' looks new although 'abc' is stored; the bulk
+    # insert then fails on code and the row is upserted over the stored row it also shares ean with
+    path = db / f"{TABLE}.csv"
+    path.write_text("code,ean,wh,qty\nABC,E1,W1,7\nnew,E3,W2,4\n")
+
+    ok, result = data_manager.import_file_process(str(path), TABLE)
+
+    assert ok, result
+    assert _recount() == [('W1', 2, 8), ('W2', 1, 4)]
+    assert _summary() == _recount()
@@ -0,0 +1,342 @@
+"""
+Infers compact column types from a sample of an uploaded file.
+
+The file is streamed once in chunks of strings. Every column keeps a
+ColumnProfile that narrows the candidate types chunk by chunk, from the
+narrowest type outwards: bool, int (INT/BIGINT), decimal (DECIMAL(p,s),
+DOUBLE when it does not fit), date/datetime, then string (CHAR(n) for
+fixed-width codes, VARCHAR(n) otherwise). Distinct counts come from a
+fixed-size DistinctSketch, so memory stays flat however large the sample.
+The result is a proposal for create_new_import_table: a column_definitions
+data_type plus the physical sql_type. Sizes leave headroom over the sample
+(a later file with slightly larger values must not overflow the column).
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import config
+import csv_utils
+import data_manager
+
+# 1/0 columns are proposed as INT, only word tokens make a bool
+BOOL_WORDS = (data_manager.BOOL_TRUE_VALUES | data_manager.BOOL_FALSE_VALUES) - {'1', '0'}
+
+# INT is the floor: the few bytes TINYINT/SMALLINT save are not worth rejected rows later
+INT_TYPES = (
+    ('INT', -2 ** 31, 2 ** 31 - 1),
+    ('BIGINT', -2 ** 63, 2 ** 63 - 1),
+)
+# Integers must fit with this factor of room over the sample's min/max
+INT_HEADROOM = 10
+DECIMAL_MAX_PRECISION = 65
+DECIMAL_MAX_SCALE = 30
+# Integer digits of a proposed DECIMAL: at least the floor, else the sample's plus the headroom
+DECIMAL_MIN_INTEGER_DIGITS = 10
+DECIMAL_INTEGER_HEADROOM = 4
+VARCHAR_STEPS = (16, 32, 64, 128, 255, 512, 1024)
+# VARCHAR(n) is the first step at least this factor over the longest value
+VARCHAR_HEADROOM = 2
+CHAR_MAX_LENGTH = 32
+
+# Distinct-count sketch size: relative error is about 1/sqrt(k) (~1.6%)
+DISTINCT_SKETCH_SIZE = 4096
+# Only codes make good upsert keys; unique floats or dates are usually coincidence
+UNIQUE_KEY_TYPES = ('str', 'int')
+
+_INT_RE = r'[+-]?\d+'
+_DECIMAL_RE = r'[+-]?(?:\d+\.\d*|\.\d+|\d+)'
+_DATE_HINT_RE = r'.*[-/:].*'
+
+
+def read_sample(filepath, rows=None):
+    """Reads up to `rows` data rows as strings with the detected encoding and delimiter."""
+    rows = rows or config.TYPE_INFERENCE_SAMPLE_ROWS
+    return csv_utils.read_csv(filepath, nrows=rows)
+
+
+def column_name(header):
+    """DB column name proposed for a file header: lowercase, non-alphanumerics as underscores."""
+    name = re.sub(r'[^0-9a-zA-Z_]+', '_', str(header).strip().lower()).strip('_')
+    return name or 'column'
+
+
+class DistinctSketch:
+    """
+    K-minimum-values sketch: keeps the k smallest 64-bit hashes seen. Exact
+    while fewer than k distinct values were seen, an estimate afterwards.
+    """
+
+    def __init__(self, k=DISTINCT_SKETCH_SIZE):
+        self.k = k
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def update(self, values):
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        if len(self.hashes) == self.k:
+            hashes = hashes[hashes < self.hashes[-1]]
+        self.hashes = np.unique(np.concatenate([self.hashes, hashes]))[:self.k]
+
+    @property
+    def exact(self):
+        return len(self.hashes) < self.k
+
+    def estimate(self):
+        if self.exact:
+            return len(self.hashes)
+        return int((self.k - 1) * 2.0 ** 64 / (float(self.hashes[-1]) + 1))
+
+
+def _int_type(low, high):
+    for sql_type, type_low, type_high in INT_TYPES:
+        if low * INT_HEADROOM >= type_low and high * INT_HEADROOM <= type_high:
+            return sql_type
+    # Fits BIGINT, just without the headroom
+    if low >= INT_TYPES[-1][1] and high <= INT_TYPES[-1][2]:
+        return INT_TYPES[-1][0]
+    return None
+
+
+def _decimal_type(integer_digits, scale):
+    if integer_digits > DECIMAL_MAX_PRECISION - scale or scale > DECIMAL_MAX_SCALE:
+        return 'float', 'DOUBLE'
+    integer_digits = max(integer_digits + DECIMAL_INTEGER_HEADROOM, DECIMAL_MIN_INTEGER_DIGITS)
+    precision = min(integer_digits + scale, DECIMAL_MAX_PRECISION)
+    return 'decimal', f"DECIMAL({precision},{scale})"
+
+
+def _string_type(min_length, max_length):
+    if 0 < max_length <= CHAR_MAX_LENGTH and min_length == max_length:
+        return f"CHAR({max_length})"
+    for step in VARCHAR_STEPS:
+        if max_length * VARCHAR_HEADROOM <= step:
+            return f"VARCHAR({step})"
+    return 'TEXT'
+
+
+class ColumnProfile:
+    """Type candidates, nullability and distinct count of one column, updated chunk by chunk."""
+
+    def __init__(self, header):
+        self.header = str(header).strip()
+        self.rows = 0
+        self.filled = 0
+        self.min_length = None
+        self.max_length = 0
+        self.has_duplicates = False
+        self.sketch = DistinctSketch()
+
+        self.is_bool = self.is_int = self.is_decimal = self.is_date = True
+        self.leading_zero = False
+        self.int_min = self.int_max = None
+        self.integer_digits = 0
+        self.scale = 0
+        self.has_time = False
+
+    def update(self, series):
+        self.rows += len(series)
+        values = series.dropna().astype(str).str.strip()
+        values = values[values != '']
+        if values.empty:
+            return self
+        self.filled += len(values)
+
+        lengths = values.str.len()
+        low = int(lengths.min())
+        self.min_length = low if self.min_length is None else min(self.min_length, low)
+        self.max_length = max(self.max_length, int(lengths.max()))
+        # Duplicates inside a chunk are exact; across chunks only the sketch can tell
+        self.has_duplicates = self.has_duplicates or bool(values.duplicated().any())
+        self.sketch.update(values)
+
+        if self.is_bool:
+            self.is_bool = bool(values.str.lower().isin(BOOL_WORDS).all())
+        if self.is_int:
+            self.is_int = bool(values.str.fullmatch(_INT_RE).all())
+            if self.is_int:
+                # Leading zeros are codes (e.g. '0012'), not numbers
+                self.leading_zero = self.leading_zero or bool(values.str.fullmatch(r'[+-]?0\d+').any())
+                numbers = pd.to_numeric(values, errors='coerce')
+                low, high = numbers.min(), numbers.max()
+                self.int_min = low if self.int_min is None else min(self.int_min, low)
+                self.int_max = high if self.int_max is None else max(self.int_max, high)
+        if self.is_decimal:
+            self.is_decimal = bool(values.str.fullmatch(_DECIMAL_RE).all())
+            if self.is_decimal:
+                parts = values.str.lstrip('+-').str.split('.', n=1, expand=True)
+                self.integer_digits = max(self.integer_digits, int(parts[0].str.lstrip('0').str.len().max()))
+                if parts.shape[1] > 1:
+                    self.scale = max(self.scale, int(parts[1].fillna('').str.len().max()))
+        if self.is_date:
+            self.is_date = bool(values.str.fullmatch(_DATE_HINT_RE).all())
+            if self.is_date:
+                parsed = data_manager._parse_dates(values)
+                self.is_date = bool(parsed.notna().all())
+                if self.is_date and not self.has_time:
+                    self.has_time = bool((parsed != parsed.dt.normalize()).any() or values.str.contains(':').any())
+        return self
+
+    def data_type(self):
+        """
+        (data_type, sql_type) of the narrowest type every value seen so far
+        fits with headroom. Empty columns stay VARCHAR(255).
+        """
+        if not self.filled:
+            return 'str', 'VARCHAR(255)'
+        if self.is_bool:
+            return 'bool', 'TINYINT(1)'
+        if self.is_int:
+            sql_type = None if self.leading_zero else _int_type(self.int_min, self.int_max)
+            if sql_type:
+                return 'int', sql_type
+        elif self.is_decimal:
+            return _decimal_type(self.integer_digits, self.scale)
+        if self.is_date:
+            return ('datetime', 'DATETIME') if self.has_time else ('date', 'DATE')
+        return 'str', _string_type(self.min_length, self.max_length)
+
+    @property
+    def is_mandatory(self):
+        return self.rows > 0 and self.filled == self.rows
+
+    @property
+    def is_unique_candidate(self):
+        """Every row filled and no value seen twice (within the sketch's error once it is full)."""
+        if not self.is_mandatory or self.has_duplicates or self.data_type()[0] not in UNIQUE_KEY_TYPES:
+            return False
+        distinct = self.sketch.estimate()
+        if self.sketch.exact:
+            return distinct == self.filled
+        return bool(distinct >= self.filled * (1 - 2 / np.sqrt(self.sketch.k)))
+
+
+def infer_series_type(series):
+    """
+    Proposes (data_type, sql_type) for one column of strings.
+    Empty cells are ignored; an all-empty column stays VARCHAR(255).
+    """
+    return ColumnProfile(series.name).update(series).data_type()
+
+
+def profile_frames(frames):
+    """Streams DataFrames read with dtype=str into one ColumnProfile per header. Returns (rows, profiles)."""
+    profiles = {}
+    rows = 0
+    for frame in frames:
+        rows += len(frame)
+        for header in frame.columns:
+            if header not in profiles:
+                profiles[header] = ColumnProfile(header)
+            profiles[header].update(frame[header])
+    return rows, list(profiles.values())
+
+
+def profile_file(filepath, rows=None):
+    """
+    Profiles a CSV/TXT file in one pass of DRYRUN_CHUNK_ROWS chunks.
+    `rows` caps the rows read (default: the whole file). Returns (rows, profiles).
+    """
+    encoding = csv_utils.detect_encoding(filepath)
+    delimiter = csv_utils.sniff_delimiter(filepath, encoding=encoding)
+    (row_count, profiles), encoding = csv_utils.read_csv_chunks(
+        filepath, profile_frames, config.DRYRUN_CHUNK_ROWS, sep=delimiter, nrows=rows, encoding=encoding)
+    if not profiles:
+        # Header-only file: no chunks, but the columns are still known
+        header = pd.read_csv(filepath, sep=delimiter, dtype=str, nrows=0, encoding=encoding)
+        profiles = [ColumnProfile(h) for h in header.columns]
+    return row_count, profiles
+
+
+def _proposal(profile):
+    data_type, sql_type = profile.data_type()
+    return {
+        'name': column_name(profile.header),
+        'header': profile.header,
+        'type': data_type,
+        'sql_type': sql_type,
+        'is_mandatory': profile.is_mandatory,
+        'max_length': profile.max_length,
+    }
+
+
+def infer_column_types(df):
+    """
+    Proposes a column definition for every column of `df` (read with dtype=str):
+    [{"name", "header", "type", "sql_type", "is_mandatory", "max_length"}].
+    """
+    return [_proposal(profile) for profile in profile_frames([df])[1]]
+
+
+def infer_file_types(filepath, rows=None):
+    """infer_column_types on the first `rows` rows of a CSV/TXT file."""
+    _, profiles = profile_file(filepath, rows or config.TYPE_INFERENCE_SAMPLE_ROWS)
+    return [_proposal(profile) for profile in profiles]
+
+
+def propose_table(filepath, rows=None, known_columns=None):
+    """
+    Ready-to-submit body for POST /api/tables from one sample file: table
+    and filename from the file name, one column per header with type,
+    sql_type, is_mandatory, the first exactly verified unique key candidate
+    as is_unique and aliases. `known_columns` (data_manager.get_known_columns) maps headers
+    already used by other tables to their column name and aliases, so a
+    feed reuses the names it is imported under elsewhere.
+    """
+    known_columns = known_columns or {}
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    row_count, profiles = profile_file(filepath, rows)
+
+    columns, stats = [], []
+    used = set()
+    unique_key = None
+    for profile in profiles:
+        column = _proposal(profile)
+        header = profile.header.lower()
+        known = known_columns.get(header)
+        if known and known['column_name'].lower() not in used:
+            column['name'] = known['column_name']
+        else:
+            known = None
+        name, n = column['name'], 2
+        while column['name'].lower() in used:
+            column['name'] = f"{name}_{n}"
+            n += 1
+        used.add(column['name'].lower())
+        aliases = set(known['aliases']) if known else set()
+        if header != column['name'].lower():
+            aliases.add(header)
+        aliases.discard(column['name'].lower())
+
+        # Past the sketch size duplicates can hide in the estimate error, and a wrong
+        # unique key makes later imports upsert distinct rows over each other
+        is_unique = unique_key is None and profile.sketch.exact and profile.is_unique_candidate
+        if is_unique:
+            unique_key = column['name']
+        columns.append({
+            'name': column['name'],
+            'type': column['type'],
+            'sql_type': column['sql_type'],
+            'is_mandatory': column['is_mandatory'],
+            'is_unique': is_unique,
+            'aliases': sorted(aliases),
+        })
+        stats.append({
+            'name': column['name'],
+            'header': profile.header,
+            'null_count': profile.rows - profile.filled,
+            'distinct_estimate': profile.sketch.estimate(),
+            'distinct_exact': profile.sketch.exact,
+            'unique_candidate': profile.is_unique_candidate,
+            'max_length': profile.max_length,
+            'known_from': known['table_names'] if known else [],
+        })
+
+    return {
+        'table_name': column_name(stem),
+        'display_name': stem.replace('_', ' ').strip().title(),
+        'allowed_filename': stem.lower(),
+        'columns': columns,
+        'profile': {'filename': os.path.basename(filepath), 'rows': row_count, 'columns': stats},
+    }
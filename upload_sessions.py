@@ -0,0 +1,261 @@
+"""
+Chunked, resumable uploads.
+
+An upload session is created with the file name, total size and optionally
+its SHA-256; it gets a batch id and a workspace <upload folder>/_upload_<id>/
+holding a preallocated <filename>.part and a manifest (upload.json) with the
+byte ranges received so far and the import options. Chunks are PUT with a
+Content-Range header and written in place, in any order; re-sending a range
+is harmless. Because the state lives on disk, an interrupted client asks
+for the missing ranges and continues, even across app restarts. Finalize
+checks that every byte arrived, hashes the file and compares the checksum,
+then renames it to <filename> for the regular validation/import pipeline.
+
+Unfinished workspaces older than UPLOAD_SESSION_TTL_HOURS are removed when
+the next session is created.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+import config
+import data_manager
+
+MANIFEST = 'upload.json'
+WORKSPACE_PREFIX = '_upload_'
+ALLOWED_EXTENSIONS = ('.csv', '.txt', '.zip')
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock(upload_id):
+    with _locks_lock:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+
+def workspace_path(folder, upload_id):
+    return os.path.join(folder, f"{WORKSPACE_PREFIX}{upload_id}")
+
+
+def _read_manifest(folder, upload_id):
+    try:
+        uuid.UUID(upload_id)
+    except (ValueError, TypeError):
+        return None
+    try:
+        with open(os.path.join(workspace_path(folder, upload_id), MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(folder, manifest):
+    path = os.path.join(workspace_path(folder, manifest['upload_id']), MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _add_range(ranges, start, stop):
+    """Merges [start, stop) into a sorted list of disjoint [start, stop) ranges."""
+    merged = []
+    for low, high in sorted(ranges + [[start, stop]]):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def _missing_ranges(ranges, size):
+    missing, offset = [], 0
+    for low, high in ranges:
+        if low > offset:
+            missing.append([offset, low])
+        offset = max(offset, high)
+    if offset < size:
+        missing.append([offset, size])
+    return missing
+
+
+def describe(manifest):
+    """Public view of an upload session: progress and the byte ranges still missing."""
+    received = sum(high - low for low, high in manifest['ranges'])
+    missing = _missing_ranges(manifest['ranges'], manifest['size'])
+    return {
+        'upload_id': manifest['upload_id'],
+        'batch_id': manifest['upload_id'],
+        'filename': manifest['filename'],
+        'size': manifest['size'],
+        'received_bytes': received,
+        'missing_ranges': missing[:100],
+        'next_offset': missing[0][0] if missing else None,
+        'complete': not missing,
+        'status': manifest['status'],
+        'chunk_size': config.UPLOAD_CHUNK_BYTES,
+        'created_at': manifest['created_at'],
+    }
+
+
+def purge_stale_uploads(folder, max_age_hours=None):
+    """Removes upload workspaces not touched for max_age_hours. Returns how many were removed."""
+    max_age = (max_age_hours if max_age_hours is not None else config.UPLOAD_SESSION_TTL_HOURS) * 3600
+    if max_age <= 0:
+        return 0
+    removed = 0
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if not name.startswith(WORKSPACE_PREFIX) or not os.path.isdir(path):
+            continue
+        manifest_path = os.path.join(path, MANIFEST)
+        touched = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else path)
+        if now - touched > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def create_upload(folder, filename, size, checksum=None, options=None, user_id=None):
+    """
+    Starts an upload session and preallocates the file.
+    `options` are the /api/import form fields (mode, table_name, dist_id,
+    priority, profile, force) applied on finalize.
+    Returns (True, session) or (False, error message).
+    """
+    filename = secure_filename(filename or '')
+    if not filename or os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        return False, "filename must be a .csv, .txt or .zip file."
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return False, "size must be the file size in bytes."
+    if size <= 0:
+        return False, "size must be the file size in bytes."
+    checksum = (checksum or '').strip().lower() or None
+    if checksum and not _SHA256_RE.match(checksum):
+        return False, "checksum must be a SHA-256 hex digest."
+
+    purge_stale_uploads(folder)
+    upload_id = str(uuid.uuid4())
+    workspace = workspace_path(folder, upload_id)
+    os.makedirs(workspace)
+    # Sparse preallocation: chunks are written in place at their offset
+    with open(os.path.join(workspace, filename + '.part'), 'wb') as f:
+        f.truncate(size)
+    manifest = {
+        'upload_id': upload_id, 'filename': filename, 'size': size, 'checksum': checksum,
+        'options': options or {}, 'user_id': user_id, 'ranges': [], 'status': 'receiving',
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _write_manifest(folder, manifest)
+    return True, describe(manifest)
+
+
+def get_upload(folder, upload_id):
+    """Session view of an upload, or None."""
+    manifest = _read_manifest(folder, upload_id)
+    return describe(manifest) if manifest else None
+
+
+def write_chunk(folder, upload_id, start, stop, total, stream):
+    """
+    Writes bytes [start, stop) read from `stream` into the upload file.
+    Returns (True, session), (False, error message) or (None, error message)
+    when the upload does not exist.
+    """
+    with _lock(upload_id):
+        manifest = _read_manifest(folder, upload_id)
+        if not manifest:
+            return None, "Upload not found."
+        if manifest['status'] != 'receiving':
+            return False, f"Upload is already {manifest['status']}."
+        if total is not None and total != manifest['size']:
+            return False, f"Content-Range total {total} does not match the upload size {manifest['size']}."
+        if start < 0 or stop > manifest['size'] or start >= stop:
+            return False, f"Range {start}-{stop - 1} is outside the upload (size {manifest['size']})."
+
+        expected = stop - start
+        written = 0
+        path = os.path.join(workspace_path(folder, upload_id), manifest['filename'] + '.part')
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            while written < expected:
+                block = stream.read(min(data_manager.UPLOAD_BLOCK_BYTES, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        if written != expected:
+            # Only the bytes that arrived are kept; the client re-sends the rest
+            if written:
+                manifest['ranges'] = _add_range(manifest['ranges'], start, start + written)
+                _write_manifest(folder, manifest)
+            return False, f"Chunk truncated: expected {expected} bytes, received {written}."
+
+        manifest['ranges'] = _add_range(manifest['ranges'], start, stop)
+        _write_manifest(folder, manifest)
+        return True, describe(manifest)
+
+
+def finalize_upload(folder, upload_id, checksum=None):
+    """
+    Verifies an upload is complete and matches its SHA-256, then moves it to
+    its final name in the workspace. On a checksum mismatch all ranges are
+    dropped so the client re-sends the file.
+    Returns (True, {"path", "file_hash", "workspace", "manifest"}),
+    (False, error message) or (None, error message) when it does not exist.
+    """
+    with _lock(upload_id):
+        manifest = _read_manifest(folder, upload_id)
+        if not manifest:
+            return None, "Upload not found."
+        if manifest['status'] != 'receiving':
+            return False, f"Upload is already {manifest['status']}."
+        missing = _missing_ranges(manifest['ranges'], manifest['size'])
+        if missing:
+            return False, f"Upload incomplete: {len(missing)} byte range(s) missing, first at offset {missing[0][0]}."
+
+        workspace = workspace_path(folder, upload_id)
+        part = os.path.join(workspace, manifest['filename'] + '.part')
+        digest = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(data_manager.UPLOAD_BLOCK_BYTES), b''):
+                digest.update(block)
+        file_hash = digest.hexdigest()
+
+        expected = (checksum or '').strip().lower() or manifest['checksum']
+        if expected and file_hash != expected:
+            manifest['ranges'] = []
+            _write_manifest(folder, manifest)
+            return False, f"Checksum mismatch: expected {expected}, got {file_hash}. Upload the file again."
+
+        path = os.path.join(workspace, manifest['filename'])
+        os.replace(part, path)
+        manifest['status'] = 'finalized'
+        manifest['file_hash'] = file_hash
+        _write_manifest(folder, manifest)
+    with _locks_lock:
+        _locks.pop(upload_id, None)
+    return True, {'path': path, 'file_hash': file_hash, 'workspace': workspace, 'manifest': manifest}
+
+
+def abort_upload(folder, upload_id):
+    """Deletes an unfinished upload and its workspace. Returns False when it does not exist."""
+    with _lock(upload_id):
+        manifest = _read_manifest(folder, upload_id)
+        if not manifest:
+            return False
+        shutil.rmtree(workspace_path(folder, upload_id), ignore_errors=True)
+    with _locks_lock:
+        _locks.pop(upload_id, None)
+    return True